@@ -2,128 +2,72 @@
 """
 Langfuse Pattern Analyzer - Pull tagged traces and identify optimization opportunities
 """
-import os
 from dotenv import load_dotenv
-from langfuse import Langfuse
+from langfuse_sync import open_synced_store
+from trace_analytics import tag_distribution, tag_examples as stored_tag_examples
 from collections import Counter
-import json
 
 def analyze_langfuse_patterns():
     """Analyze tagged traces from Langfuse to identify prompt optimization opportunities"""
     load_dotenv()
 
-    # Initialize Langfuse client
-    langfuse = Langfuse(
-        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-        secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-        host=os.getenv("LANGFUSE_HOST")
-    )
-
     print("🔍 Fetching traces from Langfuse...")
 
-    # Get all traces using the API client
+    # Every page, synced into a local indexed store - later runs only download traces newer than the last sync
     try:
-        # Method 1: Try the correct API endpoint
-        traces_response = langfuse.api.trace.list()
-        trace_list = traces_response.data if hasattr(traces_response, 'data') else []
-        print(f"✅ Successfully fetched traces via API")
+        store = open_synced_store()
     except Exception as e:
-        print(f"Method 1 failed: {e}")
-        try:
-            # Method 2: Try direct traces access
-            traces_response = langfuse.api.traces.list()
-            trace_list = traces_response.data if hasattr(traces_response, 'data') else []
-            print(f"✅ Successfully fetched traces via traces.list()")
-        except Exception as e2:
-            print(f"Method 2 failed: {e2}")
-            try:
-                # Method 3: Check the API structure
-                print("Available API methods:")
-                api_methods = [method for method in dir(langfuse.api) if not method.startswith('_')]
-                for method in api_methods:
-                    print(f"  - langfuse.api.{method}")
-
-                # Try to find the correct traces endpoint
-                if hasattr(langfuse.api, 'trace'):
-                    trace_api = langfuse.api.trace
-                    trace_methods = [method for method in dir(trace_api) if not method.startswith('_')]
-                    print(f"\nTrace API methods:")
-                    for method in trace_methods:
-                        print(f"  - langfuse.api.trace.{method}")
-
-                trace_list = []
-                print("⚠️  Could not fetch traces. Please check API documentation.")
-            except Exception as e3:
-                print(f"Method 3 failed: {e3}")
-                trace_list = []
-
-    print(f"📊 Found {len(trace_list)} traces")
+        print(f"Trace sync failed: {e}")
+        return {'tag_counts': Counter(), 'tag_examples': {}, 'recommendations': []}
+
+    print(f"📊 Found {store.count()} traces")
 
     # Debug: Print first trace structure and content
-    if trace_list:
+    first_trace = next(iter(store.load_traces(limit=1)), None)
+    if first_trace:
         print(f"\n🔍 First trace structure:")
-        first_trace = trace_list[0]
-        if hasattr(first_trace, '__dict__'):
-            print(f"Trace attributes: {list(first_trace.__dict__.keys())}")
-        elif isinstance(first_trace, dict):
-            print(f"Trace keys: {list(first_trace.keys())}")
-        else:
-            print(f"Trace methods: {[attr for attr in dir(first_trace) if not attr.startswith('_')]}")
+        print(f"Trace attributes: {list(first_trace.__dict__.keys())}")
 
         # Debug: Show actual input content structure
-        if hasattr(first_trace, 'input') and first_trace.input:
+        if first_trace.input:
             print(f"\n🔍 Sample input content (first 1000 chars):")
             input_sample = str(first_trace.input)[:1000]
             print(f"'{input_sample}...'")
 
         # Debug: Show actual output content structure
-        if hasattr(first_trace, 'output') and first_trace.output:
+        if first_trace.output:
             print(f"\n🔍 Sample output content (first 500 chars):")
             output_sample = str(first_trace.output)[:500]
             print(f"'{output_sample}...'")
 
         # Debug: Show tags
-        if hasattr(first_trace, 'tags') and first_trace.tags:
+        if first_trace.tags:
             print(f"\n🔍 Sample tags: {first_trace.tags}")
 
         print(f"\n{'-'*60}")
 
-    # Analyze tags
-    all_tags = []
+    # Tag counts come from the tag index; examples are only loaded for the tags we print
+    tag_counts = Counter(dict(tag_distribution(store)))
     tag_examples = {}
-
-    for trace in trace_list:
-        # Get tags from trace - TraceWithDetails objects have direct attributes
-        if hasattr(trace, 'tags') and trace.tags:
-            all_tags.extend(trace.tags)
-            for tag in trace.tags:
-                if tag not in tag_examples:
-                    tag_examples[tag] = []
-
-                # Get trace attributes directly
-                trace_id = getattr(trace, 'id', 'unknown')
-                trace_input = getattr(trace, 'input', None)
-                trace_output = getattr(trace, 'output', None)
-
-                # Safely truncate strings
-                input_text = str(trace_input)[:100] if trace_input else None
-                output_text = str(trace_output)[:100] if trace_output else None
-
-                # Try to extract actual content from input or output
-                extracted_content = extract_content_from_input(trace_input)
-                if extracted_content == str(trace_input)[:100] + "...":
-                    # If input extraction failed, try output
-                    extracted_content = extract_content_from_output(trace_output)
-
-                tag_examples[tag].append({
-                    'trace_id': trace_id,
-                    'input': input_text,
-                    'output': output_text,
-                    'extracted_content': extracted_content
-                })
-
-    # Count tag frequency
-    tag_counts = Counter(all_tags)
+    for tag in tag_counts:
+        tag_examples[tag] = []
+        for trace in stored_tag_examples(store, tag, limit=2):
+            trace_input = trace.get('input')
+            trace_output = trace.get('output')
+
+            # Try to extract actual content from input or output
+            extracted_content = extract_content_from_input(trace_input)
+            if extracted_content == str(trace_input)[:100] + "...":
+                # If input extraction failed, try output
+                extracted_content = extract_content_from_output(trace_output)
+
+            tag_examples[tag].append({
+                'trace_id': trace['id'],
+                'input': str(trace_input)[:100] if trace_input else None,
+                'output': str(trace_output)[:100] if trace_output else None,
+                'extracted_content': extracted_content
+            })
+    store.close()
 
     print(f"\n{'='*60}")
     print("TAG FREQUENCY ANALYSIS")
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite - Ops/sec and allocations for the CPU-side hot paths
+Runs routing, prompt construction, response parsing and Langfuse input extraction over
+synthetic corpora (10k-1M items) and saves the results as JSON keyed by git commit, so a
+later run can be compared against them and per-request regressions show up.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from fake_verdicts import fake_moderation_response
+from near_duplicate import campaign_messages
+
+RESULTS_DIR = "benchmark_results"
+DEFAULT_SIZES = [10_000, 100_000]
+POOL_SIZE = 20_000         # larger corpora cycle through this many distinct items
+ALLOCATION_SAMPLE = 2_000  # items measured under tracemalloc (it slows everything down ~5x)
+REGRESSION_TOLERANCE = 0.20  # run-to-run noise on a shared machine is ~10%
+
+
+def message_corpus(size, seed=0):
+    """Dating app messages: ordinary chat, templated scams and critical content, mostly distinct"""
+    with open("evaluation_dataset.json", "r") as file:
+        ordinary_messages = [case["content"] for case in json.load(file)]
+    ordinary_messages += ["Send me $500 on cash app and I'll visit you", "I want to kill myself",
+                          "You people are disgusting, go back to your own country", "What's your number? 555-123-4567"]
+    rng = random.Random(seed)
+    messages = campaign_messages(rng, size, ordinary_messages)
+    return [f"{message} {rng.randint(1, 10**6)}" if rng.random() < 0.5 else message for message in messages]
+
+
+def response_corpus(size, seed=0):
+    """Model responses with the formatting quirks we see: verdict-first, bold keys, "/10" scores, no USER VIEW"""
+    rng = random.Random(seed)
+    pool = []
+    for message in message_corpus(min(size, POOL_SIZE), seed):
+        response = fake_moderation_response(message, verdict_first=rng.random() < 0.2)
+        roll = rng.random()
+        if roll < 0.3:
+            response = response.replace("Score: ", "**Score:** ").replace("Category: ", "**Category:** ")
+        elif roll < 0.4:
+            response = response.replace("Score: 2", "Score: 2/10")
+        elif roll < 0.45:
+            response = response.split("USER VIEW")[0]  # truncated before the verdict
+        pool.append(response)
+    return [pool[index % len(pool)] for index in range(size)]
+
+
+def langfuse_input_corpus(size, system_prompt, seed=0):
+    """Trace inputs as Langfuse stores them: message lists with the current prompt, or the old quoted prompt"""
+    rng = random.Random(seed)
+    pool = []
+    for message in message_corpus(min(size, POOL_SIZE), seed):
+        if rng.random() < 0.5:
+            trace_input = [{"role": "system", "content": system_prompt},
+                           {"role": "user", "content": f"Content to analyze: {message}"}]
+        else:
+            trace_input = [{"role": "user", "content": f'{system_prompt}\nContent to analyze: "{message}"'}]
+        pool.append(str(trace_input))
+    return [pool[index % len(pool)] for index in range(size)]
+
+
+def _benchmarks(moderator):
+    """name -> (function, corpus builder)"""
+    from analyze_langfuse_patterns import extract_content_from_input
+    from moderation_result import extract_user_view
+
+    return {
+        "detect_critical_content": (moderator.detect_critical_content, message_corpus),
+        "build_moderation_messages": (moderator._build_moderation_messages, message_corpus),
+        "parse_score_from_response": (moderator.parse_score_from_response, response_corpus),
+        "extract_user_view": (extract_user_view, response_corpus),
+        "extract_content_from_input": (extract_content_from_input,
+                                       lambda size: langfuse_input_corpus(size, moderator.system_prompts["general"])),
+    }
+
+
+def measure(function, corpus, repeat=3):
+    """Best-of-repeat ops/sec over the corpus, plus peak and retained memory over a sample"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in corpus:
+            function(item)
+        best = min(best, time.perf_counter() - start)
+
+    sample = corpus[:ALLOCATION_SAMPLE]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for item in sample:
+        function(item)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ops_per_sec": len(corpus) / best,
+        "us_per_op": best / len(corpus) * 1e6,
+        "peak_kib": (peak - before) / 1024,                     # largest transient footprint of one call
+        "retained_bytes_per_op": (after - before) / len(sample),  # memory kept after the call (caches, leaks)
+    }
+
+
+def git_commit():
+    """Short commit hash, with "-dirty" when the tree has uncommitted changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Print per-benchmark changes against a saved run; returns the names that got slower than tolerance"""
+    previous = {(entry["name"], entry["size"]): entry for entry in baseline["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline['commit']} ({baseline['created']}):")
+    for entry in results:
+        old = previous.get((entry["name"], entry["size"]))
+        if old is None:
+            continue
+        change = entry["ops_per_sec"] / old["ops_per_sec"] - 1
+        flag = ""
+        if change < -tolerance:
+            flag = "  <-- REGRESSION"
+            regressions.append(f"{entry['name']}@{entry['size']}")
+        print(f"  {entry['name']:28} {entry['size']:>9,} {change:+7.1%} ops/sec | "
+              f"retained {old['retained_bytes_per_op']:.0f} -> {entry['retained_bytes_per_op']:.0f} B/op{flag}")
+    return regressions
+
+
+def main():
+    """Run the suite, save the results and optionally compare them with an earlier run"""
+    parser = argparse.ArgumentParser(description="CPU hot path benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="corpus sizes (e.g. 10000 1000000)")
+    parser.add_argument("--only", nargs="+", help="benchmark names to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help=f"results file (default: {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="allowed ops/sec drop")
+    args = parser.parse_args()
+
+    from hinge_moderation_v2 import HingeAIModerator
+    from llm_backend import OfflineBackend
+
+    # Nothing here calls the model; the offline backend just avoids needing a key
+    moderator = HingeAIModerator(use_cache=False, backend=OfflineBackend())
+    benchmarks = _benchmarks(moderator)
+    names = args.only or list(benchmarks)
+
+    print("=" * 60)
+    print("CPU HOT PATH BENCHMARKS")
+    print("=" * 60)
+    print(f"{'benchmark':28} {'items':>9} {'ops/sec':>12} {'us/op':>8} {'peak KiB':>9} {'retained B/op':>14}")
+    results = []
+    for size in args.sizes:
+        corpora = {}
+        for name in names:
+            function, build_corpus = benchmarks[name]
+            corpus = corpora.get(build_corpus)
+            if corpus is None:
+                corpus = corpora[build_corpus] = build_corpus(size)
+            # The moderator logs every routing decision; send it nowhere rather than timing the terminal
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                entry = {"name": name, "size": size, **measure(function, corpus, args.repeat)}
+            results.append(entry)
+            print(f"{name:28} {size:>9,} {entry['ops_per_sec']:>12,.0f} {entry['us_per_op']:>8.2f} "
+                  f"{entry['peak_kib']:>9.1f} {entry['retained_bytes_per_op']:>14.1f}")
+
+    run = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    path = args.save or os.path.join(RESULTS_DIR, f"{run['commit']}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(run, file, indent=2)
+    print(f"\nSaved results to {path}")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
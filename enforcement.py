@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Enforcement - Progressive enforcement from the parsed verdict and the user's violation history
+The prompts used to ask the model to assume an offense count and work the AUTO-ACTION out
+of the four-tier ladder itself, which cost output tokens and gave different answers for
+the same case. Now the model returns a score and a category, and decide_action() applies
+the ladder deterministically against ViolationHistory - per-user offense counts in a dict,
+snapshotted to a JSON file in the background.
+"""
+import atexit
+import json
+import os
+import random
+import threading
+import time
+
+# What the prompts ask the model to put on the "Category:" line
+CATEGORIES = ("none", "harassment", "sexual", "hate_speech", "self_harm", "fraud", "threat", "doxxing", "illegal", "spam")
+IMMEDIATE_BAN_CATEGORIES = {"threat", "doxxing", "illegal"}  # extreme safety threats override the ladder...
+IMMEDIATE_BAN_SCORE = 9                                       # ...when the score says they're real
+CRISIS_MIN_SCORE = 5  # self-harm at or above this gets crisis intervention; self-harm is never removal or an offense
+
+NO_ACTION = "No action required"
+WARNING = "Warning only - This content violates our guidelines. Please review our community standards."
+REMOVAL_WARNING = "Content removal + educational warning"
+FORMAL_WARNING = "Formal warning - This is your second warning. Continued violations may result in account restrictions."
+REMOVAL_ESCALATING_WARNING = "Content removal + escalating warning"
+FINAL_WARNING = ("Content removal + temporary restriction - This is your 3rd and final warning. "
+                 "You will be banned if this behavior continues.")
+BAN = "Automatic ban (4th offense)"
+IMMEDIATE_BAN = "Immediate ban (extreme safety threat, illegal content or doxxing)"
+ALREADY_BANNED = "No action - account already banned"
+CRISIS_INTERVENTION = "Crisis intervention + mental health resources + specialist escalation (no content removal)"
+HUMAN_REVIEW = "Human review - no score in the verdict"
+
+# Offense number -> [(minimum score, action)], first match wins; scores below every minimum get NO_ACTION
+ENFORCEMENT_LADDER = {
+    1: [(9, REMOVAL_WARNING), (7, WARNING)],
+    2: [(7, REMOVAL_ESCALATING_WARNING), (4, FORMAL_WARNING)],
+    3: [(3, FINAL_WARNING)],
+    4: [(3, BAN)],  # fourth and later offenses
+}
+SNAPSHOT_INTERVAL = 30.0  # seconds between background snapshots (only written when something changed)
+
+
+def decide_action(score, category, prior_offenses, banned=False):
+    """Apply the progressive enforcement rules; returns (action, offense_level, counts_as_offense)"""
+    offense_level = min(prior_offenses + 1, max(ENFORCEMENT_LADDER))
+    if banned:
+        return ALREADY_BANNED, offense_level, False
+    if score is None:
+        return HUMAN_REVIEW, offense_level, False
+    if category == "self_harm":  # support, not punishment - lower scores get no action rather than the ladder
+        return (CRISIS_INTERVENTION if score >= CRISIS_MIN_SCORE else NO_ACTION), offense_level, False
+    if category in IMMEDIATE_BAN_CATEGORIES and score >= IMMEDIATE_BAN_SCORE:
+        return IMMEDIATE_BAN, offense_level, True
+    for min_score, action in ENFORCEMENT_LADDER[offense_level]:
+        if score >= min_score:
+            return action, offense_level, True
+    return NO_ACTION, offense_level, False
+
+
+class ViolationHistory:
+    """Per-user offense counts in memory (O(1) lookups), snapshotted to JSON every snapshot_interval seconds
+
+    A crash loses at most one interval of offenses, which only makes the next action milder.
+    snapshot_path=None keeps everything in memory.
+    """
+
+    def __init__(self, snapshot_path=None, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self._users = {}  # user_id -> [offenses, last_offense_at, banned]
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()  # one writer at a time, so an older copy never replaces a newer one
+        self._changes = 0  # offenses recorded since the last snapshot
+        self.stats = {"lookups": 0, "offenses": 0, "bans": 0, "snapshots": 0}
+        if snapshot_path and os.path.exists(snapshot_path):
+            with open(snapshot_path, "r") as file:
+                self._users = {user_id: list(entry) for user_id, entry in json.load(file).items()}
+
+        self._stop = threading.Event()
+        self._thread = None
+        if snapshot_path and snapshot_interval:
+            self._thread = threading.Thread(target=self._snapshot_loop, args=(snapshot_interval,), daemon=True)
+            self._thread.start()
+            atexit.register(self.close)  # the thread is a daemon, so the last interval would be lost at exit
+
+    def offenses(self, user_id):
+        """How many offenses the user has on record"""
+        entry = self._users.get(user_id)
+        return entry[0] if entry else 0
+
+    def enforce(self, user_id, score, category):
+        """Decide the action for a verdict and record it if it's an offense; returns a decision dict
+
+        user_id=None (demo and evaluation runs) is treated as a first offense and never recorded.
+        """
+        with self._lock:  # lookup and update together, so two messages from one user can't both be a "1st offense"
+            self.stats["lookups"] += 1
+            entry = self._users.get(user_id) if user_id is not None else None
+            prior_offenses, banned = (entry[0], entry[2]) if entry else (0, False)
+            action, offense_level, counts_as_offense = decide_action(score, category, prior_offenses, banned)
+            if counts_as_offense and user_id is not None:
+                if entry is None:
+                    entry = self._users[user_id] = [0, 0.0, False]
+                entry[0] += 1
+                entry[1] = time.time()
+                entry[2] = action in (BAN, IMMEDIATE_BAN)
+                self.stats["offenses"] += 1
+                self.stats["bans"] += entry[2]
+                self._changes += 1
+        return {"action": action, "offense_level": offense_level, "offense": counts_as_offense,
+                "prior_offenses": prior_offenses}
+
+    def snapshot(self):
+        """Write the history to snapshot_path (atomically) if anything changed; returns True if it wrote"""
+        if not self.snapshot_path:
+            return False
+        with self._snapshot_lock:
+            with self._lock:  # enforce() only waits for the copy, never for the disk
+                changes = self._changes
+                if not changes:
+                    return False
+                users = {user_id: tuple(entry) for user_id, entry in self._users.items()}
+            temporary_path = f"{self.snapshot_path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(users, file, separators=(",", ":"))
+            os.replace(temporary_path, self.snapshot_path)  # readers never see a half-written file
+            with self._lock:
+                # Only what this copy covered - a failed write leaves the count for the next attempt
+                self._changes -= changes
+                self.stats["snapshots"] += 1
+        return True
+
+    def _snapshot_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.snapshot()
+
+    def summary(self):
+        with self._lock:
+            return {**self.stats, "users": len(self._users)}
+
+    def close(self):
+        """Stop the background snapshots and write a final one (safe to call more than once)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            atexit.unregister(self.close)
+        self.snapshot()
+
+
+def main():
+    """Replay verdict streams for many users through the ladder, then time lookups and snapshots"""
+    import tempfile
+
+    rng = random.Random(0)
+    user_count, verdict_count = 200_000, 1_000_000
+    verdicts = []
+    for _ in range(verdict_count):
+        # Most verdicts are benign; a small cohort of repeat offenders sends a lot of the rest
+        repeat_offender = rng.random() < 0.1
+        user_id = f"user-{rng.randrange(user_count // 100 if repeat_offender else user_count)}"
+        weights = [5, 5, 10, 10, 10, 10, 20, 15, 10, 5] if repeat_offender else [50, 30, 6, 4, 3, 2, 2, 1, 1, 1]
+        score = rng.choices(range(1, 11), weights)[0]
+        category = "none" if score < 4 else rng.choice(["harassment", "sexual", "fraud", "hate_speech", "spam",
+                                                        "self_harm", "threat"])
+        verdicts.append((user_id, score, category))
+
+    with tempfile.TemporaryDirectory() as directory:
+        history = ViolationHistory(os.path.join(directory, "violation_history.json"), snapshot_interval=0.5)
+        actions = {}
+        start = time.perf_counter()
+        for user_id, score, category in verdicts:
+            action = history.enforce(user_id, score, category)["action"]
+            actions[action] = actions.get(action, 0) + 1
+        enforce_us = (time.perf_counter() - start) / len(verdicts) * 1e6
+
+        start = time.perf_counter()
+        with history._lock:
+            history._changes += 1  # force a write even if the background thread just took one
+        history.snapshot()
+        snapshot_ms = (time.perf_counter() - start) * 1e3
+        size = os.path.getsize(history.snapshot_path)
+        history.close()
+        reloaded = ViolationHistory(history.snapshot_path, snapshot_interval=0)
+
+        print("=" * 60)
+        print(f"PROGRESSIVE ENFORCEMENT ({verdict_count:,} verdicts)")
+        print("=" * 60)
+        for action, count in sorted(actions.items(), key=lambda item: -item[1]):
+            print(f"{count:>9,}  {action}")
+        summary = history.summary()
+        print(f"\nUsers with offenses: {summary['users']:,} | offenses {summary['offenses']:,} | bans {summary['bans']:,}")
+        print(f"enforce(): {enforce_us:.2f} us per verdict (lookup + decision + record)")
+        print(f"Snapshot: {snapshot_ms:.0f} ms, {size / 2**20:.1f} MiB; background snapshots taken: {summary['snapshots']}")
+        print(f"Reloaded {reloaded.summary()['users']:,} users from the snapshot")
+
+    print("\nLadder examples (score, category, prior offenses -> action):")
+    for score, category, prior_offenses in [(8, "harassment", 0), (5, "harassment", 1), (4, "sexual", 2),
+                                            (3, "spam", 3), (10, "threat", 0), (9, "self_harm", 2), (4, "self_harm", 3)]:
+        action, offense_level, _ = decide_action(score, category, prior_offenses)
+        print(f"  {score:>2} {category:11} {prior_offenses} -> offense {offense_level}: {action}")
+
+if __name__ == "__main__":
+    main()
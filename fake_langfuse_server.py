@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Fake Langfuse Server - Local stand-in for the Langfuse public traces API
+Serves GET /api/public/traces over synthetic moderation traces with the same paging,
+timestamp filters and ordering as the real API, so the trace sync can be tested at
+100k+ traces without a Langfuse project.
+"""
+import base64
+import bisect
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from langfuse_sync import format_timestamp
+
+MAX_PAGE_SIZE = 100  # the real API caps limit at 100
+
+TAGS = ["accurate_appropriate", "accurate_violation", "accurate_borderline", "fp_severity_inflation",
+        "fp_dating_context", "fp_cultural_context", "fn_missed_scam", "fn_missed_harassment"]
+TAG_WEIGHTS = [40, 25, 10, 8, 6, 3, 5, 3]
+
+
+def synthetic_traces(count, start=None, seed=0, interval_seconds=30.0):
+    """Moderation traces in Langfuse's JSON shape, oldest first, about interval_seconds apart"""
+    from fake_verdicts import fake_moderation_response
+
+    with open("evaluation_dataset.json", "r") as file:
+        messages = [case["content"] for case in json.load(file)]
+    rng = random.Random(seed)
+    moment = start or datetime(2025, 9, 1, tzinfo=timezone.utc)
+    traces = []
+    for _ in range(count):
+        moment += timedelta(seconds=rng.expovariate(1 / interval_seconds))
+        message = rng.choice(messages)
+        tags = rng.choices(TAGS, TAG_WEIGHTS) if rng.random() < 0.7 else []
+        scores = []
+        if rng.random() < 0.4:
+            scores.append({"id": f"score-{rng.getrandbits(48):012x}", "name": "reviewer_agreement",
+                           "value": float(rng.random() < 0.8), "dataType": "NUMERIC"})
+        traces.append({
+            "id": f"trace-{rng.getrandbits(64):016x}",
+            "timestamp": format_timestamp(moment),
+            "name": "moderate_content",
+            "input": [{"role": "user", "content": f"Content to analyze: {message}"}],
+            "output": fake_moderation_response(message)[-300:],
+            "tags": tags,
+            "scores": scores,
+            "latency": round(rng.lognormvariate(0, 0.4) * 2.5, 3),
+            "totalCost": round(rng.uniform(0.01, 0.05), 5),
+        })
+    return traces
+
+
+class FakeLangfuseHandler(BaseHTTPRequestHandler):
+    """Handles GET /api/public/traces with page, limit, fromTimestamp, toTimestamp and orderBy"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/api/public/traces":
+            self._send_json(404, {"message": f"Unknown path {url.path}"})
+            return
+        expected = "Basic " + base64.b64encode(f"{server.public_key}:{server.secret_key}".encode()).decode()
+        if self.headers.get("Authorization") != expected:
+            self._send_json(401, {"message": "Invalid credentials"})
+            return
+
+        time.sleep(server.latency)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        page = max(1, int(query.get("page", 1)))
+        limit = min(MAX_PAGE_SIZE, max(1, int(query.get("limit", 50))))
+
+        with server.lock:
+            server.requests += 1
+            low = bisect.bisect_left(server.timestamps, query["fromTimestamp"]) if "fromTimestamp" in query else 0
+            high = bisect.bisect_left(server.timestamps, query["toTimestamp"]) if "toTimestamp" in query else len(server.traces)
+            matching = server.traces[low:high]
+        if query.get("orderBy", "timestamp.desc") == "timestamp.desc":
+            matching = matching[::-1]
+        data = matching[(page - 1) * limit:page * limit]
+        self._send_json(200, {"data": data, "meta": {"page": page, "limit": limit, "totalItems": len(matching),
+                                                     "totalPages": (len(matching) + limit - 1) // limit}})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_fake_langfuse(traces, port=0, latency=0.02, public_key="pk-lf-fake", secret_key="sk-lf-fake"):
+    """Start the fake API on a background thread; returns (server, host)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeLangfuseHandler)
+    server.daemon_threads = True
+    server.latency = latency  # seconds per page request
+    server.public_key, server.secret_key = public_key, secret_key
+    server.lock = threading.Lock()
+    server.traces = sorted(traces, key=lambda trace: trace["timestamp"])
+    server.timestamps = [trace["timestamp"] for trace in server.traces]
+    server.requests = 0
+
+    def add_traces(new_traces):
+        with server.lock:
+            server.traces = sorted(server.traces + list(new_traces), key=lambda trace: trace["timestamp"])
+            server.timestamps = [trace["timestamp"] for trace in server.traces]
+
+    server.add_traces = add_traces
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
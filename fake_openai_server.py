@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI Server - Local stand-in for the chat completions endpoint
+Returns format-compliant moderation responses after a configurable delay so we can
+measure throughput without spending API credits.
+"""
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_verdicts import (extract_content, fake_assistant_message, fake_completion_text, fake_verdict_object,
+                           forced_tool_name, prompt_text, truncate_completion)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Handles POST /v1/chat/completions like the real API, including streamed responses"""
+    protocol_version = "HTTP/1.1"  # keep-alive so clients can reuse connections
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output readable
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        server = self.server
+        time.sleep(max(0.0, random.gauss(server.latency, server.latency * server.jitter)))
+
+        # Fault injection: answer a fraction of requests with a rate limit or server error
+        if random.random() < server.error_rate:
+            self._send_json(server.error_status, {"error": {"message": "Injected fault", "type": "fake_fault"}},
+                            headers={"Retry-After": "0.1"} if server.error_status == 429 else None)
+            return
+
+        prompt = prompt_text(request.get("messages", []))
+        tool_name = forced_tool_name(request)
+        if tool_name is not None:
+            text = fake_verdict_object(extract_content(prompt))
+        else:
+            text = fake_completion_text(prompt, batch_drop_rate=server.batch_drop_rate)
+        text, finish_reason = truncate_completion(text, request.get("max_tokens"))
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(text) // 4
+
+        if request.get("stream"):
+            self._stream_text(request, text, prompt_tokens, completion_tokens)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-fake-{random.getrandbits(48):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4"),
+            "choices": [{
+                "index": 0,
+                "message": fake_assistant_message(text, tool_name),
+                "finish_reason": finish_reason,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _stream_text(self, request, text, prompt_tokens, completion_tokens):
+        """Send the completion as server-sent events, ~4 characters per token"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-fake-{random.getrandbits(48):x}"
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "gpt-4")}
+        try:
+            for start in range(0, len(text), 4):
+                chunk = dict(base, choices=[{"index": 0, "delta": {"content": text[start:start + 4]}, "finish_reason": None}])
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self.server.token_delay)
+            final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                usage = dict(base, choices=[], usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                                       "total_tokens": prompt_tokens + completion_tokens})
+                self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client cancelled the stream early
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_fake_server(port=0, latency=0.5, jitter=0.2, token_delay=0.01, batch_drop_rate=0.0,
+                      error_rate=0.0, error_status=429):
+    """Start the fake server on a background thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.latency = latency  # mean seconds per request
+    server.jitter = jitter    # standard deviation as a fraction of the mean
+    server.token_delay = token_delay  # seconds between streamed tokens
+    server.batch_drop_rate = batch_drop_rate  # fraction of packed-request entries left out of the JSON array
+    server.error_rate = error_rate  # fraction of requests answered with error_status instead of a completion
+    server.error_status = error_status
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    """Compare the sequential moderate_content loop against moderate_batch"""
+    server, base_url = start_fake_server(latency=0.5)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    from hinge_moderation_v2 import HingeAIModerator
+
+    with open("evaluation_dataset.json", "r") as file:
+        contents = [case["content"] for case in json.load(file)]
+
+    moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None)  # measure real round-trips only
+
+    start = time.perf_counter()
+    for content in contents:
+        moderator.moderate_content(content)
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = moderator.moderate_batch(contents, max_concurrency=10)
+    batch_seconds = time.perf_counter() - start
+    errors = sum(1 for result in results if result["error"])
+
+    print(f"\n{'='*60}")
+    print("BATCH THROUGHPUT (fake server, 0.5s mean latency)")
+    print(f"{'='*60}")
+    print(f"Sequential loop: {len(contents) / sequential_seconds:.2f} items/s ({sequential_seconds:.1f}s)")
+    print(f"moderate_batch:  {len(contents) / batch_seconds:.2f} items/s ({batch_seconds:.1f}s, {errors} errors)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
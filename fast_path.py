@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Fast Path - Opt-in local pre-LLM stage that auto-approves bare greetings
+A keyword list can't tell "going to end it all" or "you should drink bleach" from small
+talk, so the fast path only approves messages that are nothing but a short greeting or
+pleasantry ("Hi!", "Good morning :)") - no other words, so no imperatives, no second-person
+verbs and nothing for the critical router or the risk patterns to miss. Everything else
+goes to the LLM. The rule is a yes/no decision, not a confidence score, so the stage is a
+plain on/off switch (HingeAIModerator(fast_path=True)). Coverage and false negatives are
+reported on evaluation_dataset.json and on fast_path_holdout.json.
+"""
+import argparse
+import json
+import re
+
+from keyword_router import KeywordMatcher, CRITICAL_KEYWORDS
+
+FAST_PATH_SCORE = 2  # "clearly fine" band - anything that could deserve a 3+ is left to the LLM
+MAX_GREETING_WORDS = 4
+DATASETS = ("evaluation_dataset.json", "fast_path_holdout.json")
+# The only words an approved message may contain
+GREETING_WORDS = {
+    "hi", "hey", "hello", "hiya", "heya", "howdy", "yo", "there", "good", "morning", "afternoon", "evening",
+    "thanks", "thank", "cheers", "haha", "hehe", "lol",
+}
+
+# Anything here means the message needs the LLM's judgement, even if it's probably fine
+RISK_PATTERNS = {
+    "sexual": r"\b(sexy|sex|nudes?|naked|hook ?ups?|horny|hot|body|bed|kinky)\b",
+    "contact_or_location": r"\b(number|phone|address|where you (live|work)|snap(chat)?|insta(gram)?|whatsapp|telegram|e-?mail|looked you up|find you|pick you up)\b",
+    "pressure": r"\b(why (haven't|havent|won't|wont|didn't|didnt) you|ignoring me|answer me|respond|reply|keep messaging|or else|you better|you owe)\b",
+    "insult_or_profanity": r"\b(fuck\w*|shit\w*|bitch\w*|ugly|stupid|idiot|dumb|loser|whore|slut|fat)\b|\w\*+",
+    "money": r"[$€£]|\b(money|paid|pay|cash|crypto|bitcoin|gift ?card|\d+k)\b",
+    "photos": r"\b(photos?|pics?|pictures?|selfies?|video)\b",
+    "discrimination": r"\b(your type|your kind|you people|race|religion)\b",
+    "violence": r"\b(kill|hurt|hit|beat|punch|gun|knife|die|dead)\b",
+    "links": r"https?://|www\.|\.com\b|@\w",
+    "digits": r"\d{3,}",
+}
+RISK_PATTERN = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in RISK_PATTERNS.items()), re.IGNORECASE)
+
+
+def risk_signals(content):
+    """Sorted names of the RISK_PATTERNS found in a message"""
+    return sorted({match.lastgroup for match in RISK_PATTERN.finditer(content)})
+
+
+class BenignFastPath:
+    """Decides whether a message is a bare greeting, without calling the LLM"""
+
+    def __init__(self, keyword_matcher=None):
+        self.keyword_matcher = keyword_matcher or KeywordMatcher(CRITICAL_KEYWORDS)
+
+    def assess(self, content):
+        """Return (approved, the signal that decided it)"""
+        critical_hits = self.keyword_matcher.scan(content)
+        if critical_hits:
+            return False, [f"critical:{category}" for category in critical_hits]
+
+        risks = risk_signals(content)
+        if risks:
+            return False, [f"risk:{risk}" for risk in risks]
+
+        stripped = content.strip()
+        if not stripped:
+            return False, ["empty"]
+        words = re.findall(r"[a-z']+", stripped.lower())
+        if not words or any(char.isdigit() for char in stripped):
+            return False, ["no_words" if not words else "digits"]
+        if len(words) > MAX_GREETING_WORDS:
+            return False, ["too_long"]
+        if set(words) - GREETING_WORDS:
+            return False, ["not_greeting_only"]
+        return True, ["greeting_only"]
+
+    def try_approve(self, content):
+        """Return a USER VIEW verdict if the message is a bare greeting, otherwise None"""
+        approved, _ = self.assess(content)
+        return create_fast_path_response() if approved else None
+
+
+def create_fast_path_response():
+    """Create a verdict in the same USER VIEW shape the LLM returns"""
+    return f"""STEP 5: Confidence and Escalation
+- Approved by local fast path (bare greeting)
+
+USER VIEW (for display to content creator):
+Score: {FAST_PATH_SCORE}
+Category: none
+Analysis: Greeting with no other content
+Policy Reference: Complies with Hinge Community Guidelines"""
+
+
+def fast_path_report(dataset_path="evaluation_dataset.json"):
+    """Run the fast path over a labelled dataset; returns coverage and false negatives
+
+    A false negative is a message the fast path approved whose expected score range excludes FAST_PATH_SCORE.
+    """
+    with open(dataset_path, "r") as file:
+        test_cases = json.load(file)
+
+    fast_path = BenignFastPath()
+    approved = []
+    false_negatives = []
+    for case in test_cases:
+        is_approved, signals = fast_path.assess(case["content"])
+        if not is_approved:
+            continue
+        approved.append(case)
+        expected_min, expected_max = case["expected_score_range"]
+        if not expected_min <= FAST_PATH_SCORE <= expected_max:
+            false_negatives.append({"content": case["content"], "expected_range": case["expected_score_range"],
+                                    "signals": signals})
+
+    total = len(test_cases)
+    return {
+        "dataset": dataset_path,
+        "total_cases": total,
+        "short_circuited": len(approved),
+        "short_circuit_rate": len(approved) / total if total else 0.0,
+        "false_negatives": false_negatives,
+        "false_negative_rate": len(false_negatives) / len(approved) if approved else 0.0,
+    }
+
+
+def main():
+    """Print fast path coverage and false negatives for the evaluation set and the held-out set"""
+    parser = argparse.ArgumentParser(description="Fast path coverage report")
+    parser.add_argument("--dataset", action="append",
+                        help=f"labelled dataset to report on (repeatable; default: {', '.join(DATASETS)})")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("FAST PATH REPORT")
+    print("=" * 60)
+    for dataset_path in args.dataset or DATASETS:
+        report = fast_path_report(dataset_path)
+        print(f"{dataset_path}: {report['short_circuited']}/{report['total_cases']} short-circuited "
+              f"({report['short_circuit_rate']:.0%}), {len(report['false_negatives'])} false negatives "
+              f"({report['false_negative_rate']:.0%} of approvals)")
+        for item in report["false_negatives"]:
+            print(f"  - \"{item['content'][:50]}\" (fast path: {FAST_PATH_SCORE}, expected: {item['expected_range']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,31 +5,161 @@ Business Problem: 57.5K daily reports, 12-23% appeal rates, $5M annual cost
 Solution: Chain of Thought AI with human-in-the-loop for high-risk cases
 """
 import os # for reading API keys from environment - reads API key from .env file
+import argparse # command line options for the demo
 import json # for handling structured data - formats responses
-import base64 # converts image to base64
-import re # for parsing scores from AI responses
-#from openai import OpenAI # for calling GPT
-from langfuse.openai import openai
+import asyncio # for the concurrent batch API
+import textwrap # strips the code indentation out of the prompt templates
+import time # for latency measurements
+import hashlib # for evaluation checkpoint ids
+import threading # guards the evaluation checkpoint file
+import logging # failures the operators need to see, separate from the demo's print output
+from concurrent.futures import ThreadPoolExecutor, as_completed # for parallel evaluation
+import openai # error types - clients come from the backend (Langfuse-traced when it's installed)
 # from datetime import datetime # for timestamps - tracks when decisions are made (currently unused)
 from dotenv import load_dotenv
+from keyword_router import KeywordMatcher, CRITICAL_KEYWORDS # single-pass critical content matcher
+from verdict_cache import VerdictCache, prompt_version # two-tier cache for repeat content
+from fast_path import BenignFastPath # opt-in local auto-approval for bare greetings
+from moderation_stream import StreamingVerdictParser # incremental USER VIEW parsing for streamed responses
+from moderation_result import parse_moderation_response # typed response parser, USER VIEW first
+from image_ingest import ingest_image, ImageRejectedError # validates and downsizes uploads before the vision call
+from image_hash import ImageHashIndex # near-duplicate and blocklist lookups for uploaded images
+from near_duplicate import NearDuplicateIndex, SIMILARITY_THRESHOLD # clusters templated scam/spam text
+from policy_index import PolicyIndex # policy files split into sections, retrieved per category
+from resilient_client import ResilientClient, AsyncResilientClient, CircuitBreaker, ProviderUnavailableError, limiter_from_env # quota, retries, breaker
+from llm_backend import backend_from_env # real OpenAI or the offline stand-in
+from metrics import MetricsRecorder, NULL_RECORDER, NULL_TIMER, percentile # per-stage spans, histograms and counters
+from micro_batch import MicroBatcher, MicroBatcherClosedError, create_batch_user_message, parse_batch_response, parse_verdict_object, batch_verdict_text # packs low-risk messages
+from enforcement import ViolationHistory, CATEGORIES # deterministic progressive enforcement per user
+from model_cascade import cascade_from_env, request_cost # gpt-4 by default; opt-in cheap-model-first cascade
+
+logger = logging.getLogger(__name__)
+
+TEXT_MODEL = "gpt-4" # tokenizer and A/B test model - text moderation models come from the cascade (model_cascade.json)
+IMAGE_MODEL = "gpt-4o" # vision model for image moderation
+
+#compact mode: the model fills in a small verdict through a forced function call instead of writing out every step
+COMPACT_MAX_TOKENS = 150 # a verdict is ~60 tokens; the cap stops a runaway answer from costing a full response
+BORDERLINE_SCORES = (4, 6) # compact verdicts in this band get the full reasoning before any action is taken
+ESCALATION_CONFIDENCE = 0.7 # below this the verdict goes to human review, so the reviewer gets the full reasoning
+VERDICT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "record_verdict",
+        "description": "Record the moderation verdict for the message",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "score": {"type": "integer", "minimum": 1, "maximum": 10},
+                "category": {"type": "string", "enum": list(CATEGORIES)},
+                "analysis": {"type": "string", "description": "one professional sentence"},
+                "policy_reference": {"type": "string", "description": "specific section, or Complies with Hinge Community Guidelines"},
+                "confidence": {"type": "integer", "minimum": 0, "maximum": 100},
+            },
+            "required": ["score", "category", "analysis", "policy_reference", "confidence"],
+        },
+    },
+}
+
+try:
+    import tiktoken # optional - exact token counts for the prompt report
+except ImportError:
+    tiktoken = None
+
+def count_tokens(text, model=TEXT_MODEL):
+    """Count tokens with tiktoken when installed, otherwise estimate ~4 characters per token"""
+    if tiktoken is not None:
+        return len(tiktoken.encoding_for_model(model).encode(text))
+    return len(text) // 4
+
 class HingeAIModerator: # this is our main AI moderator. 
     # a class is like a blueprint. It contains all the functions and data our moderator needs
 
     """AI Content Moderator for Hinge Dating App""" # description of our class
-    def __init__(self): # this runs when we create a new moderator
+    def __init__(self, use_cache=True, fast_path=False, near_duplicate_threshold=SIMILARITY_THRESHOLD, backend=None, collect_metrics=False, violation_history=None, compact=False, cascade=None): # this runs when we create a new moderator
             print ("Starting Hinge AI Moderator...") # welcome message
             load_dotenv()
-            self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            #per-stage latency histograms and outcome counters (collect_metrics=False makes every span a no-op)
+            self.metrics = MetricsRecorder() if collect_metrics else NULL_RECORDER
+            #backend=None picks OpenAI, or the offline stand-in when MODERATION_BACKEND=offline
+            self.backend = backend or backend_from_env()
+            #one RPM/TPM limiter and circuit breaker for every client - the provider limits the account, not the client
+            self.rate_limiter = limiter_from_env()
+            self.circuit_breaker = CircuitBreaker()
+            #retries happen in ResilientClient (with backoff and the breaker), so the backend's clients don't retry
+            self.client = ResilientClient(
+                self.backend.create_client(),
+                limiter=self.rate_limiter,
+                breaker=self.circuit_breaker
+            )
+            self.async_client = None # created on first use by the async batch API
+            self.micro_batcher = None # started by start_micro_batching()
+            self._async_client_loop = None
+            #compact=True asks for a structured verdict only; the full reasoning is generated for escalations and appeals
+            self.compact = compact
+            #which model answers first and when a verdict is re-asked of a larger one (cascade=None reads the config file)
+            self.cascade = cascade or cascade_from_env()
             
             #load Hinge guidelines once when moderator starts
             with open("hinge-principles.txt","r") as file:
                 self.principles = file.read()
             with open("hinge-terms-of-use.txt", "r") as file:
                 self.terms = file.read()
+
+            #split the policy files into indexed sections once - each prompt only carries the
+            #sections for the categories the router detected
+            self.policy_index = PolicyIndex(self.principles, self.terms)
+            self.prompt_builders = {
+                "general": self.create_chain_of_thought_prompt,
+                "specialized": self.create_specialized_prompt,
+                "image": self.create_image_chain_of_thought_prompt,
+            }
+
+            #system prompts are built once per (route, category set) - only the short user message
+            #changes per request, which lets the provider cache the prompt prefix
+            self._system_prompt_cache = {}
+            self.system_prompts = {route: self.system_prompt(route) for route in self.prompt_builders}
+
+            #build the critical content matcher once instead of on every message
+            self.keyword_matcher = KeywordMatcher(CRITICAL_KEYWORDS)
+
+            #opt-in: approve bare greetings locally (fast_path=False sends everything to the LLM)
+            self.fast_path = BenignFastPath(self.keyword_matcher) if fast_path else None
+
+            #cache verdicts for repeat content - keys include a hash of each prompt template,
+            #so editing a prompt automatically invalidates its old verdicts
+            self.prompt_versions = {
+                route: prompt_version(build("{policies}") + self.create_user_message("{content}") + self.policy_index.version)
+                for route, build in self.prompt_builders.items()
+            }
+            #micro-batched verdicts are cached under the general route, so its version covers the batch prompt too
+            self.prompt_versions["general"] = prompt_version(self.prompt_versions["general"] + self.create_batch_prompt("{policies}"))
+            #a compact-mode verdict may be the escalated full response, so its version covers both prompts
+            for route in ("general", "specialized"):
+                self.prompt_versions[f"{route}_compact"] = prompt_version(
+                    self.prompt_versions[route] + self.create_compact_prompt("{policies}") + json.dumps(VERDICT_TOOL))
+            self.verdict_cache = VerdictCache(os.getenv("VERDICT_CACHE_PATH", "verdict_cache.db")) if use_cache else None
+
+            #near-duplicate messages (same scam script, different name/amount) inherit their cluster's verdict
+            #(near_duplicate_threshold=None sends every variant to the LLM)
+            self.near_duplicates = None
+            if near_duplicate_threshold is not None:
+                self.near_duplicates = NearDuplicateIndex(threshold=near_duplicate_threshold)
+
+            #per-user offense counts for progressive enforcement - the model only scores and categorizes,
+            #the warning/removal/ban ladder is applied locally (snapshotted to VIOLATION_HISTORY_PATH)
+            #opened on the first user_id, so runs that never pass one start no snapshot thread and write no file
+            self.violation_history = violation_history
+            self._anonymous_history = ViolationHistory()  # user_id=None: decided in memory, never recorded
+            self._history_lock = threading.Lock()
+
+            #perceptual hashes of judged images and known-bad photos, searched by Hamming distance
+            self.image_index = ImageHashIndex(os.getenv("IMAGE_BLOCKLIST_PATH", "image_blocklist.txt"))
     
-    def create_chain_of_thought_prompt(self, content):
-        """Create the general moderation prompt with streamlined policies"""
-        return f"""
+    def create_chain_of_thought_prompt(self, policies):
+        """Create the general moderation system prompt with the retrieved policy sections"""
+        # Static apart from the policy block - the message itself goes in the user message so this prefix can be cached
+        template = textwrap.dedent("""
         You are an AI content moderator for Hinge dating app. Follow this exact 5-step process:
 
         STEP 1: Context Analysis
@@ -61,24 +191,8 @@ class HingeAIModerator: # this is our main AI moderator.
         2. [Secondary violation - if applicable]
         Focus on highest-impact violations rather than listing everything.
 
-        Apply these official Hinge TRUST & SAFETY POLICIES:
-
-            PROHIBITED CONTENT (Section 2d):
-            1. Could reasonably be deemed to be offensive or to harass, upset, embarrass, alarm or annoy any other person;
-            2. Is obscene, pornographic, violent or otherwise may offend human dignity, or contains nudity;
-            3. Is abusive, insulting or threatening, discriminatory or that promotes or encourages racism, sexism, hatred or bigotry;
-            4. Is illegal or encourages or facilitates any illegal activity including, without limitation, terrorism, human trafficking, money muling, child abuse and exploitation, or the incitement of violence or hatred;
-            5. Encourages or facilitates any activity that may result in harm to the user or another person, including, but not limited to, promotion of self-harm, eating disorders, dangerous challenges, violent extremism, or harmful misinformation;
-            6. Relates to commercial activities (including, without limitation, sales, competitions, employment or investment opportunities, promotions, and advertising, solicitation for services, "sugar daddy" or "sugar baby" relationships);
-            7. Infringes upon any third party's rights (including, without limitation, intellectual property rights and privacy rights);
-            8. Includes the image or likeness of another person without that person's consent;
-
-            PROHIBITED ACTIONS (Section 2c):
-            1. Misrepresent your identity, age, employment, qualifications, or affiliations;
-            2. Harass, bully, stalk, intimidate, assault, defame, harm or otherwise mistreat any person;
-            3. Solicit money or other items of value from another user;
-            4. Use our Services in relation to fraud, a pyramid scheme, or other similar practice;
-            5. Disclose private or proprietary information that you do not have the right to disclose;
+        Apply these official Hinge TRUST & SAFETY POLICIES (the sections relevant to this content):
+        {policies}
 
             ENFORCEMENT (Section 4):
             - Immediate suspension or termination for Prohibited Content
@@ -91,54 +205,31 @@ class HingeAIModerator: # this is our main AI moderator.
         - Document reasoning and check for potential bias
         - Consider cultural/linguistic context
 
-        STEP 5: Action Recommendation
-        - Self-correction, user-centric outcomes, auto-ban triggers
-        - Recommend action with appeal process
+        STEP 5: Confidence and Escalation
+        - Self-correction: re-check the score against the scoring examples
         - Human escalation for borderline cases
-
-        STEP 6: Automation Decision
-        You MUST include these fields in this exact format:
+        You MUST include this field in this exact format:
         - AI CONFIDENCE LEVEL: [Exact percentage, e.g., "95%" or "73%"]
-        - USER VIOLATION HISTORY: [Assume: 1st offense / 2nd offense / 3rd offense / 4th+ offense]
-        - AUTO-ACTION: [Specific automated decision based on logic below]
-
-            PROGRESSIVE ENFORCEMENT LOGIC:
-            FIRST OFFENSE ("First Speeding Ticket"):
-            - SCORES 1-6: No action (educational opportunity)
-            - SCORES 7-8: Warning only - "This content violates our guidelines. Please review our community standards."
-            - SCORES 9-10: Content removal + educational warning (unless extreme safety threat)
-
-            SECOND OFFENSE:
-            - SCORES 4-6: Formal warning - "This is your second warning. Continued violations may result in account restrictions."
-            - SCORES 7-10: Content removal + escalating warning
 
-            THIRD OFFENSE:
-            - SCORES 3+: Final warning - "This is your 3rd and final warning. You will be banned if this behavior continues."
-            - Content removal + temporary restriction
+        Do NOT recommend an enforcement action. Warnings, removals and bans are applied
+        automatically from your score, your category and the user's violation history.
 
-            FOURTH OFFENSE:
-            - Any violation = AUTOMATIC BAN
-
-            IMMEDIATE BAN (Override progressive system):
-            - Extreme safety threats: "I'll find you and hurt you"
-            - Illegal content: Any unlawful material
-            - Doxxing: Sharing private information
-
-        Content to analyze: {content}
+        The content to analyze is provided in the user message.
 
         USER VIEW (for display to content creator):
         You MUST format this section EXACTLY as shown below with no deviations:
 
         Score: [single number 1-10]
+        Category: [{categories}]
         Analysis: [brief professional explanation in one sentence]
         Policy Reference: [specific policy citation or "Complies with Hinge Community Guidelines"]
-        Action: [clear action recommendation]
-        """
+        """).strip()
+        return template.replace("{categories}", " / ".join(CATEGORIES)).replace("{policies}", policies)
 
-    def create_specialized_prompt(self, content):
-        """Create specialized prompt for hate speech, self-harm, and fraud detection"""
-        return f"""
-        You are an AI content moderator for Hinge dating app. Follow this exact 6-step process:
+    def create_specialized_prompt(self, policies):
+        """Create specialized system prompt for hate speech, self-harm, and fraud detection"""
+        template = textwrap.dedent("""
+        You are an AI content moderator for Hinge dating app. Follow this exact 5-step process:
 
         STEP 1: Context Analysis
         - Content type: Message, profile bio, photo caption
@@ -163,44 +254,38 @@ class HingeAIModerator: # this is our main AI moderator.
         2. [Secondary violation - if applicable] Section [X]: [Policy description]
 
         Key Policies:
-        Section 2d.1: Offensive, harassing, upsetting content
-        Section 2d.3: Abusive, discriminatory, promoting hatred/bigotry
-        Section 2c.2: Harassment, bullying, stalking, intimidation
-        Section 2c.3: Soliciting money or items of value
-        Section 2c.4: Fraud, pyramid schemes
+        {policies}
 
         STEP 4: Evidence Documentation
         - Document specific harmful elements and reasoning
         - Consider cultural/linguistic context
         - Check for bias in interpretation
 
-        STEP 5: Action Recommendation
-        - Recommend appropriate enforcement level
-        - Consider progressive enforcement vs immediate action
-        - For self-harm: NEVER recommend content removal - focus on crisis intervention
-
-        STEP 6: Automation Decision
+        STEP 5: Confidence and Escalation
+        - For self-harm: use category self_harm - crisis intervention (never content removal) is applied automatically
+        You MUST include this field in this exact format:
         - AI CONFIDENCE LEVEL: [Exact percentage, e.g., "95%"]
-        - USER VIOLATION HISTORY: [Assume: 1st offense / 2nd offense / 3rd offense / 4th+ offense]
-        - AUTO-ACTION: [Specific automated decision]
 
-        SPECIAL SELF-HARM PROTOCOL:
-        For self-harm content: Crisis intervention (NO content removal) + mental health resources + specialist escalation
+        Do NOT recommend an enforcement action. Warnings, removals and bans are applied
+        automatically from your score, your category and the user's violation history.
 
-        Content to analyze: {content}
+        The content to analyze is provided in the user message.
 
         USER VIEW (for display to content creator):
         You MUST format this section EXACTLY as shown below with no deviations:
 
         Score: [single number 1-10]
+        Category: [{categories}]
         Analysis: [brief professional explanation in one sentence]
         Policy Reference: [specific policy citation or "Complies with Hinge Community Guidelines"]
-        Action: [clear action recommendation]
-        """
-
-    def create_image_chain_of_thought_prompt(self):
-        """Create Chain of Thought prompt specifically for image analysis"""
-        return f"""You are an AI image moderator for Hinge dating app.
+        """).strip()
+        return template.replace("{categories}", " / ".join(CATEGORIES)).replace("{policies}", policies)
+
+    def create_image_chain_of_thought_prompt(self, policies):
+        """Create Chain of Thought system prompt specifically for image analysis"""
+        # Dedent the template before inserting the policy text, which has no indentation of its own
+        template = textwrap.dedent("""
+        You are an AI image moderator for Hinge dating app.
         Analyze this image using this 5-step process:
 
         STEP 1: Context Analysis
@@ -215,8 +300,7 @@ class HingeAIModerator: # this is our main AI moderator.
 
         STEP 3: Policy Application
         Apply these official Hinge community guidelines:
-        PRINCIPLES:
-        {self.principles}
+        {policies}
 
         STEP 4: Evidence Documentation
         - Document specific visual elements that violate or comply with policies
@@ -236,95 +320,761 @@ class HingeAIModerator: # this is our main AI moderator.
         Analysis: [brief professional explanation]
 
         Action: [clear recommendation]
-        """
+        """).strip()
+        return template.replace("{policies}", policies)
 
+    def create_batch_prompt(self, policies):
+        """Create the system prompt for several low-risk messages answered as one JSON array"""
+        template = textwrap.dedent("""
+        You are an AI content moderator for Hinge dating app. The user message contains several
+        messages, one per line as [index] "message". Judge each message independently.
 
+        DATING APP CONTEXT: Remember this is a dating platform where:
+        - Expressing romantic/sexual interest is expected and normal
+        - "Hook up" language is standard dating app communication
+        - Focus on RESPECT and BOUNDARIES rather than sexual content itself
+        - Score based on tone, pressure, and respect for boundaries
 
+        SCORING EXAMPLES:
+        - "Want to hook up tonight?" = Score 2-3 (direct but expected dating app language)
+        - "Send me nudes now" = Score 7-8 (demanding, inappropriate boundary crossing)
+        - "You better hook up or else" = Score 9-10 (threatening, harassment)
 
+        Apply these official Hinge TRUST & SAFETY POLICIES (the sections relevant to these messages):
+        {policies}
 
-    def detect_critical_content(self, content):
-        """Detect if content requires specialized handling for hate speech/self-harm/fraud"""
-        # Keywords and patterns that indicate critical content
-        hate_keywords = ['kill yourself', 'kys', 'hate all', 'hate women', 'hate men', 'nazi', 'hitler', 'supremacy', 'genocide', 'stupid bitch', 'fucking bitch', 'disgusting', 'go back to your', 'your country', 'racist', 'bigot', 'retard', 'faggot', 'nigger', 'wetback', 'chink']
-        self_harm_keywords = ['suicide', 'kill myself', 'want to die', 'self harm', 'cutting', 'bulimia', 'anorexia', 'overdose', 'end my life']
-        fraud_keywords = ['send money', 'wire transfer', 'inheritance', 'lottery', 'investment opportunity', 'sugar daddy', 'sugar baby', 'cash app', 'venmo', 'send me $', 'investment']
+        Do not recommend actions - enforcement is applied automatically from the score and category.
 
-        content_lower = content.lower()
+        Return ONLY a JSON array with exactly one object per message, no other text:
+        [{"index": 0, "score": 1-10, "category": "{categories}", "analysis": "one sentence", "policy_reference": "specific section or Complies with Hinge Community Guidelines", "confidence": 0-100}]
+        """).strip()
+        return template.replace("{categories}", "|".join(CATEGORIES)).replace("{policies}", policies)
 
-        # Check for hate speech indicators
-        for keyword in hate_keywords:
-            if keyword in content_lower:
-                return True
+    def create_compact_prompt(self, policies):
+        """Create the compact-mode system prompt: same policies, but only the verdict comes back"""
+        template = textwrap.dedent("""
+        You are an AI content moderator for Hinge dating app. Judge the message in the user message
+        and record your verdict with the record_verdict function.
 
-        # Check for self-harm indicators
-        for keyword in self_harm_keywords:
-            if keyword in content_lower:
-                return True
+        DATING APP CONTEXT: Remember this is a dating platform where:
+        - Expressing romantic/sexual interest is expected and normal
+        - "Hook up" language is standard dating app communication
+        - Focus on RESPECT and BOUNDARIES rather than sexual content itself
+        - Score based on tone, pressure, and respect for boundaries
 
-        # Check for fraud indicators
-        for keyword in fraud_keywords:
-            if keyword in content_lower:
-                return True
+        SCORING EXAMPLES:
+        - "Want to hook up tonight?" = Score 2-3 (direct but expected dating app language)
+        - "Send me nudes now" = Score 7-8 (demanding, inappropriate boundary crossing)
+        - "You better hook up or else" = Score 9-10 (threatening, harassment)
 
-        return False
+        Apply these official Hinge TRUST & SAFETY POLICIES (the sections relevant to this content):
+        {policies}
+
+        Work through context, intent, policy and bias silently - do not write the steps out.
+        For self-harm use category self_harm; crisis intervention is applied automatically.
+        Do not recommend actions - enforcement is applied automatically from the score and category.
+        """).strip()
+        return template.replace("{policies}", policies)
+
+    def create_user_message(self, content):
+        """Create the small per-request user message that follows the cached system prompt"""
+        return f"Content to analyze: {content}"
+
+    def prompt_token_report(self):
+        """Token counts for the static system prefix vs. the per-request user message, per route"""
+        sample_message = self.create_user_message("Hey! I noticed we both love hiking. What's your favorite trail?")
+        report = {}
+        for route, system_prompt in self.system_prompts.items():
+            system_tokens = count_tokens(system_prompt)
+            report[route] = {
+                "system_tokens": system_tokens,
+                "user_tokens": count_tokens(sample_message),
+                # OpenAI only caches prompt prefixes of 1024+ tokens
+                "prefix_cacheable": system_tokens >= 1024,
+            }
+        return report
+
+    def system_prompt(self, route, categories=(), compact=False):
+        """System prompt for a route with the policy sections for the given categories"""
+        key = (route, frozenset(categories), compact)
+        prompt = self._system_prompt_cache.get(key)
+        if prompt is None:
+            build = self.create_compact_prompt if compact else self.prompt_builders[route]
+            prompt = build(self.policy_index.render(route, categories))
+            self._system_prompt_cache[key] = prompt
+        return prompt
+
+    def policy_token_report(self, contents):
+        """Average system prompt tokens per route with every policy inlined vs. retrieved sections only"""
+        prompts = {}
+        for content in contents:
+            critical_hits = self.detect_critical_content(content)
+            route = "specialized" if critical_hits else "general"
+            categories = self.policy_index.detect_categories(content, critical_hits)
+            prompts.setdefault(route, []).append(self.system_prompt(route, categories))
+        prompts["image"] = [self.system_prompts["image"]]
+
+        report = {}
+        for route, route_prompts in prompts.items():
+            full_tokens = count_tokens(self.prompt_builders[route](self.policy_index.render_full(route)))
+            retrieved_tokens = sum(count_tokens(prompt) for prompt in route_prompts) / len(route_prompts)
+            report[route] = {
+                "messages": len(route_prompts),
+                "full_tokens": full_tokens,
+                "retrieved_tokens": retrieved_tokens,
+                "change": retrieved_tokens / full_tokens - 1,
+            }
+        return report
 
-    def moderate_content(self, content): # this function analyzes content
+    def detect_critical_content(self, content):
+        """Detect if content requires specialized handling for hate speech/self-harm/fraud"""
+        # Returns {category: [matched terms]} - an empty dict (falsy) means no critical content
+        return self.keyword_matcher.scan(content)
+
+    def detect_critical_content_batch(self, contents):
+        """Run the critical content router over a batch of messages"""
+        return self.keyword_matcher.scan_batch(contents)
+
+    def _build_moderation_messages(self, content, timer=NULL_TIMER, compact=False):
+        """Route content to the general or specialized prompt; returns (route, messages)"""
+        critical_hits = self.detect_critical_content(content)
+        if critical_hits:
+            print(f"Using specialized prompt for critical content detection ({', '.join(critical_hits)})")
+            route = "specialized"
+        else:
+            print("Using general prompt")
+            route = "general"
+        categories = self.policy_index.detect_categories(content, critical_hits)
+        timer.lap("routing")
+        messages = [
+            {"role": "system", "content": self.system_prompt(route, categories, compact)},
+            {"role": "user", "content": self.create_user_message(content)},
+        ]
+        timer.lap("prompt_build")
+        return route, messages
+
+    def _fast_path_verdict(self, content):
+        """Return a local verdict for confidently benign content, or None to continue to the LLM"""
+        if self.fast_path is None:
+            return None
+        verdict = self.fast_path.try_approve(content)
+        if verdict is not None:
+            print("Approved by local fast path")
+        return verdict
+
+    def _get_cached_verdict(self, content, route, model, compact=False):
+        """Look up a cached verdict; returns (cache_key, verdict or None)"""
+        if self.verdict_cache is None:
+            return None, None
+        version = self.prompt_versions[f"{route}_compact" if compact else route]
+        cache_key = VerdictCache.make_key(content, route, version, model)
+        verdict = self.verdict_cache.get(cache_key)
+        if verdict is not None:
+            print(f"Cache hit ({route})")
+        return cache_key, verdict
+
+    def _store_verdict(self, cache_key, verdict):
+        """Save a fresh verdict so repeat content skips the API call"""
+        if self.verdict_cache is not None and cache_key is not None:
+            self.verdict_cache.set(cache_key, verdict)
+
+    def cache_stats(self):
+        """Hit/miss/eviction counters for the verdict cache (None when caching is off)"""
+        return self.verdict_cache.summary() if self.verdict_cache is not None else None
+
+    def moderate_content(self, content, user_id=None): # this function analyzes content
         """Analyze content and decide if it violates policies"""
+        return self.moderate_content_detailed(content, user_id)["response"] # return the AI's moderation decision
+
+    def moderate_content_detailed(self, content, user_id=None, cascade=None):
+        """Moderate content and return the verdict with its route, source, latency, token usage and enforcement action
+
+        user_id looks up the sender's violation history (None treats every message as a first offense).
+        cascade overrides the model cascade for this call (the scheduler downgrades late work to a cheaper one).
+        """
+        start = time.perf_counter()
+        timer = self.metrics.timer()
+        cascade = cascade or self.cascade
+        record, messages, cache_key = self._start_moderation(content, timer, cascade=cascade)
+        try:
+            batcher = self.micro_batcher  # read once - stop_micro_batching() may clear it meanwhile
+            if (record["response"] is None and batcher is not None and record["route"] == "general"
+                    and cascade is self.cascade):
+                # Low-risk messages share one packed request; entries it can't answer fall through to a single call
+                try:
+                    batcher.submit(record).result()
+                    timer.lap("llm_batch")
+                except MicroBatcherClosedError:
+                    pass  # batching was stopped after we looked - send it on its own
+            if record["response"] is None:
+                model = cascade.first_model(record["route"])
+                response = self.client.chat.completions.create(
+                     model=model,
+                     messages=messages,
+                     **self._request_options()
+                )
+                timer.lap("llm")
+                self._read_response(record, response, model)
+            if record["source"] in ("llm", "llm_batch"):
+                escalation = self._next_model(record, cascade)
+                while escalation is not None: # re-ask a larger model until the verdict is confident or we're at the top
+                    model, record["cascade_reason"] = escalation
+                    response = self.client.chat.completions.create(
+                         model=model,
+                         messages=messages,
+                         **self._request_options()
+                    )
+                    self._read_response(record, response, model)
+                    timer.lap("llm_escalation")
+                    escalation = self._next_model(record, cascade)
+                reason = self._escalation_reason(record)
+                if reason is not None:
+                    response = self.client.chat.completions.create(
+                         model=record["model"],
+                         messages=self._full_reasoning_messages(record, reason)
+                    )
+                    self._add_full_reasoning(record, reason, response)
+                    timer.lap("full_reasoning")
+                self._finish_moderation(record, cache_key)
+                timer.lap("store")
+        except ProviderUnavailableError as e:
+            timer.lap("llm")
+            self._mark_provider_unavailable(record, e)
+        self._apply_enforcement(record, user_id)
+        timer.lap("enforcement")
+        record["latency"] = time.perf_counter() - start
+        self.metrics.finish(timer, record["route"], record["source"])
+        return record
+
+    def _apply_enforcement(self, record, user_id):
+        """Decide the action from the verdict's score and category and the user's history, and add it to the USER VIEW
+
+        Runs after the verdict is cached, so cached and near-duplicate verdicts stay the same for every user.
+        """
+        if record["response"] is None or record["source"] == "provider_unavailable":
+            return
+        verdict = parse_moderation_response(record["response"])
+        decision = self._history_for(user_id).enforce(user_id, verdict.score, verdict.category)
+        record.update(category=verdict.category, action=decision["action"], offense_level=decision["offense_level"])
+        record["response"] += f"\nAction: {decision['action']}"
+
+    def _history_for(self, user_id):
+        """The violation history to enforce against - opened from VIOLATION_HISTORY_PATH on the first user_id"""
+        if self.violation_history is None and user_id is not None:
+            with self._history_lock:
+                if self.violation_history is None:
+                    self.violation_history = ViolationHistory(os.getenv("VIOLATION_HISTORY_PATH", "violation_history.json"))
+        return self.violation_history or self._anonymous_history
+
+    def _mark_provider_unavailable(self, record, error):
+        """Record an outage as its own outcome - never as a verdict, and never cached"""
+        print(f"Provider unavailable: {error}")
+        record.pop("_signature", None)
+        record.update(source="provider_unavailable", response=self._create_provider_unavailable_response())
+
+    def _create_provider_unavailable_response(self):
+        """Create a properly formatted response for when the model provider can't be reached"""
+        return f"""USER VIEW (for display to content creator):
+        Score: N/A
+        Analysis: Moderation is temporarily unavailable - this content has not been reviewed yet
+        Policy Reference: N/A
+        Action: No action taken - queued for automatic retry"""
+
+    def start_micro_batching(self, max_items=8, max_wait_ms=50, max_in_flight=4):
+        """Pack general-route messages from concurrent moderate_content callers into shared requests"""
+        if self.micro_batcher is None:
+            self.micro_batcher = MicroBatcher(self._moderate_packed, max_items=max_items,
+                                              max_wait_ms=max_wait_ms, max_in_flight=max_in_flight)
+
+    def stop_micro_batching(self):
+        """Flush pending batches and go back to one request per message"""
+        batcher, self.micro_batcher = self.micro_batcher, None  # new callers go straight to single requests
+        if batcher is not None:
+            batcher.close()
+
+    def close(self):
+        """Flush pending batches and write the final violation history snapshot"""
+        self.stop_micro_batching()
+        if self.violation_history is not None:
+            self.violation_history.close()
+
+    def _moderate_packed(self, items):
+        """Moderate [record] in one request; returns True for each record it filled in"""
+        contents = [record["content"] for record in items]
+        categories = frozenset().union(*(self.policy_index.detect_categories(content) for content in contents))
+        key = ("batch", categories)
+        system_prompt = self._system_prompt_cache.get(key)
+        if system_prompt is None:
+            system_prompt = self.create_batch_prompt(self.policy_index.render("general", categories))
+            self._system_prompt_cache[key] = system_prompt
+
+        model = self.cascade.first_model("general")
+        response = self.client.chat.completions.create(
+             model=model,
+             messages=[
+                 {"role": "system", "content": system_prompt},
+                 {"role": "user", "content": create_batch_user_message(contents)},
+             ]
+        )
+        verdicts = parse_batch_response(response.choices[0].message.content, len(items))
+        print(f"Packed {len(items)} messages into one request ({len(items) - len(verdicts)} need a single-item retry)")
+
+        # Token usage is shared evenly across the packed messages
+        usage = getattr(response, "usage", None)
+        prompt_share = (getattr(usage, "prompt_tokens", 0) or 0) / len(items)
+        completion_share = (getattr(usage, "completion_tokens", 0) or 0) / len(items)
+        filled = []
+        for index, record in enumerate(items):
+            entry = verdicts.get(index)
+            if entry is None:
+                filled.append(False)
+                continue
+            record.update(
+                source="llm_batch",
+                response=batch_verdict_text(entry),
+                model=model,
+                prompt_tokens=round(prompt_share),
+                completion_tokens=round(completion_share),
+                cost=request_cost(model, prompt_share, completion_share),
+            )
+            filled.append(True) # the caller escalates it if needed, then caches it
+        return filled
+
+    def _start_moderation(self, content, timer=NULL_TIMER, compact=None, cascade=None):
+        """Shared pre-LLM pipeline: fast path, routing and cache lookup; returns (record, messages, cache_key)
+
+        compact=None follows the moderator's mode; streaming passes False because it parses the USER VIEW text.
+        """
+        compact = self.compact if compact is None else compact
+        cascade = cascade or self.cascade
         print(f"Analyzing: {content}") # show what we're checking
+        record = {
+            "content": content,
+            "route": None,
+            "source": None, # fast_path, cache, near_duplicate, llm, llm_batch or provider_unavailable
+            "cluster_id": None, # near-duplicate cluster this message belongs to
+            "bulk_action": False, # True when the cluster is a violating campaign worth acting on as a whole
+            "response": None,
+            "category": None, # from the verdict
+            "action": None, # decided locally by the enforcement ladder
+            "offense_level": None, # 1-4, which rung of the ladder the user was on
+            "escalation": None, # compact mode: why the full reasoning was generated (borderline, low_confidence, unparsed)
+            "model": None, # the cascade tier that gave the final verdict
+            "cascade_reason": None, # why a larger model was asked (critical_route, borderline, low_confidence, unparsed)
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cost": 0.0, # USD across every request this message needed
+            "latency": 0.0,
+        }
 
-        # Route to specialized prompt for critical content
-        if self.detect_critical_content(content):
-            print("Using specialized prompt for critical content detection")
-            prompt = self.create_specialized_prompt(content)
-        else:
-            print("Using general prompt")
-            prompt = self.create_chain_of_thought_prompt(content)
+        # Obviously benign messages never need an LLM call
+        fast_verdict = self._fast_path_verdict(content)
+        timer.lap("fast_path")
+        if fast_verdict is not None:
+            record.update(route="fast_path", source="fast_path", response=fast_verdict)
+            return record, None, None
 
+        # Route to specialized prompt for critical content
+        route, messages = self._build_moderation_messages(content, timer, compact)
+        record["route"] = route
+
+        # Reuse the verdict if we've already judged identical content with the same prompt and model
+        cache_key, cached_verdict = self._get_cached_verdict(content, route, cascade.version, compact)
+        timer.lap("cache_lookup")
+        if cached_verdict is not None:
+            record.update(source="cache", response=cached_verdict)
+            return record, messages, cache_key
+
+        # Variants of a message we've already judged inherit that verdict
+        if self.near_duplicates is not None:
+            signature, cluster = self.near_duplicates.match(content, route)
+            if cluster is not None:
+                print(f"Near-duplicate of cluster {cluster['cluster_id']} ({cluster['members']} members, "
+                      f"similarity {cluster['similarity']:.2f})")
+                record.update(source="near_duplicate", response=cluster["verdict"],
+                              cluster_id=cluster["cluster_id"], bulk_action=cluster["bulk_action"])
+            elif cascade.version == self.cascade.version:
+                # Only the production cascade seeds clusters - a downgraded verdict mustn't spread to full-cascade requests
+                record["_signature"] = signature
+            timer.lap("near_duplicate")
+        return record, messages, cache_key
+
+    def _index_verdict(self, record):
+        """Start a near-duplicate cluster for a fresh LLM verdict (not for verdicts from a non-default cascade)"""
+        signature = record.pop("_signature", None)
+        if self.near_duplicates is not None and signature is not None:
+            record["cluster_id"] = self.near_duplicates.add(record["content"], record["route"], record["response"], signature)
+
+    def near_duplicate_stats(self):
+        """Hit/miss/eviction counters for the near-duplicate index (None when it's off)"""
+        return self.near_duplicates.summary() if self.near_duplicates is not None else None
+
+    def _request_options(self):
+        """Extra chat completion arguments for the verdict request (compact mode forces the record_verdict call)"""
+        if not self.compact:
+            return {}
+        return {"tools": [VERDICT_TOOL], "tool_choice": {"type": "function", "function": {"name": "record_verdict"}},
+                "max_tokens": COMPACT_MAX_TOKENS}
+
+    def _read_response(self, record, response, model):
+        """Copy the API response into the record and add its token usage and cost"""
+        message = response.choices[0].message
+        result = message.content
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            # Compact verdicts come back as the function arguments; rendering them as a USER VIEW keeps
+            # the parser, cache, near-duplicate index and enforcement unchanged. Malformed or truncated
+            # arguments are left as they are, fail to parse, and get escalated.
+            result = tool_calls[0].function.arguments
+            entry = parse_verdict_object(result)
+            if entry is not None:
+                result = batch_verdict_text(entry)
+        self._add_usage(record, response, model)
+        record.update(source="llm", response=result or "", model=model)
+
+    def _add_usage(self, record, response, model):
+        """Add a response's token usage and cost to the record's running totals"""
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        record["prompt_tokens"] += prompt_tokens
+        record["completion_tokens"] += completion_tokens
+        record["cost"] += request_cost(model, prompt_tokens, completion_tokens)
+
+    def _next_model(self, record, cascade=None):
+        """(larger model, reason) when the cascade says the record's verdict should be re-asked, otherwise None"""
+        escalation = (cascade or self.cascade).next_model(record["model"], record["route"], parse_moderation_response(record["response"]))
+        if escalation is not None:
+            print(f"Re-asking {escalation[0]} ({escalation[1]}; {record['model']} answered first)")
+        return escalation
+
+    def _escalation_reason(self, record):
+        """Why a compact verdict needs the full reasoning (borderline, low_confidence or unparsed), or None"""
+        if not self.compact:
+            return None
+        verdict = parse_moderation_response(record["response"])
+        if verdict.score is None:
+            return "unparsed"
+        if BORDERLINE_SCORES[0] <= verdict.score <= BORDERLINE_SCORES[1]:
+            return "borderline"
+        if verdict.confidence is not None and verdict.confidence < ESCALATION_CONFIDENCE:
+            return "low_confidence"
+        return None
+
+    def _full_reasoning_messages(self, record, reason):
+        """The step-by-step prompt for a message whose compact verdict was escalated"""
+        print(f"Escalating ({reason}): generating the full reasoning")
+        _, messages = self._build_moderation_messages(record["content"], compact=False)
+        return messages
+
+    def _add_full_reasoning(self, record, reason, response):
+        """Replace the verdict with the full step-by-step response (from record["model"]), adding its usage"""
+        self._add_usage(record, response, record["model"])
+        record.update(response=response.choices[0].message.content, escalation=reason)
+
+    def _finish_moderation(self, record, cache_key):
+        """Cache a fresh verdict and start its near-duplicate cluster"""
+        self._store_verdict(cache_key, record["response"])
+        self._index_verdict(record)
+
+    def review_appeal(self, content):
+        """Generate the full step-by-step reasoning for an appealed verdict
+
+        Appeals always get the complete chain of thought whatever mode the moderator runs in,
+        skip the cache, and never touch the user's violation history.
+        """
+        start = time.perf_counter()
+        print(f"Reviewing appeal: {content}")
+        route, messages = self._build_moderation_messages(content, compact=False)
+        record = {"content": content, "route": route, "source": "llm", "response": None, "escalation": None,
+                  "model": self.cascade.top_model, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "latency": 0.0}
         response = self.client.chat.completions.create(
-             model="gpt-4",
-             messages=[{"role": "user", "content": prompt}]
+             model=record["model"],
+             messages=messages
         )
-        return response.choices[0].message.content # return the AI's moderation decision
+        self._add_full_reasoning(record, "appeal", response)
+        record["latency"] = time.perf_counter() - start
+        return record
+
+    def stream_moderate_content(self, content, on_field=None, verdict_first=False, stop_after_verdict=False, user_id=None):
+        """Stream the moderation response, reporting USER VIEW fields as soon as they arrive
+
+        on_field(name, value) is called for score, category, analysis and policy_reference, then
+        once for the locally decided action. verdict_first asks the model to write the USER VIEW
+        before its reasoning, and stop_after_verdict cancels the rest of the stream once score
+        and category are known.
+        """
+        start = time.perf_counter()
+        timer = self.metrics.timer()
+        record, messages, cache_key = self._start_moderation(content, timer, compact=False)
+        record.update(fields={}, time_to_verdict=None, cancelled=False)
+        parser = StreamingVerdictParser()
+
+        def handle(fields):
+            for name, value in fields:
+                record["fields"][name] = value
+                if on_field is not None:
+                    on_field(name, value)
+            if record["time_to_verdict"] is None and parser.verdict_ready:
+                record["time_to_verdict"] = time.perf_counter() - start
+
+        def enforce():
+            self._apply_enforcement(record, user_id)
+            if record["action"] is not None:
+                handle([("action", record["action"])])
+
+        if record["response"] is not None:
+            # Fast path and cache hits already have the whole response
+            handle(parser.feed(record["response"]) + parser.close())
+            enforce()
+            record["latency"] = time.perf_counter() - start
+            self.metrics.finish(timer, record["route"], record["source"])
+            return record
+
+        if verdict_first:
+            # Only the user message changes, so the cached system prefix still applies
+            messages[-1] = {"role": "user", "content": messages[-1]["content"] +
+                            "\n\nOutput the USER VIEW section first, then the reasoning steps."}
+
+        # A stream can't be re-asked halfway through, so it goes straight to the top tier
+        record["model"] = self.cascade.top_model
+        try:
+            stream = self.client.chat.completions.create(
+                 model=record["model"],
+                 messages=messages,
+                 stream=True,
+                 stream_options={"include_usage": True}
+            )
+        except ProviderUnavailableError as e:
+            timer.lap("llm")
+            self._mark_provider_unavailable(record, e)
+            record["latency"] = time.perf_counter() - start
+            self.metrics.finish(timer, record["route"], record["source"])
+            return record
+        text_parts = []
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    self._add_usage(record, chunk, record["model"])
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                text_parts.append(chunk.choices[0].delta.content)
+                handle(parser.feed(chunk.choices[0].delta.content))
+                if stop_after_verdict and parser.verdict_ready:
+                    record["cancelled"] = True
+                    stream.close() # stop paying for tokens we won't read
+                    break
+        except openai.APIError as e:
+            # The connection dropped or the provider sent an error mid-stream - same outcome as a failed request,
+            # and the partial response is neither cached nor enforced
+            timer.lap("llm")
+            self._mark_provider_unavailable(record, e)
+            record["latency"] = time.perf_counter() - start
+            self.metrics.finish(timer, record["route"], record["source"])
+            return record
+        handle(parser.close())
+        timer.lap("llm")
+
+        record.update(source="llm", response="".join(text_parts))
+        if not record["cancelled"]:
+            self._store_verdict(cache_key, record["response"]) # partial responses are never cached
+            self._index_verdict(record)
+        record.pop("_signature", None)
+        timer.lap("store")
+        enforce()
+        timer.lap("enforcement")
+        record["latency"] = time.perf_counter() - start
+        self.metrics.finish(timer, record["route"], record["source"])
+        return record
+
+    def _get_async_client(self):
+        """Return an async OpenAI client bound to the running event loop"""
+        # httpx connection pools can't be shared across event loops, so each new loop gets its own client
+        loop = asyncio.get_running_loop()
+        if self._async_client_loop is not loop:
+            self.async_client = AsyncResilientClient(
+                self.backend.create_async_client(),
+                limiter=self.rate_limiter,
+                breaker=self.circuit_breaker
+            )
+            self._async_client_loop = loop
+        return self.async_client
+
+    async def amoderate_content(self, content, user_id=None):
+        """Async version of moderate_content built on the async OpenAI client"""
+        return (await self.amoderate_content_detailed(content, user_id))["response"]
+
+    async def amoderate_content_detailed(self, content, user_id=None):
+        """Async version of moderate_content_detailed"""
+        start = time.perf_counter()
+        timer = self.metrics.timer()
+        record, messages, cache_key = self._start_moderation(content, timer)
+        if record["response"] is None:
+            try:
+                model = self.cascade.first_model(record["route"])
+                response = await self._get_async_client().chat.completions.create(
+                     model=model,
+                     messages=messages,
+                     **self._request_options()
+                )
+                timer.lap("llm")
+                self._read_response(record, response, model)
+                escalation = self._next_model(record)
+                while escalation is not None:
+                    model, record["cascade_reason"] = escalation
+                    response = await self._get_async_client().chat.completions.create(
+                         model=model,
+                         messages=messages,
+                         **self._request_options()
+                    )
+                    self._read_response(record, response, model)
+                    timer.lap("llm_escalation")
+                    escalation = self._next_model(record)
+                reason = self._escalation_reason(record)
+                if reason is not None:
+                    response = await self._get_async_client().chat.completions.create(
+                         model=record["model"],
+                         messages=self._full_reasoning_messages(record, reason)
+                    )
+                    self._add_full_reasoning(record, reason, response)
+                    timer.lap("full_reasoning")
+                self._finish_moderation(record, cache_key)
+                timer.lap("store")
+            except ProviderUnavailableError as e:
+                timer.lap("llm")
+                self._mark_provider_unavailable(record, e)
+        self._apply_enforcement(record, user_id)
+        timer.lap("enforcement")
+        record["latency"] = time.perf_counter() - start
+        self.metrics.finish(timer, record["route"], record["source"])
+        return record
+
+    async def amoderate_batch(self, contents, max_concurrency=8):
+        """Moderate many messages concurrently with at most max_concurrency requests in flight"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def moderate_one(index, content):
+            async with semaphore:
+                try:
+                    record = await self.amoderate_content_detailed(content)
+                    return {"index": index, **record, "error": None}
+                except Exception as e:
+                    # One failed item shouldn't kill the whole batch
+                    print(f"Batch item {index} failed: {e}")
+                    return {"index": index, "content": content, "response": None, "error": f"{type(e).__name__}: {e}"}
+
+        # gather keeps results in the same order as the input
+        return await asyncio.gather(*(moderate_one(index, content) for index, content in enumerate(contents)))
+
+    def moderate_batch(self, contents, max_concurrency=8):
+        """Synchronous entry point for amoderate_batch; results come back in input order"""
+        return asyncio.run(self.amoderate_batch(contents, max_concurrency=max_concurrency))
 
     def moderate_image(self, uploaded_image): # this function analyzes images
         """Analyze image content and decide if it violates policies"""
-        image_base64 = base64.b64encode(uploaded_image.read()).decode('utf-8')
+        timer = self.metrics.timer()
+        response, outcome = self._moderate_image(uploaded_image, timer)
+        self.metrics.finish(timer, "image", outcome)
+        return response
+
+    def _moderate_image(self, uploaded_image, timer):
+        """Image pipeline behind moderate_image; returns (response, outcome)"""
+        image_bytes = uploaded_image.read()
         print(f"Analyzing image: {uploaded_image.name}") # show what we're checking
 
-        # Create image-specific prompt
-        prompt = self.create_image_chain_of_thought_prompt()
+        # Re-uploaded photos are hashed byte-for-byte, so they skip the vision call entirely
+        cache_key, cached_verdict = self._get_cached_verdict(image_bytes, "image", IMAGE_MODEL)
+        timer.lap("cache_lookup")
+        if cached_verdict is not None:
+            return cached_verdict, "cache"
+
+        # Validate, strip metadata and downsize to what the vision model actually uses
+        try:
+            image = ingest_image(image_bytes)
+        except ImageRejectedError as e:
+            print(f"Image rejected: {e}")
+            return self._create_rejected_image_response(str(e)), "rejected"
+        timer.lap("ingest")
+        print(f"Ingested image: {image.original_bytes} -> {len(image.data)} bytes, {image.width}x{image.height}, detail={image.detail}")
+
+        # Known-bad photos are rejected instantly; near-duplicates of judged photos reuse their verdict
+        blocked_distance = self.image_index.check_blocklist(image.perceptual_hash)
+        if blocked_distance is not None:
+            print(f"Image matches a known-bad image ({blocked_distance} bits apart)")
+            return self._create_blocked_image_response(), "blocklist"
+        similar_verdict = self.image_index.find_verdict(image.perceptual_hash)
+        timer.lap("image_hash")
+        if similar_verdict is not None:
+            print("Reusing verdict from a near-duplicate image")
+            self._store_verdict(cache_key, similar_verdict)
+            return similar_verdict, "near_duplicate"
 
         # Call GPT-4V with image
         try:
             response = self.client.chat.completions.create(
-                model="gpt-4o",
+                model=IMAGE_MODEL,
                 messages=[
+                    {"role": "system", "content": self.system_prompts["image"]},
                     {
                         "role": "user",
                         "content": [
-                            {"type": "text", "text": prompt},
+                            {"type": "text", "text": "Image to analyze:"},
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
+                                    "url": image.data_url(),
+                                    "detail": image.detail
                                 }
                             }
                         ]
                     }
                 ]
             )
+            timer.lap("llm")
             result = response.choices[0].message.content
             print(f"GPT-4V Success: {len(result)} characters returned")  # Debug line
 
             # Check if safety filters were triggered
             if "I'm sorry, I can't help with that" in result or "I can't assist with" in result or len(result) < 50:
                 print("GPT-4V safety filters triggered")  # Debug line
-                return self._create_safety_filter_response()
-
-            return result
-        except Exception as e:
-            print(f"GPT-4V Error: {e}")  # Debug line
-            return self._create_safety_filter_response()
+                return self._create_safety_filter_response(), "safety_filter"
+
+            self._store_verdict(cache_key, result) # only real verdicts are cached, never fallbacks
+            self.image_index.add_verdict(image.perceptual_hash, result)
+            timer.lap("store")
+            return result, "llm"
+        except ProviderUnavailableError as e:
+            # An outage is not a policy violation - don't send it to human review as a score 10
+            timer.lap("llm")
+            logger.warning("Vision model unavailable: %s", e)
+            return self._create_provider_unavailable_response(), "provider_unavailable"
+        except openai.BadRequestError as e:
+            timer.lap("llm")
+            logger.warning("Vision model rejected the request: %s", e)
+            if getattr(e, "code", None) == "content_policy_violation":
+                return self._create_safety_filter_response(), "safety_filter"
+            return self._create_rejected_image_response("the vision model could not process this image"), "invalid_request"
+        except Exception:
+            # Anything else (auth, malformed response, a bug) still gets a verdict - human review, never a crash
+            timer.lap("llm")
+            logger.exception("Image moderation failed")
+            return self._create_safety_filter_response(), "error"
+
+    def _create_rejected_image_response(self, reason):
+        """Create a properly formatted response for uploads that fail image validation"""
+        return f"""USER VIEW (for display to content creator):
+        Score: N/A
+        Analysis: Image could not be processed - {reason}
+        Policy Reference: Upload requirements (JPEG, PNG, WebP or GIF under 20 MB)
+        Action: Upload rejected - please upload a different image"""
+
+    def _create_blocked_image_response(self):
+        """Create a properly formatted response for images matching the known-bad blocklist"""
+        return f"""USER VIEW (for display to content creator):
+        Score: 9
+        Analysis: Image matches a photo previously removed from scam or spam profiles
+        Policy Reference: Hinge Community Guidelines - authentic photos, no duplicate or fake accounts
+        Action: Content removal + account review"""
 
     def _create_safety_filter_response(self):
         """Create a properly formatted response when safety filters are triggered"""
@@ -362,13 +1112,65 @@ class HingeAIModerator: # this is our main AI moderator.
 
     def parse_score_from_response(self, ai_response):
         """Extract the 1-10 score from AI response"""
-        # Look for "Score: X" pattern in the response
-        score_match = re.search(r'Score:\s*(\d+)', ai_response)
-        if score_match:
-            return int(score_match.group(1))
-        return None  # If no score found
+        return parse_moderation_response(ai_response).score  # None if no score found
+
+    def _evaluate_case(self, case_id, case):
+        """Moderate one evaluation case and score it against its expected range"""
+        content = case["content"]
+        expected_range = case["expected_score_range"]
+
+        record = self.moderate_content_detailed(content)
+        if record["source"] == "provider_unavailable":
+            # Counted as an error and left out of the checkpoint, so a resumed run retries it
+            raise ProviderUnavailableError("model provider unavailable")
+        with self.metrics.span("parse", record["route"]):
+            ai_result = parse_moderation_response(record["response"])
+        ai_score = ai_result.score
+
+        # Check if score is within expected range
+        is_accurate = False
+        if ai_score is not None:
+            is_accurate = expected_range[0] <= ai_score <= expected_range[1]
 
-    def run_evaluation(self):
+        return {
+            "case_id": case_id,
+            "content": content,
+            "ai_result": ai_result.to_dict(), # compact typed fields instead of the raw response
+            "ai_score": ai_score,
+            "expected_range": expected_range,
+            "is_accurate": is_accurate,
+            "route": record["route"],
+            "source": record["source"],
+            "latency": record["latency"],
+            "tokens": record["prompt_tokens"] + record["completion_tokens"],
+            "completion_tokens": record["completion_tokens"],
+            "escalation": record["escalation"],
+            "model": record["model"],
+            "cascade_reason": record["cascade_reason"],
+            "cost": record["cost"],
+        }
+
+    def _evaluation_signature(self):
+        """Identifies the prompts and model a checkpoint was produced with"""
+        versions = ",".join(f"{route}={version}" for route, version in sorted(self.prompt_versions.items()))
+        return f"{self.cascade.version}|{versions}|{'compact' if self.compact else 'full'}|result-v5"
+
+    def _load_checkpoint(self, checkpoint_path, signature):
+        """Read completed case results from a JSONL checkpoint, ignoring stale or partial lines"""
+        completed = {}
+        if not os.path.exists(checkpoint_path):
+            return completed
+        with open(checkpoint_path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # a crash mid-write can leave a truncated last line
+                if entry.get("signature") == signature:
+                    completed[entry["result"]["case_id"]] = entry["result"]
+        return completed
+
+    def run_evaluation(self, workers=4, checkpoint_path="evaluation_checkpoint.jsonl", resume=True):
         """Evaluate AI performance against ground truth dataset"""
         print("Running evaluation against ground truth...")
 
@@ -376,28 +1178,38 @@ class HingeAIModerator: # this is our main AI moderator.
         with open("evaluation_dataset.json", "r") as file:
             test_cases = json.load(file)
 
-        results = []
-
-        # Step 2: Test each case and track with Langfuse
-        for case in test_cases:
-            content = case["content"]
-            expected_range = case["expected_score_range"]
-
-            ai_response = self.moderate_content(content)
-            ai_score = self.parse_score_from_response(ai_response)
-
-            # Check if score is within expected range
-            is_accurate = False
-            if ai_score is not None:
-                is_accurate = expected_range[0] <= ai_score <= expected_range[1]
-
-            results.append({
-                "content": content,
-                "ai_response": ai_response,
-                "ai_score": ai_score,
-                "expected_range": expected_range,
-                "is_accurate": is_accurate
-      })
+        # Each case is identified by position + content, so edits to the dataset aren't mistaken for finished work
+        case_ids = [f"{index}:{hashlib.sha1(case['content'].encode('utf-8')).hexdigest()[:10]}"
+                    for index, case in enumerate(test_cases)]
+
+        signature = self._evaluation_signature()
+        if not resume and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        completed = self._load_checkpoint(checkpoint_path, signature)
+        pending = [(case_id, case) for case_id, case in zip(case_ids, test_cases) if case_id not in completed]
+        if completed:
+            print(f"Resuming: {len(test_cases) - len(pending)} cases already completed, {len(pending)} to go")
+
+        # Step 2: Test cases in parallel, checkpointing each result as soon as it finishes
+        errors = []
+        checkpoint_lock = threading.Lock()
+        with open(checkpoint_path, "a") as checkpoint, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._evaluate_case, case_id, case): (case_id, case) for case_id, case in pending}
+            for future in as_completed(futures):
+                case_id, case = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Failed cases aren't checkpointed, so a rerun retries them
+                    print(f"Case failed: \"{case['content'][:50]}\" ({type(e).__name__}: {e})")
+                    errors.append({"case_id": case_id, "content": case["content"], "error": f"{type(e).__name__}: {e}"})
+                    continue
+                completed[case_id] = result
+                with checkpoint_lock:
+                    checkpoint.write(json.dumps({"signature": signature, "result": result}) + "\n")
+                    checkpoint.flush()
+
+        results = [completed[case_id] for case_id in case_ids if case_id in completed]
 
         # Step 3: Generate accuracy report
         total_cases = len(results)
@@ -437,6 +1249,26 @@ class HingeAIModerator: # this is our main AI moderator.
         print(f"Overall accuracy: {accuracy_percentage:.1f}%")
         print(f"False positives: {len(false_positives)} (overly restrictive)")
         print(f"False negatives: {len(false_negatives)} (missed violations)")
+        if errors:
+            print(f"Failed cases: {len(errors)} (rerun to retry them)")
+
+        # Latency and token usage per case
+        latencies = [r["latency"] for r in results]
+        tokens_per_case = sum(r["tokens"] for r in results) / total_cases if total_cases > 0 else 0
+        completion_tokens_per_case = sum(r["completion_tokens"] for r in results) / total_cases if total_cases > 0 else 0
+        escalations = sum(1 for r in results if r["escalation"])
+        model_escalations = sum(1 for r in results if r["cascade_reason"])
+        cost_per_case = sum(r["cost"] for r in results) / total_cases if total_cases > 0 else 0
+        latency_stats = {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        }
+        print(f"Latency p50/p95/p99: {latency_stats['p50']:.2f}s / {latency_stats['p95']:.2f}s / {latency_stats['p99']:.2f}s")
+        print(f"Tokens per case: {tokens_per_case:.0f} ({completion_tokens_per_case:.0f} output)")
+        print(f"Cost per case: ${cost_per_case:.4f} ({model_escalations} of {total_cases} re-asked of a larger model)")
+        if self.compact:
+            print(f"Escalated to full reasoning: {escalations} of {total_cases}")
 
         if false_positives:
             print(f"\nTOP FALSE POSITIVES (AI too restrictive):")
@@ -453,25 +1285,94 @@ class HingeAIModerator: # this is our main AI moderator.
             "accuracy": accuracy_percentage,
             "false_positives": false_positives,
             "false_negatives": false_negatives,
+            "errors": errors,
             "summary": {
                 "total_cases": total_cases,
                 "accurate_cases": accurate_cases,
                 "fp_count": len(false_positives),
-                "fn_count": len(false_negatives)
+                "fn_count": len(false_negatives),
+                "error_count": len(errors),
+                "latency": latency_stats,
+                "tokens_per_case": tokens_per_case,
+                "completion_tokens_per_case": completion_tokens_per_case,
+                "escalations": escalations,
+                "model_escalations": model_escalations,
+                "cost_per_case": cost_per_case
             }
         }
 
+def compare_verdict_modes(workers=4):
+    """Run the evaluation set in full and compact mode; report accuracy, output tokens and latency for each"""
+    import tempfile
+
+    summaries = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("full", "compact"):
+            # No fast path, cache or near-duplicates, so every case reaches the model in both modes
+            moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None,
+                                         violation_history=ViolationHistory(), compact=mode == "compact")
+            results = moderator.run_evaluation(workers=workers, checkpoint_path=os.path.join(directory, f"{mode}.jsonl"),
+                                               resume=False)
+            summaries[mode] = results["summary"] | {"accuracy": results["accuracy"]}
+
+    full, compact = summaries["full"], summaries["compact"]
+    print(f"\n{'='*60}")
+    print(f"VERDICT MODES ({full['total_cases']} evaluation cases)")
+    print(f"{'='*60}")
+    print(f"{'mode':8} {'accuracy':>9} {'output tok':>11} {'total tok':>10} {'p50':>7} {'p95':>7} {'escalated':>10}")
+    for mode, summary in summaries.items():
+        escalated = f"{summary['escalations']}" if mode == "compact" else "-"
+        print(f"{mode:8} {summary['accuracy']:8.1f}% {summary['completion_tokens_per_case']:11.0f} "
+              f"{summary['tokens_per_case']:10.0f} {summary['latency']['p50']:6.2f}s {summary['latency']['p95']:6.2f}s "
+              f"{escalated:>10}")
+
+    def change(key, nested=None):
+        before = full[key][nested] if nested else full[key]
+        after = compact[key][nested] if nested else compact[key]
+        return after / before - 1 if before else 0.0
+
+    print(f"Compact vs. full: output tokens {change('completion_tokens_per_case'):+.0%}, "
+          f"total tokens {change('tokens_per_case'):+.0%}, latency p50 {change('latency', 'p50'):+.0%}, "
+          f"p95 {change('latency', 'p95'):+.0%}")
+    return summaries
+
 def main(): # this is where our program starts
      """Run the AI moderator demo"""
+     parser = argparse.ArgumentParser(description="Hinge moderation demo and evaluation")
+     parser.add_argument("--compact", action="store_true",
+                         help="ask for compact verdicts; full reasoning only for borderline, low-confidence or unparsed ones")
+     parser.add_argument("--compare-modes", action="store_true",
+                         help="evaluate in full and compact mode and report the output-token and latency reduction")
+     args = parser.parse_args()
+     if args.compare_modes:
+         compare_verdict_modes()
+         return
+
      print("=" * 50) # creates a line of equals signs
      print("HINGE MODERATION DEMO") #title
      print("=" * 50) # another line
 
-     moderator = HingeAIModerator() #create our AI moderator
+     moderator = HingeAIModerator(compact=args.compact) #create our AI moderator
+
+     # Show how the prompt splits into the cacheable system prefix and the per-request user message
+     for route, tokens in moderator.prompt_token_report().items():
+         print(f"{route} prompt: {tokens['system_tokens']} system tokens (static prefix"
+               f"{', cacheable' if tokens['prefix_cacheable'] else ''}) + {tokens['user_tokens']} user tokens")
 
      # Run evaluation against ground truth dataset
      results = moderator.run_evaluation()
-     print(f"Evaluated {len(results)} test cases")
+     print(f"Evaluated {results['summary']['total_cases']} test cases")
+
+     # Show how many API calls the verdict cache saved
+     cache_stats = moderator.cache_stats()
+     if cache_stats:
+         print(f"Verdict cache: {cache_stats['api_calls_saved']} API calls saved "
+               f"(hit rate {cache_stats['hit_rate']:.0%}, {cache_stats['evictions']} evictions)")
+     near_duplicate_stats = moderator.near_duplicate_stats()
+     if near_duplicate_stats:
+         print(f"Near-duplicate index: {near_duplicate_stats['hits']} inherited verdicts, "
+               f"{near_duplicate_stats['clusters']} clusters")
+     moderator.close()
 
         
 if __name__ == "__main__": # this runs when we execute the file
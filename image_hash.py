@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Image Hash - Perceptual hashes and a Hamming-distance index for uploaded images
+Scam and spam profiles reuse the same photos, re-cropped and re-compressed. A 64-bit dHash
+survives that, and a multi-index hash table finds every stored hash within a few bits
+without scanning them all, so near-duplicates reuse a verdict and known-bad photos are
+rejected before the vision call.
+"""
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import combinations
+
+from PIL import Image
+
+HASH_BITS = 64
+DUPLICATE_DISTANCE = 6  # dHash bits that may differ for "the same photo" (re-encode, resize, light crop)
+
+
+def dhash(image):
+    """64-bit difference hash: is each pixel brighter than its right neighbour on a 9x8 thumbnail"""
+    pixels = image.convert("L").resize((9, 8), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            offset = row * 9 + column
+            value = (value << 1) | (pixels[offset] < pixels[offset + 1])
+    return value
+
+
+def hamming_distance(first, second):
+    """Number of differing bits between two hashes"""
+    return (first ^ second).bit_count()
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(chunk_bits, max_flips):
+    """Every mask with at most max_flips bits set within one chunk"""
+    masks = [0]
+    for flips in range(1, max_flips + 1):
+        for positions in combinations(range(chunk_bits), flips):
+            masks.append(sum(1 << position for position in positions))
+    return tuple(masks)
+
+
+class MultiIndexHashTable:
+    """Hamming-radius search over 64-bit hashes (Norouzi et al. multi-index hashing)
+
+    Each hash is split into chunks and indexed once per chunk. If two hashes are within
+    r bits, at least one chunk differs by at most r // chunks bits, so a search only probes
+    the buckets near each query chunk and checks the few candidates it finds.
+    """
+
+    def __init__(self, bits=HASH_BITS, chunks=4):
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self._chunk_mask = (1 << self.chunk_bits) - 1
+        self._tables = [{} for _ in range(chunks)]
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def _split(self, hash_value):
+        return [(hash_value >> (index * self.chunk_bits)) & self._chunk_mask for index in range(self.chunks)]
+
+    def add(self, hash_value, value):
+        """Store (or replace) the value for a hash"""
+        if hash_value not in self._values:
+            for table, chunk in zip(self._tables, self._split(hash_value)):
+                table.setdefault(chunk, []).append(hash_value)
+        self._values[hash_value] = value
+
+    def remove(self, hash_value):
+        """Drop a stored hash (no-op if it isn't stored)"""
+        if hash_value not in self._values:
+            return
+        del self._values[hash_value]
+        for table, chunk in zip(self._tables, self._split(hash_value)):
+            bucket = table[chunk]
+            bucket.remove(hash_value)
+            if not bucket:
+                del table[chunk]
+
+    def search(self, hash_value, max_distance=DUPLICATE_DISTANCE):
+        """Return [(distance, hash, value)] for every stored hash within max_distance, closest first"""
+        masks = _flip_masks(self.chunk_bits, max_distance // self.chunks)
+        candidates = set()
+        for table, chunk in zip(self._tables, self._split(hash_value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+
+        matches = []
+        for candidate in candidates:
+            distance = (candidate ^ hash_value).bit_count()
+            if distance <= max_distance:
+                matches.append((distance, candidate, self._values[candidate]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def nearest(self, hash_value, max_distance=DUPLICATE_DISTANCE):
+        """Closest (distance, hash, value) within max_distance, or None"""
+        matches = self.search(hash_value, max_distance)
+        return matches[0] if matches else None
+
+
+def load_blocklist(path):
+    """Read known-bad hashes (one hex hash per line, # for comments) from a file"""
+    hashes = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                hashes.append(int(line, 16))
+    return hashes
+
+
+class ImageHashIndex:
+    """Known-bad blocklist plus previously judged images, both searched by Hamming distance
+
+    The blocklist is kept whole; judged images are bounded by max_entries, evicting the least
+    recently matched first (like NearDuplicateIndex).
+    """
+
+    def __init__(self, blocklist_path=None, max_distance=DUPLICATE_DISTANCE, max_entries=50_000):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._blocklist = MultiIndexHashTable()
+        self._verdicts = MultiIndexHashTable()
+        self._recency = OrderedDict()  # judged hash -> None, least recently used first
+        self.stats = {"blocked": 0, "verdict_reuses": 0, "misses": 0, "evictions": 0}
+        if blocklist_path and os.path.exists(blocklist_path):
+            for hash_value in load_blocklist(blocklist_path):
+                self._blocklist.add(hash_value, True)
+            print(f"Loaded {len(self._blocklist)} known-bad image hashes from {blocklist_path}")
+
+    def add_blocked(self, hash_value):
+        """Add a known-bad image hash"""
+        with self._lock:
+            self._blocklist.add(hash_value, True)
+
+    def check_blocklist(self, hash_value):
+        """Distance to the closest known-bad hash, or None if the image isn't blocklisted"""
+        with self._lock:
+            match = self._blocklist.nearest(hash_value, self.max_distance)
+            if match:
+                self.stats["blocked"] += 1
+        return match[0] if match else None
+
+    def find_verdict(self, hash_value):
+        """Verdict of the closest previously judged near-duplicate, or None"""
+        with self._lock:
+            match = self._verdicts.nearest(hash_value, self.max_distance)
+            self.stats["verdict_reuses" if match else "misses"] += 1
+            if match:
+                self._recency.move_to_end(match[1])
+        return match[2] if match else None
+
+    def add_verdict(self, hash_value, verdict):
+        """Remember the verdict for an image so its near-duplicates can reuse it"""
+        with self._lock:
+            self._verdicts.add(hash_value, verdict)
+            self._recency[hash_value] = None
+            self._recency.move_to_end(hash_value)
+            while len(self._recency) > self.max_entries:
+                oldest, _ = self._recency.popitem(last=False)
+                self._verdicts.remove(oldest)
+                self.stats["evictions"] += 1
+
+    def summary(self):
+        """Index sizes and lookup outcomes"""
+        with self._lock:
+            return {**self.stats, "blocklist_size": len(self._blocklist), "judged_images": len(self._verdicts)}
+
+
+def _flip_bits(hash_value, count, rng):
+    for position in rng.sample(range(HASH_BITS), count):
+        hash_value ^= 1 << position
+    return hash_value
+
+
+def main():
+    """Lookup latency at 1M stored hashes, plus a re-encoded photo matching its original"""
+    import io
+
+    rng = random.Random(7)
+    size = 1_000_000
+    hashes = [rng.getrandbits(HASH_BITS) for _ in range(size)]
+
+    start = time.perf_counter()
+    table = MultiIndexHashTable()
+    for index, hash_value in enumerate(hashes):
+        table.add(hash_value, index)
+    build_seconds = time.perf_counter() - start
+
+    print("=" * 60)
+    print(f"PERCEPTUAL HASH INDEX ({size:,} stored hashes)")
+    print("=" * 60)
+    print(f"Build: {build_seconds:.1f}s")
+
+    queries = 2000
+    near_queries = [_flip_bits(rng.choice(hashes), rng.randint(0, DUPLICATE_DISTANCE), rng) for _ in range(queries)]
+    miss_queries = [rng.getrandbits(HASH_BITS) for _ in range(queries)]
+    for name, batch in (("near-duplicate hit", near_queries), ("miss", miss_queries)):
+        latencies = []
+        found = 0
+        for query in batch:
+            start = time.perf_counter()
+            found += table.nearest(query) is not None
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"{name:20} p50 {latencies[len(latencies) // 2] * 1e6:7.1f} us | "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} us | found {found}/{queries}")
+
+    start = time.perf_counter()
+    query = near_queries[0]
+    min(hashes, key=lambda candidate: (candidate ^ query).bit_count())
+    print(f"{'linear scan':20} {(time.perf_counter() - start) * 1e3:7.1f} ms per lookup")
+
+    # The same photo re-encoded at a lower size and quality should land within the duplicate radius
+    photo = Image.effect_noise((64, 48), 80).convert("RGB").resize((1200, 900), Image.BICUBIC)
+    buffer = io.BytesIO()
+    photo.resize((600, 450)).save(buffer, format="JPEG", quality=60)
+    recompressed = Image.open(io.BytesIO(buffer.getvalue()))
+    print(f"\nRe-encoded photo distance: {hamming_distance(dhash(photo), dhash(recompressed))} bits "
+          f"(duplicate radius {DUPLICATE_DISTANCE})")
+    other = Image.effect_noise((64, 48), 80).convert("RGB")
+    print(f"Unrelated photo distance:  {hamming_distance(dhash(photo), dhash(other))} bits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Image Ingest - Validate, sanitize and downsize uploads before the vision call
+A 12 MB PNG used to go to GPT-4o as a ~16 MB base64 data URL labelled image/jpeg. The vision
+model never looks at more than 2048px (and 768px on the short side), so we resize to that,
+strip metadata and re-encode as a compact, correctly labelled JPEG.
+"""
+import base64
+import io
+import time
+import warnings
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from image_hash import dhash
+
+ALLOWED_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_PIXELS = 40_000_000          # anything bigger is a decompression bomb, not a profile photo
+HIGH_DETAIL_MAX_SIDE = 2048      # GPT-4o fits high-detail images into 2048x2048...
+HIGH_DETAIL_SHORT_SIDE = 768     # ...then scales the short side down to 768px
+LOW_DETAIL_MAX_SIDE = 512        # images this small gain nothing from "high" detail
+JPEG_QUALITY = 85
+
+
+class ImageRejectedError(ValueError):
+    """Raised when an upload isn't a safe, supported image"""
+
+
+class IngestedImage:
+    """A sanitized, resized image ready for the vision API"""
+    __slots__ = ("data", "mime_type", "detail", "width", "height", "original_bytes", "original_format", "perceptual_hash")
+
+    def __init__(self, data, mime_type, detail, width, height, original_bytes, original_format, perceptual_hash):
+        self.data = data
+        self.mime_type = mime_type
+        self.detail = detail
+        self.width = width
+        self.height = height
+        self.original_bytes = original_bytes
+        self.original_format = original_format
+        self.perceptual_hash = perceptual_hash  # 64-bit dHash of the upright, flattened image
+
+    def data_url(self):
+        """Base64 data URL for the image_url message part"""
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+
+def _target_size(width, height):
+    """Largest size the vision model will actually look at"""
+    scale = min(1.0, HIGH_DETAIL_MAX_SIDE / max(width, height), HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def ingest_image(raw_bytes, max_pixels=MAX_PIXELS):
+    """Validate and re-encode an upload; raises ImageRejectedError for anything unsafe or unsupported"""
+    if len(raw_bytes) > MAX_UPLOAD_BYTES:
+        raise ImageRejectedError(f"file is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            image = Image.open(io.BytesIO(raw_bytes))  # only reads the header - pixels are decoded on load()
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise ImageRejectedError("image looks like a decompression bomb")
+    except UnidentifiedImageError:
+        raise ImageRejectedError("file is not a recognized image")
+
+    if image.format not in ALLOWED_FORMATS:
+        raise ImageRejectedError(f"{image.format} images are not supported")
+
+    # Check the declared dimensions before decoding, so a tiny file can't expand into gigabytes
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageRejectedError(f"image dimensions {width}x{height} exceed the {max_pixels:,} pixel limit")
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            image.seek(0)  # first frame only for animated GIF/WebP
+            image.load()
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise ImageRejectedError("image looks like a decompression bomb")
+    except (OSError, SyntaxError, ValueError) as e:
+        raise ImageRejectedError(f"image is corrupt ({e})")
+
+    original_format = image.format
+    image = ImageOps.exif_transpose(image)  # apply camera rotation before the EXIF data is dropped
+
+    # Flatten transparency onto white - JPEG has no alpha channel and moderation doesn't need one
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    target = _target_size(*image.size)
+    if target != image.size:
+        image = image.resize(target, Image.LANCZOS)
+
+    # Saving a fresh RGB image without exif/icc arguments writes no metadata (GPS, camera, etc.)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+
+    detail = "low" if max(image.size) <= LOW_DETAIL_MAX_SIDE else "high"
+    return IngestedImage(
+        data=output.getvalue(),
+        mime_type="image/jpeg",
+        detail=detail,
+        width=image.size[0],
+        height=image.size[1],
+        original_bytes=len(raw_bytes),
+        original_format=original_format,
+        perceptual_hash=dhash(image),
+    )
+
+
+class _Upload(io.BytesIO):
+    """Minimal stand-in for a Streamlit UploadedFile"""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def main():
+    """Report upload size and end-to-end latency with and without ingestion"""
+    import os
+    from fake_openai_server import start_fake_server
+
+    # A noisy 12MP PNG - roughly what a phone screenshot or export looks like
+    noise = Image.effect_noise((4000, 3000), 40).convert("RGB")
+    buffer = io.BytesIO()
+    noise.save(buffer, format="PNG", compress_level=1)
+    raw_png = buffer.getvalue()
+
+    start = time.perf_counter()
+    ingested = ingest_image(raw_png)
+    ingest_ms = (time.perf_counter() - start) * 1000
+    before_payload = len(base64.b64encode(raw_png))
+    after_payload = len(ingested.data_url())
+
+    print("=" * 60)
+    print("IMAGE INGESTION")
+    print("=" * 60)
+    print(f"Original: {len(raw_png) / 1e6:.1f} MB {ingested.original_format}, base64 payload {before_payload / 1e6:.1f} MB")
+    print(f"Ingested: {ingested.width}x{ingested.height} {ingested.mime_type} (detail={ingested.detail}), "
+          f"payload {after_payload / 1e6:.2f} MB, {ingest_ms:.0f} ms to ingest")
+
+    bomb = io.BytesIO()
+    Image.new("1", (20000, 20000)).save(bomb, format="PNG")
+    try:
+        ingest_image(bomb.getvalue())
+    except ImageRejectedError as e:
+        print(f"Decompression bomb ({len(bomb.getvalue()) / 1e3:.0f} KB file) rejected: {e}")
+
+    server, base_url = start_fake_server(latency=0.2)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    from hinge_moderation_v2 import HingeAIModerator, IMAGE_MODEL
+
+    moderator = HingeAIModerator(use_cache=False)
+    start = time.perf_counter()
+    moderator.client.chat.completions.create(
+        model=IMAGE_MODEL,
+        messages=[{"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(raw_png).decode('utf-8')}"}},
+        ]}],
+    )
+    before_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    moderator.moderate_image(_Upload(raw_png, "noise.png"))
+    after_seconds = time.perf_counter() - start
+
+    print(f"End-to-end (fake server, 0.2s latency): {before_seconds:.2f}s raw upload vs {after_seconds:.2f}s with ingestion")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Keyword Router - Critical content matcher for the moderation router
+Small term lists (the built-in ones) are checked with one substring search per term,
+which is fastest at that size. Past LINEAR_SCAN_MAX_TERMS terms the matcher builds one
+Aho-Corasick automaton so each message is scanned once, no matter how many terms we track.
+Terms must start on a word boundary ("investment" doesn't match "reinvestment") but may
+run on into a longer word, so plurals and inflections ("nazis", "investments") still match.
+"""
+import random
+import string
+import time
+
+# Keywords and patterns that indicate critical content
+HATE_KEYWORDS = ['kill yourself', 'kys', 'hate all', 'hate women', 'hate men', 'nazi', 'hitler', 'supremacy', 'genocide', 'stupid bitch', 'fucking bitch', 'disgusting', 'go back to your', 'your country', 'racist', 'bigot', 'retard', 'faggot', 'nigger', 'wetback', 'chink']
+SELF_HARM_KEYWORDS = ['suicide', 'kill myself', 'want to die', 'self harm', 'cutting', 'bulimia', 'anorexia', 'overdose', 'end my life']
+FRAUD_KEYWORDS = ['send money', 'wire transfer', 'inheritance', 'lottery', 'investment opportunity', 'sugar daddy', 'sugar baby', 'cash app', 'venmo', 'send me $', 'investment']
+LINEAR_SCAN_MAX_TERMS = 80  # measured crossover (python keyword_router.py): per-term containment tests win below it
+
+CRITICAL_KEYWORDS = {
+    "hate_speech": HATE_KEYWORDS,
+    "self_harm": SELF_HARM_KEYWORDS,
+    "fraud": FRAUD_KEYWORDS,
+}
+
+
+def _is_word_char(char):
+    """True for characters that can't sit next to a term without breaking the word boundary"""
+    return char.isalnum() or char == "_"
+
+
+class KeywordMatcher:
+    """Categorized terms matched at word starts - a linear scan for small lists, Aho-Corasick for large ones"""
+
+    def __init__(self, keywords_by_category, linear_scan_max_terms=LINEAR_SCAN_MAX_TERMS):
+        # (category, term, needs a boundary before it) for the linear scan
+        self._terms = [(category, term.lower(), _is_word_char(term[0]))
+                       for category, terms in keywords_by_category.items() for term in terms if term]
+        self.term_count = len(self._terms)
+        self.uses_automaton = self.term_count > linear_scan_max_terms
+        # State 0 is the root; each state has goto edges, a failure link and the terms ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        if self.uses_automaton:
+            for category, term, _ in self._terms:
+                self._add_term(term, category)
+            self._build_failure_links()
+
+    def _add_term(self, term, category):
+        """Insert one term into the trie"""
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        # Only check the boundary when the term itself starts with a word character
+        self._output[state].append((category, term, len(term), _is_word_char(term[0])))
+
+    def _build_failure_links(self):
+        """Breadth-first pass that links every state to its longest proper suffix state"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # Inherit the suffix state's terms so matching never has to walk failure links
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def scan(self, content):
+        """Return {category: [matched terms]} for content (empty dict if nothing hits)"""
+        if not self.uses_automaton:
+            return self._linear_scan(content.lower())
+        return self._automaton_scan(content.lower())
+
+    def _linear_scan(self, text):
+        """One str.find per term, skipping occurrences that start inside a word"""
+        hits = {}
+        # A cheap containment test per term first; most messages hit nothing, so the boundary checks rarely run
+        for category, term, left_boundary in [entry for entry in self._terms if entry[1] in text]:
+            start = text.find(term)
+            while start != -1:
+                if not (left_boundary and start > 0 and _is_word_char(text[start - 1])):
+                    terms = hits.setdefault(category, [])
+                    if term not in terms:
+                        terms.append(term)
+                    break
+                start = text.find(term, start + 1)
+        return hits
+
+    def _automaton_scan(self, text):
+        """Scan the text once with the automaton"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        hits = {}
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not state or not output[state]:
+                continue
+
+            end = position + 1
+            for category, term, length, left_boundary in output[state]:
+                start = end - length
+                if left_boundary and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                terms = hits.setdefault(category, [])
+                if term not in terms:
+                    terms.append(term)
+        return hits
+
+    def scan_batch(self, contents):
+        """Scan a batch of messages, returning one hit dict per message in input order"""
+        scan = self.scan
+        return [scan(content) for content in contents]
+
+
+def _synthetic_terms(count, seed=7):
+    """Generate random multi-word terms to grow the automaton for benchmarking"""
+    rng = random.Random(seed)
+    terms = set()
+    while len(terms) < count:
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(rng.randint(1, 3))]
+        terms.add(" ".join(words))
+    return sorted(terms)
+
+
+def main():
+    """Micro-benchmark the linear scan against the automaton as the term list grows"""
+    import json
+
+    with open("evaluation_dataset.json", "r") as file:
+        messages = [case["content"] for case in json.load(file)]
+    messages += [
+        "I want to kill myself, nothing matters anymore",
+        "Send me $500 via Venmo and I'll send you nudes",
+        "You're disgusting, go back to your own country",
+        "Ask me about my reinvestment strategy over brunch",
+        "All the racists and nazis here, and now he wants investments",
+    ]
+    corpus = messages * 500
+
+    print("=" * 60)
+    print("KEYWORD ROUTER BENCHMARK")
+    print("=" * 60)
+    print(f"Messages per run: {len(corpus)}")
+
+    for extra_terms in (0, 40, 80, 2_000, 10_000):
+        keywords = dict(CRITICAL_KEYWORDS)
+        if extra_terms:
+            keywords["synthetic"] = _synthetic_terms(extra_terms)
+
+        timings = {}
+        for name, max_terms in (("linear", float("inf")), ("automaton", 0)):
+            build_start = time.perf_counter()
+            matcher = KeywordMatcher(keywords, linear_scan_max_terms=max_terms)
+            build_ms = (time.perf_counter() - build_start) * 1000
+            start = time.perf_counter()
+            matcher.scan_batch(corpus)
+            timings[name] = ((time.perf_counter() - start) / len(corpus) * 1e6, build_ms)
+
+        chosen = "automaton" if KeywordMatcher(keywords).uses_automaton else "linear"
+        print(f"\n{matcher.term_count} terms (default: {chosen})")
+        print(f"  Linear scan:  {timings['linear'][0]:8.2f} us/message")
+        print(f"  Aho-Corasick: {timings['automaton'][0]:8.2f} us/message (built in {timings['automaton'][1]:.1f}ms)")
+
+    matcher = KeywordMatcher(CRITICAL_KEYWORDS)
+    print("\nSample routing decisions:")
+    for content in messages[-5:]:
+        print(f"  {matcher.scan(content) or 'no critical terms'} <- \"{content}\"")
+
+
+if __name__ == "__main__":
+    main()
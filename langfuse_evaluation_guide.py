@@ -2,45 +2,33 @@
 """
 Langfuse Evaluation Guide - How to leverage tagged and scored traces
 """
-import os
 from dotenv import load_dotenv
-from langfuse import Langfuse
-from collections import Counter, defaultdict
+from langfuse_sync import open_synced_store
+from trace_analytics import (FALSE_POSITIVE_TAGS, cost_latency_by_tag, error_rates, export_evaluation_dataset,
+                             score_summary, scored_trace_count, tag_distribution)
+from collections import Counter
+import argparse
 import json
+import os
 
 def langfuse_evaluation_workflows():
     """Demonstrate key workflows for using tagged/scored traces in Langfuse"""
     load_dotenv()
 
-    langfuse = Langfuse(
-        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-        secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-        host=os.getenv("LANGFUSE_HOST")
-    )
-
     print("🎯 LANGFUSE EVALUATION WORKFLOWS")
     print("="*60)
 
-    # 1. Get all traces with tags and scores
-    traces = langfuse.api.trace.list().data
-    print(f"📊 Total traces available: {len(traces)}")
+    # 1. Sync every page into the local indexed store; the workflows below are queries against it
+    store = open_synced_store()
+    total_traces = store.count()
+    print(f"📊 Total traces available: {total_traces}")
 
     # 2. WORKFLOW 1: Tag-Based Filtering and Analysis
     print(f"\n🏷️  WORKFLOW 1: TAG-BASED ANALYSIS")
     print("-" * 40)
 
-    # Group traces by tags
-    tag_groups = defaultdict(list)
-    all_tags = []
-
-    for trace in traces:
-        if trace.tags:
-            all_tags.extend(trace.tags)
-            for tag in trace.tags:
-                tag_groups[tag].append(trace)
-
     # Show tag distribution
-    tag_counts = Counter(all_tags)
+    tag_counts = Counter(dict(tag_distribution(store)))
     print("Tag Distribution:")
     for tag, count in tag_counts.most_common():
         print(f"  {tag}: {count} traces")
@@ -49,51 +37,33 @@ def langfuse_evaluation_workflows():
     print(f"\n🚨 WORKFLOW 2: FALSE POSITIVE ANALYSIS")
     print("-" * 40)
 
-    fp_traces = []
-    for tag, trace_list in tag_groups.items():
-        if tag.startswith('fp_'):
-            fp_traces.extend(trace_list)
-            print(f"\n{tag} ({len(trace_list)} cases):")
-
-            # Calculate cost impact of false positives
-            total_cost = sum(getattr(trace, 'total_cost', 0) or 0 for trace in trace_list)
-            avg_latency = sum(getattr(trace, 'latency', 0) or 0 for trace in trace_list) / len(trace_list) if trace_list else 0
+    for entry in cost_latency_by_tag(store, FALSE_POSITIVE_TAGS):
+        print(f"\n{entry['tag']} ({entry['count']} cases):")
 
-            print(f"  Cost Impact: ${total_cost:.4f}")
-            print(f"  Avg Latency: {avg_latency:.2f}ms")
+        # Cost impact of false positives
+        print(f"  Cost Impact: ${entry['total_cost']:.4f}")
+        print(f"  Avg Latency: {entry['avg_latency']:.2f}s")
 
+    rates = error_rates(store)
     print(f"\n📈 FALSE POSITIVE SUMMARY:")
-    print(f"  Total FP traces: {len(fp_traces)}")
-    print(f"  FP Rate: {len(fp_traces)/len(traces)*100:.1f}%")
+    print(f"  Total FP traces: {rates['false_positives']}")
+    print(f"  FP Rate: {rates['fp_rate']*100:.1f}%")
 
     # 4. WORKFLOW 3: Score-Based Evaluation
     print(f"\n📊 WORKFLOW 3: SCORE-BASED EVALUATION")
     print("-" * 40)
 
-    # Analyze scores if available
-    scored_traces = [trace for trace in traces if hasattr(trace, 'scores') and trace.scores]
-    print(f"Traces with scores: {len(scored_traces)}")
+    scored_traces = scored_trace_count(store)
+    print(f"Traces with scores: {scored_traces}")
 
-    if scored_traces:
-        # Group by score types
-        score_types = set()
-        for trace in scored_traces:
-            for score in trace.scores:
-                score_types.add(score.name)
-
-        print(f"Score types found: {', '.join(score_types)}")
+    scores = score_summary(store)
+    if scores:
+        print(f"Score types found: {', '.join(entry['name'] for entry in scores)}")
 
         # Analyze each score type
-        for score_type in score_types:
-            values = []
-            for trace in scored_traces:
-                for score in trace.scores:
-                    if score.name == score_type:
-                        values.append(score.value)
-
-            if values:
-                avg_score = sum(values) / len(values)
-                print(f"  {score_type}: avg={avg_score:.2f}, count={len(values)}")
+        for entry in scores:
+            print(f"  {entry['name']}: avg={entry['avg']:.2f}, count={entry['count']}")
+    store.close()
 
     # 5. WORKFLOW 4: A/B Testing Setup
     print(f"\n🧪 WORKFLOW 4: A/B TESTING FRAMEWORK")
@@ -169,112 +139,56 @@ def langfuse_evaluation_workflows():
 
     return {
         'tag_distribution': tag_counts,
-        'fp_rate': len(fp_traces)/len(traces)*100,
-        'total_traces': len(traces),
-        'scored_traces': len(scored_traces)
+        'fp_rate': rates['fp_rate']*100,
+        'total_traces': total_traces,
+        'scored_traces': scored_traces
     }
 
 def export_tagged_traces_for_evaluation():
     """Export tagged traces as evaluation dataset"""
     load_dotenv()
 
-    langfuse = Langfuse(
-        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-        secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-        host=os.getenv("LANGFUSE_HOST")
-    )
-
-    traces = langfuse.api.trace.list().data
-
-    # Group by evaluation type
-    evaluation_dataset = {
-        'false_positives': [],
-        'true_positives': [],
-        'accurate_cases': [],
-        'borderline_cases': []
-    }
-
-    for trace in traces:
-        if trace.tags:
-            trace_data = {
-                'trace_id': trace.id,
-                'input': trace.input,
-                'output': trace.output,
-                'tags': trace.tags,
-                'timestamp': str(trace.timestamp),
-                'cost': getattr(trace, 'total_cost', 0)
-            }
-
-            # Categorize based on tags
-            if any(tag.startswith('fp_') for tag in trace.tags):
-                evaluation_dataset['false_positives'].append(trace_data)
-            elif any(tag.startswith('accurate_violation') for tag in trace.tags):
-                evaluation_dataset['true_positives'].append(trace_data)
-            elif any(tag.startswith('accurate_appropriate') for tag in trace.tags):
-                evaluation_dataset['accurate_cases'].append(trace_data)
-            elif any(tag.startswith('accurate_borderline') for tag in trace.tags):
-                evaluation_dataset['borderline_cases'].append(trace_data)
-
-    # Save to file
-    with open('langfuse_evaluation_dataset.json', 'w') as f:
-        json.dump(evaluation_dataset, f, indent=2)
+    # Categorized in SQL and streamed to the file, so this never holds every trace in memory
+    store = open_synced_store()
+    counts = export_evaluation_dataset(store, 'langfuse_evaluation_dataset.json')
+    store.close()
 
     print(f"📁 Exported evaluation dataset:")
-    for category, data in evaluation_dataset.items():
-        print(f"  {category}: {len(data)} traces")
+    for category, count in counts.items():
+        print(f"  {category}: {count} traces")
 
-def create_ab_test_framework():
-    """Create framework for A/B testing prompts using tagged data"""
+def create_ab_test_framework(cases_path='langfuse_evaluation_dataset.json', live=False):
+    """A/B test the prompt variants on the exported traces (or evaluation_dataset.json before any export)
 
-    ab_test_code = """
-# A/B Testing Framework for Prompt Optimization
+    Runs on the offline backend unless live=True - a live run calls the model API for every uncached answer.
+    """
+    from prompt_ab_test import (ab_test_moderator, compare, default_variants, load_cases, open_cache, print_report,
+                                run_ab_test, summarize)
 
-def run_ab_test(test_name, baseline_prompt, test_prompt, evaluation_traces):
-    '''Run A/B test comparing two prompts on evaluation data'''
-
-    results = {
-        'test_name': test_name,
-        'baseline': {'fp_count': 0, 'accuracy': 0, 'cost': 0},
-        'variant': {'fp_count': 0, 'accuracy': 0, 'cost': 0}
-    }
-
-    # Test both prompts on the same evaluation data
-    for trace_data in evaluation_traces:
-        # Run baseline
-        baseline_result = moderate_content(trace_data['content'], baseline_prompt)
-
-        # Run variant
-        variant_result = moderate_content(trace_data['content'], test_prompt)
-
-        # Score results against ground truth
-        baseline_score = evaluate_against_ground_truth(baseline_result, trace_data['expected'])
-        variant_score = evaluate_against_ground_truth(variant_result, trace_data['expected'])
-
-        # Track metrics
-        results['baseline']['accuracy'] += baseline_score['accuracy']
-        results['variant']['accuracy'] += variant_score['accuracy']
-
-        if baseline_score['false_positive']:
-            results['baseline']['fp_count'] += 1
-        if variant_score['false_positive']:
-            results['variant']['fp_count'] += 1
-
-    return results
-
-# Example usage:
-ab_test_results = run_ab_test(
-    'severity_calibration',
-    baseline_prompt='current_prompt',
-    test_prompt='severity_calibrated_prompt',
-    evaluation_traces=fp_severity_inflation_cases
-)
-"""
+    if not os.path.exists(cases_path):
+        cases_path = 'evaluation_dataset.json'
+    cases = load_cases(cases_path)
+    variants = default_variants()
 
     print("🧪 A/B TESTING FRAMEWORK")
     print("=" * 40)
-    print(ab_test_code)
+    print(f"{len(variants)} prompt variants x {len(cases)} cases from {cases_path} ({'live API' if live else 'offline'})")
+
+    # Answers are cached per (variant prompt, content), so rerunning only pays for new variants or cases
+    moderator = ab_test_moderator(offline=not live)
+    cache = open_cache('ab_test_cache.db' if live else 'ab_test_cache_offline.db')
+    results = run_ab_test(moderator, variants, cases, cache=cache)
+    cache.close()
+    summary = summarize(results)
+    print_report(summary, compare(results))
+    return summary
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Langfuse evaluation workflows")
+    parser.add_argument("--live-ab-test", action="store_true",
+                        help="run the A/B test against the model API (costs money; offline by default)")
+    args = parser.parse_args()
+
     print("Running Langfuse Evaluation Workflows...")
     results = langfuse_evaluation_workflows()
 
@@ -286,4 +200,4 @@ if __name__ == "__main__":
     print(f"\n" + "="*60)
     print("A/B TESTING FRAMEWORK")
     print("="*60)
-    create_ab_test_framework()
\ No newline at end of file
+    create_ab_test_framework(live=args.live_ab_test)
\ No newline at end of file
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Langfuse Sync - Paginated, concurrent, incremental trace download into a local store
+The analyzers used to call langfuse.api.trace.list() once and only saw the first page,
+re-downloading it on every run. This walks every page of the public traces API with a
+bounded thread pool, upserts traces into SQLite, and remembers a watermark so the next
+run only asks for traces newer than the last sync. Reviewers tag and score traces long
+after they're created and the traces API only filters on trace timestamps, so once every
+FULL_REFRESH_INTERVAL the sync re-reads everything to pick those edits up.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httpx
+
+PAGE_SIZE = 100
+MAX_WORKERS = 4
+SYNC_OVERLAP = timedelta(minutes=10)  # traces can land a little after their timestamp, so re-read this much
+FULL_REFRESH_INTERVAL = timedelta(hours=24)  # how stale tags and scores on older traces may get
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+_CAMEL_BOUNDARY = re.compile(r"(?<!^)(?=[A-Z])")
+
+
+def format_timestamp(moment):
+    """ISO 8601 in UTC with milliseconds, like Langfuse returns ("2025-09-29T08:42:52.123Z")"""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _snake_case(name):
+    return _CAMEL_BOUNDARY.sub("_", name).lower()
+
+
+def as_trace(raw):
+    """API JSON -> object with the SDK's snake_case attributes (trace.total_cost, score.name, ...)"""
+    fields = {_snake_case(key): value for key, value in raw.items()}
+    fields["scores"] = [SimpleNamespace(**{_snake_case(key): value for key, value in score.items()})
+                        if isinstance(score, dict) else score for score in fields.get("scores") or []]
+    return SimpleNamespace(**fields)
+
+
+class LangfuseTraceFetcher:
+    """Walks /api/public/traces page by page, fetching up to max_workers pages at once"""
+
+    def __init__(self, host, public_key, secret_key, page_size=PAGE_SIZE, max_workers=MAX_WORKERS, retries=3):
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self._http = httpx.Client(base_url=host.rstrip("/"), auth=(public_key, secret_key), timeout=30.0,
+                                  limits=httpx.Limits(max_connections=max_workers))
+        self.stats = {"pages": 0, "retries": 0}
+        self._lock = threading.Lock()
+
+    def fetch_page(self, page, from_timestamp=None, to_timestamp=None):
+        """One page, oldest first; returns (traces, meta)"""
+        params = {"page": page, "limit": self.page_size, "orderBy": "timestamp.asc"}
+        if from_timestamp:
+            params["fromTimestamp"] = from_timestamp
+        if to_timestamp:
+            params["toTimestamp"] = to_timestamp
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._http.get("/api/public/traces", params=params)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.retries:
+                    response.raise_for_status()
+                    body = response.json()
+                    with self._lock:
+                        self.stats["pages"] += 1
+                    return body["data"], body["meta"]
+            with self._lock:
+                self.stats["retries"] += 1
+            time.sleep(0.5 * 2 ** attempt)
+
+    def iter_pages(self, from_timestamp=None, to_timestamp=None):
+        """Yield each page's traces as it arrives (page order isn't guaranteed)
+
+        Page 1 tells us how many pages there are; the rest are fetched in parallel. Ascending
+        order plus a fixed to_timestamp keeps page boundaries stable while new traces arrive.
+        """
+        traces, meta = self.fetch_page(1, from_timestamp, to_timestamp)
+        yield traces
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.fetch_page, page, from_timestamp, to_timestamp)
+                       for page in range(2, meta["totalPages"] + 1)]
+            for future in as_completed(futures):
+                yield future.result()[0]
+
+    def close(self):
+        self._http.close()
+
+
+class TraceStore:
+    """SQLite copy of the Langfuse traces plus the sync watermark
+
+    Tags and scores live in their own indexed tables, and latency / cost are real columns,
+    so trace_analytics can answer distribution and rate questions with SQL instead of
+    loading every trace into Python. Tag and score rows carry a copy of the trace's
+    timestamp (and tags its latency and cost) so windowed aggregates never join back to traces.
+    """
+
+    def __init__(self, db_path="langfuse_traces.db"):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        # A local cache that can always be re-synced, so trade durability for write speed
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS traces (
+                id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, name TEXT, latency REAL, total_cost REAL, data TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS traces_timestamp ON traces (timestamp);
+            CREATE TABLE IF NOT EXISTS trace_tags (
+                tag TEXT NOT NULL, timestamp TEXT NOT NULL, trace_id TEXT NOT NULL, latency REAL, total_cost REAL,
+                PRIMARY KEY (tag, timestamp, trace_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS trace_tags_trace ON trace_tags (trace_id);
+            CREATE TABLE IF NOT EXISTS trace_scores (
+                name TEXT NOT NULL, timestamp TEXT NOT NULL, trace_id TEXT NOT NULL, value REAL);
+            CREATE INDEX IF NOT EXISTS trace_scores_name ON trace_scores (name, timestamp, value);
+            CREATE INDEX IF NOT EXISTS trace_scores_trace ON trace_scores (trace_id);
+            CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        self._migrate()
+        self._db.commit()
+
+    def _migrate(self):
+        """Stores written before tags/scores were indexed only have (id, timestamp, data) - backfill the rest"""
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(traces)")}
+        if "latency" in columns:
+            return
+        for column, kind in (("name", "TEXT"), ("latency", "REAL"), ("total_cost", "REAL")):
+            self._db.execute(f"ALTER TABLE traces ADD COLUMN {column} {kind}")
+        traces = [json.loads(data) for (data,) in self._db.execute("SELECT data FROM traces")]
+        self._write(traces)
+
+    def _write(self, traces):
+        ids = [(trace["id"],) for trace in traces]
+        self._db.executemany(
+            "INSERT INTO traces (id, timestamp, name, latency, total_cost, data) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET timestamp = excluded.timestamp, name = excluded.name, "
+            "latency = excluded.latency, total_cost = excluded.total_cost, data = excluded.data",
+            [(trace["id"], trace["timestamp"], trace.get("name"), trace.get("latency"), trace.get("totalCost"),
+              json.dumps(trace)) for trace in traces],
+        )
+        # Tags and scores are replaced wholesale - reviewers add and remove them after the fact
+        self._db.executemany("DELETE FROM trace_tags WHERE trace_id = ?", ids)
+        self._db.executemany("DELETE FROM trace_scores WHERE trace_id = ?", ids)
+        self._db.executemany(
+            "INSERT OR IGNORE INTO trace_tags (tag, timestamp, trace_id, latency, total_cost) VALUES (?, ?, ?, ?, ?)",
+            [(tag, trace["timestamp"], trace["id"], trace.get("latency"), trace.get("totalCost"))
+             for trace in traces for tag in trace.get("tags") or []])
+        self._db.executemany(
+            "INSERT INTO trace_scores (name, timestamp, trace_id, value) VALUES (?, ?, ?, ?)",
+            [(score["name"], trace["timestamp"], trace["id"], score.get("value"))
+             for trace in traces for score in trace.get("scores") or [] if isinstance(score, dict)])
+
+    def upsert(self, traces):
+        """Insert or refresh traces (tags and scores change after the fact); returns how many were new"""
+        traces = list(traces)
+        known = set()
+        for start in range(0, len(traces), 500):  # stay under SQLite's bound-parameter limit
+            chunk = [trace["id"] for trace in traces[start:start + 500]]
+            known.update(row[0] for row in self._db.execute(
+                f"SELECT id FROM traces WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        self._write(traces)
+        self._db.commit()
+        return len({trace["id"] for trace in traces} - known)
+
+    def count(self):
+        return self._db.execute("SELECT COUNT(*) FROM traces").fetchone()[0]
+
+    def query(self, sql, params=()):
+        """Run a read-only query against the store (used by trace_analytics)"""
+        return self._db.execute(sql, params)
+
+    def _state(self, key):
+        row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key, value):
+        self._db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+        self._db.commit()
+
+    def watermark(self):
+        """Timestamp of the newest trace synced so far, or None before the first sync"""
+        return self._state("watermark")
+
+    def set_watermark(self, timestamp):
+        self._set_state("watermark", timestamp)
+
+    def last_full_sync(self):
+        """When every trace (with its current tags and scores) was last re-read, or None"""
+        return self._state("last_full_sync")
+
+    def set_last_full_sync(self, timestamp):
+        self._set_state("last_full_sync", timestamp)
+
+    def load_traces(self, limit=-1):
+        """Stored traces (all by default), oldest first, with the same attributes as the SDK's trace objects"""
+        rows = self._db.execute("SELECT data FROM traces ORDER BY timestamp LIMIT ?", (limit,))
+        return [as_trace(json.loads(data)) for (data,) in rows]
+
+    def close(self):
+        self._db.close()
+
+
+def sync_traces(store, fetcher, full=False, refresh_interval=FULL_REFRESH_INTERVAL):
+    """Download traces newer than the store's watermark; returns a summary
+
+    Everything is re-read when full=True or the last full sync is older than refresh_interval
+    (None disables the refresh), which picks up tag and score edits on older traces.
+    """
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    last_full = store.last_full_sync()
+    if refresh_interval is not None and (last_full is None or now - parse_timestamp(last_full) >= refresh_interval):
+        full = True
+    watermark = None if full else store.watermark()
+    from_timestamp = format_timestamp(parse_timestamp(watermark) - SYNC_OVERLAP) if watermark else None
+    # Everything up to now, so pages don't shift under us while traces keep arriving
+    to_timestamp = format_timestamp(now)
+
+    fetched = new = 0
+    newest = watermark
+    for traces in fetcher.iter_pages(from_timestamp, to_timestamp):
+        if not traces:
+            continue
+        fetched += len(traces)
+        new += store.upsert(traces)
+        page_newest = max(trace["timestamp"] for trace in traces)
+        newest = max(newest, page_newest) if newest else page_newest
+    if newest:
+        store.set_watermark(newest)  # only after every page landed, so a failed sync is retried in full
+    if full:
+        store.set_last_full_sync(to_timestamp)
+    return {"fetched": fetched, "new": new, "total": store.count(), "watermark": newest, "full": full,
+            "seconds": time.perf_counter() - started}
+
+
+def fetcher_from_env(**kwargs):
+    """Fetcher for the project in LANGFUSE_HOST / LANGFUSE_PUBLIC_KEY / LANGFUSE_SECRET_KEY"""
+    return LangfuseTraceFetcher(os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com"),
+                                os.getenv("LANGFUSE_PUBLIC_KEY"), os.getenv("LANGFUSE_SECRET_KEY"), **kwargs)
+
+
+def open_synced_store(db_path=None):
+    """Sync the local store with Langfuse and return it open - what the analyzers query (caller closes it)"""
+    store = TraceStore(db_path or os.getenv("LANGFUSE_TRACE_DB", "langfuse_traces.db"))
+    fetcher = fetcher_from_env()
+    try:
+        summary = sync_traces(store, fetcher)
+    except Exception:
+        store.close()
+        raise
+    finally:
+        fetcher.close()
+    print(f"🔄 Synced {summary['fetched']} traces from Langfuse ({summary['new']} new, "
+          f"{summary['total']} stored{', full refresh' if summary['full'] else ''}) in {summary['seconds']:.1f}s")
+    return store
+
+
+def load_synced_traces(db_path=None):
+    """Sync the local store with Langfuse and return every trace"""
+    store = open_synced_store(db_path)
+    try:
+        return store.load_traces()
+    finally:
+        store.close()
+
+
+def main():
+    """Full and incremental sync of 100k traces from the fake Langfuse API"""
+    import tempfile
+    from fake_langfuse_server import start_fake_langfuse, synthetic_traces
+
+    # Traces run up to a few minutes ago, like a live project
+    count = 100_000
+    start = datetime.now(timezone.utc) - timedelta(seconds=32 * count)
+    traces = synthetic_traces(count, start=start)
+    server, host = start_fake_langfuse(traces, latency=0.02)
+
+    print("=" * 60)
+    print(f"LANGFUSE TRACE SYNC (fake API, {count:,} traces, {server.latency * 1000:.0f} ms per page)")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in (1, MAX_WORKERS, 16):
+            store = TraceStore(os.path.join(directory, f"traces-{workers}.db"))
+            fetcher = LangfuseTraceFetcher(host, server.public_key, server.secret_key, max_workers=workers)
+            summary = sync_traces(store, fetcher)
+            print(f"Full sync, {workers:2} workers: {summary['fetched']:,} traces, {fetcher.stats['pages']} pages "
+                  f"in {summary['seconds']:.1f}s")
+            fetcher.close()
+
+        # Next run: 500 new traces have arrived since the watermark
+        server.add_traces(synthetic_traces(500, start=parse_timestamp(traces[-1]["timestamp"]), seed=1,
+                                           interval_seconds=0.2))
+        fetcher = LangfuseTraceFetcher(host, server.public_key, server.secret_key)
+        requests_before = server.requests
+        summary = sync_traces(store, fetcher)
+        print(f"Incremental sync: {summary['fetched']} traces fetched ({summary['new']} new) in "
+              f"{server.requests - requests_before} requests, {summary['seconds']:.2f}s -> {summary['total']:,} stored")
+        loaded = store.load_traces()
+        print(f"Loaded {len(loaded):,} traces; latest {loaded[-1].id} at {loaded[-1].timestamp}, "
+              f"total_cost={loaded[-1].total_cost}")
+
+        # A reviewer re-tags the oldest trace: incremental syncs can't see it, the periodic full refresh does
+        oldest = server.traces[0]
+        oldest["tags"] = ["fp_dating_context"]
+        stale = sync_traces(store, fetcher)
+        tags = [tag for (tag,) in store.query("SELECT tag FROM trace_tags WHERE trace_id = ?", (oldest["id"],))]
+        print(f"Incremental sync after a re-tag: {stale['fetched']} traces fetched, stored tags {tags}")
+        summary = sync_traces(store, fetcher, refresh_interval=timedelta(0))
+        tags = [tag for (tag,) in store.query("SELECT tag FROM trace_tags WHERE trace_id = ?", (oldest["id"],))]
+        print(f"Full refresh: {summary['fetched']:,} traces in {summary['seconds']:.1f}s, stored tags {tags}")
+        fetcher.close()
+        store.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+LLM Backend - Pluggable source of chat completion clients
+OpenAIBackend talks to the real API (traced through Langfuse when it's installed).
+OfflineBackend answers in-process with format-compliant moderation responses, configurable
+latency, error rate and token counts, so the whole pipeline can be load tested without a
+key or a network. MODERATION_BACKEND=offline switches every entry point over.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from fake_verdicts import (extract_content, fake_assistant_message, fake_completion_text, fake_verdict_object,
+                           forced_tool_name, prompt_text, truncate_completion)
+
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=300)
+DAILY_REPORTS = 57_500  # Hinge's daily report volume
+
+_STATUS_ERRORS = {
+    400: openai.BadRequestError,
+    408: openai.APIStatusError,
+    409: openai.ConflictError,
+    429: openai.RateLimitError,
+    500: openai.InternalServerError,
+    503: openai.InternalServerError,
+}
+
+
+def _openai_module():
+    """The Langfuse-traced openai module when Langfuse is installed, otherwise the plain SDK"""
+    try:
+        from langfuse.openai import openai as traced_openai
+    except ImportError:
+        return openai
+    return traced_openai
+
+
+class OpenAIBackend:
+    """Real OpenAI clients; SDK retries are off because ResilientClient does its own"""
+    name = "openai"
+
+    def create_client(self):
+        module = _openai_module()
+        # keep a pool of warm keep-alive connections so repeat requests skip the TCP/TLS handshake
+        return module.OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=module.DefaultHttpxClient(limits=HTTP_POOL_LIMITS),
+            max_retries=0
+        )
+
+    def create_async_client(self):
+        return _openai_module().AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+class OfflineBackend:
+    """In-process stand-in for the chat completions API
+
+    Verdicts come from the same keyword rules as the fake server, so the same message always
+    gets the same answer. Latency and injected errors are drawn from an RNG seeded by the
+    prompt and how many times it has been sent, so a run is reproducible whatever order the
+    worker threads get to it.
+    """
+    name = "offline"
+
+    def __init__(self, latency=0.8, jitter=0.3, distribution="lognormal", error_rate=0.0, error_status=429,
+                 batch_drop_rate=0.0, chars_per_token=4, time_scale=1.0, score_noise=0.0, token_latency=0.0,
+                 model_profiles=None, seed=0):
+        self.latency = latency                  # median seconds per request
+        self.jitter = jitter                    # spread: lognormal sigma, or gaussian stddev as a fraction of latency
+        self.distribution = distribution        # "lognormal" (long tail, like the real API), "gaussian" or "constant"
+        self.error_rate = error_rate            # fraction of requests that fail with error_status
+        self.error_status = error_status
+        self.batch_drop_rate = batch_drop_rate  # fraction of packed-request entries left out of the JSON array
+        self.chars_per_token = chars_per_token
+        self.time_scale = time_scale            # fraction of the simulated latency actually slept (0.01 = 100x faster)
+        self.score_noise = score_noise          # fraction of prompts whose score is nudged, so prompt variants disagree
+        self.token_latency = token_latency      # extra seconds per completion token (generation time; ~0.03 for GPT-4)
+        self.model_profiles = model_profiles or {}  # model -> {"latency", "token_latency", "score_noise"} overrides
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self.stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.latencies = []  # simulated seconds per successful request
+
+    def _rng(self, prompt):
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        with self._lock:
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+        return random.Random(f"{self.seed}:{digest.hex()}:{attempt}")
+
+    def _sample_latency(self, rng, median):
+        if self.distribution == "constant":
+            return median
+        if self.distribution == "gaussian":
+            return max(0.0, rng.gauss(median, median * self.jitter))
+        if self.distribution == "lognormal":
+            return rng.lognormvariate(math.log(median), self.jitter)
+        raise ValueError(f"Unknown latency distribution: {self.distribution}")
+
+    def _nudge_score(self, prompt, text, model, score_noise):
+        """Shift the USER VIEW (or JSON verdict) score by 1-2 points for a score_noise fraction of prompts
+
+        Decided by the model and the whole prompt (system prompt included) and not the attempt, so
+        the same prompt always gets the same verdict while a reworded prompt or another model can
+        get a different one. Most nudged verdicts also report lower confidence, like a real model
+        that's unsure.
+        """
+        rng = random.Random(f"{self.seed}:noise:{model}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}")
+        if rng.random() >= score_noise:
+            return text
+        shift = rng.choice((-2, -1, 1, 2))
+        text = re.sub(r'(?m)(^Score: |"score": )(\d+)',
+                      lambda match: f"{match.group(1)}{min(10, max(1, int(match.group(2)) + shift))}", text)
+        if rng.random() < 0.6:
+            confidence = rng.randint(55, 79)
+            text = re.sub(r'(AI CONFIDENCE LEVEL: |"confidence": )(\d+)', lambda match: f"{match.group(1)}{confidence}", text)
+        return text
+
+    def _error(self):
+        request = httpx.Request("POST", "https://offline.invalid/v1/chat/completions")
+        headers = {"retry-after": "0.1"} if self.error_status == 429 else None
+        response = httpx.Response(self.error_status, request=request, headers=headers)
+        error_class = _STATUS_ERRORS.get(self.error_status, openai.APIStatusError)
+        return error_class("Injected offline fault", response=response, body=None)
+
+    def _plan(self, request):
+        """Decide one request's outcome: (simulated latency, error or None, completion text, usage, finish reason)"""
+        prompt = prompt_text(request.get("messages", []))
+        profile = self.model_profiles.get(request.get("model"), {})
+        rng = self._rng(prompt)
+        latency = self._sample_latency(rng, profile.get("latency", self.latency))
+        failed = rng.random() < self.error_rate
+        text = None
+        if not failed and forced_tool_name(request) is not None:
+            text = fake_verdict_object(extract_content(prompt))
+        elif not failed:
+            text = fake_completion_text(prompt, batch_drop_rate=self.batch_drop_rate, rng=rng)
+        score_noise = profile.get("score_noise", self.score_noise)
+        if text is not None and score_noise:
+            text = self._nudge_score(prompt, text, request.get("model"), score_noise)
+        with self._lock:
+            self.stats["requests"] += 1
+            if failed:
+                self.stats["errors"] += 1
+                return latency * self.time_scale, self._error(), None, None, None
+            text, finish_reason = truncate_completion(text, request.get("max_tokens"), self.chars_per_token)
+            usage = {"prompt_tokens": len(prompt) // self.chars_per_token,
+                     "completion_tokens": len(text) // self.chars_per_token}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            latency += usage["completion_tokens"] * profile.get("token_latency", self.token_latency)
+            self.stats["prompt_tokens"] += usage["prompt_tokens"]
+            self.stats["completion_tokens"] += usage["completion_tokens"]
+            self.latencies.append(latency)
+        return latency * self.time_scale, None, text, usage, finish_reason
+
+    @staticmethod
+    def _completion(request, text, usage, finish_reason="stop"):
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-offline-{random.getrandbits(48):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": fake_assistant_message(text, forced_tool_name(request)),
+                         "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+    def _stream(self, request, text, usage):
+        """Yield the completion ~4 characters per chunk, like the streaming API"""
+        base = {"id": f"chatcmpl-offline-{random.getrandbits(48):x}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "gpt-4")}
+        for start in range(0, len(text), 4):
+            yield ChatCompletionChunk.model_validate(
+                dict(base, choices=[{"index": 0, "delta": {"content": text[start:start + 4]}, "finish_reason": None}]))
+        yield ChatCompletionChunk.model_validate(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            yield ChatCompletionChunk.model_validate(dict(base, choices=[], usage=usage))
+
+    def _create(self, **request):
+        delay, error, text, usage, finish_reason = self._plan(request)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        if request.get("stream"):
+            return self._stream(request, text, usage)
+        return self._completion(request, text, usage, finish_reason)
+
+    async def _acreate(self, **request):
+        delay, error, text, usage, finish_reason = self._plan(request)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return self._completion(request, text, usage, finish_reason)
+
+    def create_client(self):
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._create)))
+
+    def create_async_client(self):
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._acreate)))
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)):
+        """Simulated request latency percentiles in seconds"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return {percentile: 0.0 for percentile in percentiles}
+        return {percentile: latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+                for percentile in percentiles}
+
+
+def backend_from_env():
+    """OfflineBackend when MODERATION_BACKEND=offline (tuned by OFFLINE_* variables), otherwise OpenAIBackend"""
+    name = os.getenv("MODERATION_BACKEND", "openai").lower()
+    if name == "openai":
+        return OpenAIBackend()
+    if name == "offline":
+        return OfflineBackend(
+            latency=float(os.getenv("OFFLINE_LATENCY", "0.8")),
+            error_rate=float(os.getenv("OFFLINE_ERROR_RATE", "0.0")),
+            time_scale=float(os.getenv("OFFLINE_TIME_SCALE", "1.0")),
+            score_noise=float(os.getenv("OFFLINE_SCORE_NOISE", "0.0")),
+            token_latency=float(os.getenv("OFFLINE_TOKEN_LATENCY", "0.0")),
+            seed=int(os.getenv("OFFLINE_SEED", "0")),
+        )
+    raise ValueError(f"Unknown MODERATION_BACKEND: {name}")
+
+
+def load_test_reports(count, seed=0):
+    """A report stream shaped like production: repeats, templated scam campaigns and critical content"""
+    from near_duplicate import campaign_messages
+
+    with open("evaluation_dataset.json", "r") as file:
+        ordinary_messages = [case["content"] for case in json.load(file)]
+    ordinary_messages += ["Send me $500 on cash app and I'll visit you", "I want to kill myself",
+                          "You people are disgusting, go back to your own country"]
+    rng = random.Random(seed)
+    openers = ["hey", "hi there", "so", "honestly", "lol", "ok"]
+    reports = []
+    for message in campaign_messages(rng, count, ordinary_messages):
+        if rng.random() < 0.3:
+            message = f"{rng.choice(openers)} {message.lower()} #{rng.randint(1, 10**6)}"  # a one-off variant
+        reports.append(message)
+    return reports
+
+
+def main():
+    """Load test the full text pipeline against the offline backend"""
+    import contextlib
+    import io
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from moderation_result import parse_moderation_response
+
+    parser = argparse.ArgumentParser(description="Offline load test of the moderation pipeline")
+    parser.add_argument("--reports", type=int, default=DAILY_REPORTS, help="reports to replay (default: one day)")
+    parser.add_argument("--workers", type=int, default=64, help="concurrent callers")
+    parser.add_argument("--latency", type=float, default=0.8, help="median simulated LLM latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="fraction of LLM calls answered with a 429")
+    parser.add_argument("--no-dedup", action="store_true", help="disable the verdict cache and near-duplicate index "
+                        "so every report that isn't fast-pathed reaches the backend")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="fraction of simulated latency actually slept")
+    args = parser.parse_args()
+
+    from hinge_moderation_v2 import HingeAIModerator
+
+    backend = OfflineBackend(latency=args.latency, error_rate=args.error_rate, batch_drop_rate=0.02,
+                             time_scale=args.time_scale)
+    reports = load_test_reports(args.reports)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["VERDICT_CACHE_PATH"] = os.path.join(directory, "verdict_cache.db")
+        if args.no_dedup:
+            moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None, backend=backend)
+        else:
+            moderator = HingeAIModerator(backend=backend)
+        moderator.client.limiter = None  # time is compressed, so the per-minute quota doesn't apply
+        moderator.client.base_delay *= args.time_scale
+        moderator.start_micro_batching(max_items=8, max_wait_ms=50 * args.time_scale)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor, contextlib.redirect_stdout(io.StringIO()):
+            records = list(executor.map(moderator.moderate_content_detailed, reports))  # per-message logging muted
+        seconds = time.perf_counter() - start
+        batch_summary = moderator.micro_batcher.summary()
+        moderator.stop_micro_batching()
+        if moderator.verdict_cache is not None:
+            moderator.verdict_cache.close()
+
+    sources = {}
+    for record in records:
+        sources[record["source"]] = sources.get(record["source"], 0) + 1
+    unparsed = sum(1 for record in records if record["source"] != "provider_unavailable"
+                   and parse_moderation_response(record["response"]).score is None)
+    percentiles = backend.latency_percentiles()
+
+    print("=" * 60)
+    print(f"OFFLINE LOAD TEST ({len(reports):,} reports, {args.workers} workers, time scale {args.time_scale}"
+          f"{', no dedup' if args.no_dedup else ''})")
+    print("=" * 60)
+    print(f"Wall time: {seconds:.1f}s | {len(reports) / seconds:,.0f} reports/s "
+          f"(a day is {DAILY_REPORTS:,}; {DAILY_REPORTS / 86400:.2f}/s on average)")
+    print("Outcomes: " + ", ".join(f"{source} {count}" for source, count in sorted(sources.items(), key=lambda item: -item[1])))
+    print(f"Unparseable verdicts: {unparsed}")
+    print(f"LLM requests: {backend.stats['requests']:,} ({backend.stats['errors']} injected 429s, "
+          f"{moderator.client.stats['retries']} retries) | avg batch {batch_summary['average_batch_size']:.1f}")
+    print(f"Tokens: {backend.stats['prompt_tokens'] + backend.stats['completion_tokens']:,} "
+          f"({(backend.stats['prompt_tokens'] + backend.stats['completion_tokens']) / len(reports):.0f} per report)")
+    print(f"Simulated LLM latency: p50 {percentiles[50]:.2f}s | p95 {percentiles[95]:.2f}s | p99 {percentiles[99]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
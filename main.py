@@ -5,14 +5,19 @@ Classifies user-generated content for Trust & Safety violations
 """
 
 import os
-from openai import OpenAI
+import json
 from dotenv import load_dotenv
+from llm_backend import backend_from_env
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize OpenAI client (MODERATION_BACKEND=offline runs without a key)
+client = backend_from_env().create_client()
+
+# The verdict fields take ~80 tokens and the summary is capped at 80 words, so 300 leaves headroom;
+# a response that still hits the cap is retried once with double the budget instead of returning cut-off JSON
+MAX_TOKENS = 300
 
 def moderate_content(text):
     """
@@ -22,7 +27,7 @@ def moderate_content(text):
         text (str): The content to moderate
 
     Returns:
-        dict: Classification results with reasoning
+        dict: Classification results with reasoning, or {"error": message} if no verdict came back
     """
 
     prompt = f"""
@@ -72,33 +77,39 @@ Respond in this exact JSON format:
     "confidence": 0.0-1.0,
     "context_type": "profile/message/report",
     "consent_indicators": "mutual/non_consensual/unclear",
-    "chain_of_thought": "your complete step-by-step analysis following the 5 steps above",
     "edge_case_flag": true/false,
-    "recommended_action": "allow/human_review/remove/account_action"
+    "recommended_action": "allow/human_review/remove/account_action",
+    "chain_of_thought": "one line per step above, at most 80 words in total"
 }}
 """
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a precise content moderation AI. Always respond with valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=500
-        )
-
-        return response.choices[0].message.content
+        for max_tokens in (MAX_TOKENS, MAX_TOKENS * 2):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "You are a precise content moderation AI. Always respond with valid JSON only."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},  # JSON mode: the reply always parses unless it's cut off
+                temperature=0.1,
+                max_tokens=max_tokens
+            )
+            choice = response.choices[0]
+            if choice.finish_reason != "length":
+                return json.loads(choice.message.content)
+            print(f"Response hit the {max_tokens}-token limit, retrying with a larger budget")
+
+        return {"error": f"response still truncated at {max_tokens} tokens"}
 
     except Exception as e:
-        return f"Error: {str(e)}"
+        return {"error": str(e)}
 
 def main():
     """Demo the content moderator"""
 
     # Check if API key is set
-    if not os.getenv("OPENAI_API_KEY"):
+    if not os.getenv("OPENAI_API_KEY") and os.getenv("MODERATION_BACKEND", "openai") != "offline":
         print("❌ Error: OPENAI_API_KEY environment variable not set!")
         print("Set it with: export OPENAI_API_KEY='your-api-key-here'")
         return
@@ -117,7 +128,10 @@ def main():
     for i, content in enumerate(test_content, 1):
         print(f"\n📝 Test Case {i}: '{content}'")
         result = moderate_content(content)
-        print(f"🤖 AI Response: {result}")
+        if "error" in result:
+            print(f"❌ Error: {result['error']}")
+        else:
+            print(f"🤖 AI Response: {json.dumps(result, indent=4)}")
         print("-" * 40)
 
 if __name__ == "__main__":
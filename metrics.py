@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Metrics - Per-stage timing spans, latency histograms and counters for the moderator
+Langfuse only sees the OpenAI call. This records how long every stage of a request takes
+(fast path, routing, prompt building, cache, network, storing) per route, and exports the
+totals as Prometheus text or a JSON snapshot. NULL_RECORDER turns it all into no-ops.
+"""
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds - from sub-millisecond local stages up to slow vision calls
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+FALLBACK_OUTCOMES = {"provider_unavailable", "safety_filter", "rejected", "invalid_request", "error"}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of raw samples (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100)) # ceiling without importing math
+    return ordered[int(rank) - 1]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus style)"""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+
+class StageTimer:
+    """Lap timer for one request: each lap() closes the span for the stage that just ran"""
+    __slots__ = ("spans", "_start", "_last")
+
+    def __init__(self):
+        self.spans = []
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.spans.append((stage, now - self._last))
+        self._last = now
+
+    def total(self):
+        return time.perf_counter() - self._start
+
+
+class _Span:
+    """Context manager that observes its own duration"""
+    __slots__ = ("recorder", "stage", "route", "_start")
+
+    def __init__(self, recorder, stage, route):
+        self.recorder, self.stage, self.route = recorder, stage, route
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.observe(self.stage, self.route, time.perf_counter() - self._start)
+
+
+class MetricsRecorder:
+    """Thread-safe stage histograms and outcome counters, labelled by route"""
+    enabled = True
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}  # (stage, route) -> Histogram
+        self._counters = {}    # (route, outcome) -> count
+
+    def timer(self):
+        """Start timing a request's stages"""
+        return StageTimer()
+
+    def span(self, stage, route):
+        """Time a block: with recorder.span("parse", "general"): ..."""
+        return _Span(self, stage, route)
+
+    def _histogram(self, stage, route):
+        histogram = self._histograms.get((stage, route))
+        if histogram is None:
+            histogram = self._histograms[(stage, route)] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, stage, route, seconds):
+        with self._lock:
+            self._histogram(stage, route).observe(seconds)
+
+    def finish(self, timer, route, outcome):
+        """Record a finished request: every stage span, the total, and the outcome counter"""
+        if outcome in FALLBACK_OUTCOMES:
+            route = "fallback"
+        total = timer.total()
+        with self._lock:
+            for stage, seconds in timer.spans + [("total", total)]:
+                self._histogram(stage, route).observe(seconds)
+            self._counters[(route, outcome)] = self._counters.get((route, outcome), 0) + 1
+
+    def snapshot(self):
+        """JSON-ready summary: per (stage, route) counts and latency estimates, plus outcome counters"""
+        with self._lock:
+            stages = [
+                {"stage": stage, "route": route, "count": histogram.count, "total_seconds": histogram.sum,
+                 "mean_ms": histogram.sum / histogram.count * 1e3,
+                 "p50_ms": histogram.quantile(0.5) * 1e3, "p95_ms": histogram.quantile(0.95) * 1e3,
+                 "p99_ms": histogram.quantile(0.99) * 1e3}
+                for (stage, route), histogram in sorted(self._histograms.items())
+            ]
+            counters = [{"route": route, "outcome": outcome, "count": count}
+                        for (route, outcome), count in sorted(self._counters.items())]
+        return {"stages": stages, "requests": counters}
+
+    def prometheus_text(self, prefix="moderation"):
+        """Prometheus text exposition format"""
+        lines = [f"# HELP {prefix}_stage_seconds Time spent in each moderation stage",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        with self._lock:
+            for (stage, route), histogram in sorted(self._histograms.items()):
+                labels = f'stage="{stage}",route="{route}"'
+                cumulative = 0
+                for bound, bucket_count in zip(list(histogram.bounds) + ["+Inf"], histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {histogram.count}")
+            lines += [f"# HELP {prefix}_requests_total Moderation requests by route and outcome",
+                      f"# TYPE {prefix}_requests_total counter"]
+            for (route, outcome), count in sorted(self._counters.items()):
+                lines.append(f'{prefix}_requests_total{{route="{route}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullRecorder:
+    """Drop-in recorder that records nothing - the default, so disabled metrics cost one no-op call per stage"""
+    enabled = False
+    _timer = _NullTimer()
+    _span = _NullSpan()
+
+    def timer(self):
+        return self._timer
+
+    def span(self, stage, route):
+        return self._span
+
+    def observe(self, stage, route, seconds):
+        pass
+
+    def finish(self, timer, route, outcome):
+        pass
+
+    def snapshot(self):
+        return {"stages": [], "requests": []}
+
+    def prometheus_text(self, prefix="moderation"):
+        return ""
+
+
+NULL_RECORDER = NullRecorder()
+NULL_TIMER = NullRecorder._timer
+
+
+def start_metrics_server(recorder, port=9464):
+    """Serve /metrics (Prometheus) and /metrics.json on a background thread; returns the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = recorder.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(recorder.snapshot()).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    """Per-stage breakdown over the offline backend, plus the cost of metrics on and off"""
+    import contextlib
+    import io
+    from hinge_moderation_v2 import HingeAIModerator
+    from llm_backend import OfflineBackend, load_test_reports
+
+    reports = load_test_reports(3000)
+    overhead = {}
+    for collect_metrics in (False, True, False, True):  # alternate and keep the best, to even out warm-up
+        backend = OfflineBackend(latency=0.8, time_scale=0.0)  # no sleeping - this measures local CPU only
+        moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None, backend=backend,
+                                     collect_metrics=collect_metrics)
+        moderator.client.limiter = None  # nothing is sent anywhere, so there's no quota to respect
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for content in reports:
+                moderator.moderate_content_detailed(content)
+            seconds = (time.perf_counter() - start) / len(reports)
+            overhead[collect_metrics] = min(seconds, overhead.get(collect_metrics, seconds))
+
+    print("=" * 60)
+    print(f"STAGE METRICS (offline backend, {len(reports)} reports)")
+    print("=" * 60)
+    print(f"{'stage':16} {'route':12} {'count':>6} {'mean ms':>9} {'p95 ms':>9}")
+    for entry in moderator.metrics.snapshot()["stages"]:
+        print(f"{entry['stage']:16} {entry['route']:12} {entry['count']:>6} {entry['mean_ms']:>9.3f} {entry['p95_ms']:>9.3f}")
+    print("\nOutcomes: " + ", ".join(f"{entry['route']}/{entry['outcome']} {entry['count']}"
+                                    for entry in moderator.metrics.snapshot()["requests"]))
+    print(f"\nPer-request time: metrics off {overhead[False] * 1e6:.1f} us | on {overhead[True] * 1e6:.1f} us "
+          f"({(overhead[True] - overhead[False]) * 1e6:+.1f} us)")
+    print("\nPrometheus sample:")
+    print("\n".join(line for line in moderator.metrics.prometheus_text().splitlines()
+                    if "_bucket" not in line and 'stage="total"' in line or "requests_total{" in line))
+
+
+if __name__ == "__main__":
+    main()
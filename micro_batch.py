@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Micro Batch - Pack several low-risk messages into one moderation request
+Callers submit one message at a time; a background thread collects up to max_items or
+waits up to max_wait_ms, sends one request that asks for an indexed JSON array of
+verdicts, and hands each caller its own entry back.
+"""
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+REQUIRED_FIELDS = ("score", "category", "analysis", "policy_reference")
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def create_batch_user_message(contents):
+    """One line per item; contents are JSON-quoted so a message can't fake another index"""
+    lines = [f"[{index}] {json.dumps(content, ensure_ascii=False)}" for index, content in enumerate(contents)]
+    return "Items to analyze (one verdict per index):\n" + "\n".join(lines)
+
+
+def parse_batch_response(text, count):
+    """Return {index: entry} for every well-formed entry in a JSON array response
+
+    Entries that are missing, duplicated, out of range or lack a valid score and the
+    USER VIEW fields are left out, so the caller can retry them one at a time.
+    """
+    try:
+        entries = json.loads(_CODE_FENCE.sub("", (text or "").strip()))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(entries, list):
+        return {}
+
+    verdicts = {}
+    for entry in entries:
+        if not _valid_verdict(entry):
+            continue
+        index = entry.get("index")
+        if not isinstance(index, int) or not 0 <= index < count or index in verdicts:
+            continue
+        verdicts[index] = entry
+    return verdicts
+
+
+def parse_verdict_object(text):
+    """Return the verdict from a single JSON object response (compact mode), or None if it's malformed"""
+    try:
+        entry = json.loads(_CODE_FENCE.sub("", (text or "").strip()))
+    except json.JSONDecodeError:
+        return None
+    return entry if _valid_verdict(entry) else None
+
+
+def _valid_verdict(entry):
+    """A dict with every USER VIEW field and an integer 1-10 score"""
+    if not isinstance(entry, dict) or any(field not in entry for field in REQUIRED_FIELDS):
+        return False
+    score = entry.get("score")
+    return isinstance(score, int) and not isinstance(score, bool) and 1 <= score <= 10
+
+
+def batch_verdict_text(entry):
+    """Render one JSON verdict in the same STEP 5 + USER VIEW shape as a single-item response"""
+    confidence = entry.get("confidence")
+    confidence_line = f"- AI CONFIDENCE LEVEL: {confidence}%\n" if isinstance(confidence, (int, float)) else ""
+    return f"""STEP 5: Confidence and Escalation
+{confidence_line}
+USER VIEW (for display to content creator):
+Score: {entry['score']}
+Category: {entry['category']}
+Analysis: {entry['analysis']}
+Policy Reference: {entry['policy_reference']}"""
+
+
+class MicroBatcherClosedError(RuntimeError):
+    """submit() was called after close() - the item was not queued"""
+
+
+class MicroBatcher:
+    """Collects submitted items into batches of up to max_items, waiting at most max_wait_ms
+
+    process_batch(items) must return one result per item, in order. Up to max_in_flight
+    batches are processed at once, so a slow request doesn't stall the next batch.
+    """
+
+    def __init__(self, process_batch, max_items=8, max_wait_ms=50, max_in_flight=4):
+        self.process_batch = process_batch
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"batches": 0, "items": 0, "full_flushes": 0, "timeout_flushes": 0}
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue an item; returns a Future for its result (raises MicroBatcherClosedError after close())"""
+        future = Future()
+        with self._lock:  # checked and queued together, so nothing lands behind the stop marker
+            if self._closed:
+                raise MicroBatcherClosedError("MicroBatcher is closed")
+            self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._queue.put(None)  # finish this batch, then stop
+                    break
+                batch.append(entry)
+
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["items"] += len(batch)
+                self.stats["full_flushes" if len(batch) == self.max_items else "timeout_flushes"] += 1
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.process_batch(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def summary(self):
+        """Batch counters plus the average batch size"""
+        with self._lock:
+            batches = self.stats["batches"]
+            return {**self.stats, "average_batch_size": self.stats["items"] / batches if batches else 0.0}
+
+    def close(self):
+        """Flush anything queued and stop the background thread; later submit() calls raise"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+
+def main():
+    """Compare throughput and tokens per item for single-item calls vs. micro-batching"""
+    import os
+    from fake_openai_server import start_fake_server
+
+    server, base_url = start_fake_server(latency=0.5, batch_drop_rate=0.05)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    from hinge_moderation_v2 import HingeAIModerator
+
+    with open("evaluation_dataset.json", "r") as file:
+        dataset = [case["content"] for case in json.load(file)]
+
+    results = {}
+    for mode in ("single-item", "micro-batched"):
+        moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None)
+        contents = [content for content in dataset * 4 if not moderator.detect_critical_content(content)]
+        if mode == "micro-batched":
+            moderator.start_micro_batching(max_items=8, max_wait_ms=50)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as executor:  # 16 concurrent callers, like web workers
+            records = list(executor.map(moderator.moderate_content_detailed, contents))
+        seconds = time.perf_counter() - start
+        batch_summary = moderator.micro_batcher.summary() if moderator.micro_batcher else None
+        moderator.stop_micro_batching()
+        tokens = sum(record["prompt_tokens"] + record["completion_tokens"] for record in records)
+        fallbacks = sum(record["source"] == "llm" for record in records) if batch_summary else 0
+        requests = batch_summary["batches"] + fallbacks if batch_summary else len(contents)
+        results[mode] = (len(contents) / seconds, tokens / len(contents), requests / len(contents), batch_summary, fallbacks)
+
+    print(f"\n{'='*60}")
+    print("MICRO-BATCHING (fake server, 0.5s mean latency, 5% dropped entries, 16 concurrent callers)")
+    print(f"{'='*60}")
+    for mode, (throughput, tokens_per_item, requests_per_item, batch_summary, fallbacks) in results.items():
+        line = f"{mode:14} {throughput:6.2f} items/s | {tokens_per_item:6.0f} tokens/item | {requests_per_item:.2f} requests/item"
+        if batch_summary:
+            line += f" | avg batch {batch_summary['average_batch_size']:.1f}, {fallbacks} single-item fallbacks"
+        print(line)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Model Cascade - Cheap model first, the larger model only when the verdict needs it
+A cascade asks the first tier (e.g. gpt-4o-mini) and re-asks the next tier up only when
+the route is critical (those start at the top), the score lands in the borderline band,
+or the reported confidence is below the threshold. Production stays on gpt-4 alone until
+the cheaper cascade has matched its accuracy on the live model (python model_cascade.py);
+MODEL_CASCADE_SETTING opts in to one of the evaluated settings. Tiers, thresholds and the
+settings the evaluation compares all live in model_cascade.json (MODEL_CASCADE_CONFIG
+points somewhere else).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+from verdict_cache import prompt_version
+
+# USD per 1M (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4": (30.00, 60.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+CHEAP_FIRST_SETTING = "cascade: band 4-6 + confidence < 0.8"  # the gpt-4o-mini-first cascade in model_cascade.json
+DEFAULT_CONFIG = {  # used when there's no config file: gpt-4 for everything, as before
+    "tiers": ["gpt-4"],
+    "critical_routes": ["specialized"],
+    "borderline_scores": [4, 6],
+    "min_confidence": 0.8,
+}
+# Offline stand-ins for the tiers: the small model answers faster and gets more verdicts wrong
+OFFLINE_MODEL_PROFILES = {
+    "gpt-4": {"latency": 1.2, "token_latency": 0.03, "score_noise": 0.05},
+    "gpt-4o": {"latency": 0.6, "token_latency": 0.012, "score_noise": 0.1},
+    "gpt-4o-mini": {"latency": 0.4, "token_latency": 0.008, "score_noise": 0.3},
+}
+
+
+def request_cost(model, prompt_tokens, completion_tokens):
+    """USD for one request (unknown models are priced like gpt-4)"""
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4"])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+class ModelCascade:
+    """Which model judges a message first, and when its verdict goes to the next tier up"""
+
+    def __init__(self, tiers, critical_routes=("specialized",), borderline_scores=(4, 6), min_confidence=0.8):
+        if not tiers:
+            raise ValueError("A model cascade needs at least one tier")
+        self.tiers = list(tiers)                      # cheapest first
+        self.critical_routes = set(critical_routes)   # routes that start at the top tier
+        self.borderline_scores = tuple(borderline_scores) if borderline_scores else None  # inclusive, None disables
+        self.min_confidence = min_confidence          # 0-1, None disables
+        # Part of the verdict cache key: a verdict may come from any tier, so the key covers the whole cascade
+        self.version = "cascade:" + prompt_version(json.dumps(
+            [self.tiers, sorted(self.critical_routes), self.borderline_scores, self.min_confidence]))
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["tiers"], critical_routes=config.get("critical_routes", ()),
+                   borderline_scores=config.get("borderline_scores"), min_confidence=config.get("min_confidence"))
+
+    def __repr__(self):
+        return (f"ModelCascade(tiers={self.tiers!r}, critical_routes={sorted(self.critical_routes)!r}, "
+                f"borderline_scores={self.borderline_scores!r}, min_confidence={self.min_confidence!r})")
+
+    @property
+    def top_model(self):
+        return self.tiers[-1]
+
+    def first_model(self, route):
+        """Critical routes skip straight to the top tier - a cheap answer there would be re-asked anyway"""
+        return self.top_model if route in self.critical_routes else self.tiers[0]
+
+    def next_model(self, model, route, verdict):
+        """(next model, reason) when verdict (a ModerationResult from model) should be re-asked, otherwise None"""
+        tier = self.tiers.index(model) if model in self.tiers else len(self.tiers) - 1
+        if tier == len(self.tiers) - 1:
+            return None
+        reason = None
+        if route in self.critical_routes:
+            reason = "critical_route"
+        elif verdict.score is None:
+            reason = "unparsed"
+        elif self.borderline_scores and self.borderline_scores[0] <= verdict.score <= self.borderline_scores[1]:
+            reason = "borderline"
+        elif self.min_confidence is not None and (verdict.confidence is None or verdict.confidence < self.min_confidence):
+            reason = "low_confidence"
+        return (self.tiers[tier + 1], reason) if reason else None
+
+
+def load_cascade_config(path=None):
+    """The cascade config file (MODEL_CASCADE_CONFIG, default model_cascade.json), or DEFAULT_CONFIG if there is none"""
+    path = path or os.getenv("MODEL_CASCADE_CONFIG", "model_cascade.json")
+    if not os.path.exists(path):
+        return dict(DEFAULT_CONFIG)
+    with open(path, "r") as file:
+        return {**DEFAULT_CONFIG, **json.load(file)}
+
+
+def cascade_from_env(setting=None):
+    """The production cascade from the config file, with a named setting's overrides (MODEL_CASCADE_SETTING) if given"""
+    config = load_cascade_config()
+    setting = setting or os.getenv("MODEL_CASCADE_SETTING")
+    if setting:
+        if setting not in config.get("settings", {}):
+            raise ValueError(f"Unknown model cascade setting: {setting!r}")
+        config = {**config, **config["settings"][setting]}
+    return ModelCascade.from_config(config)
+
+
+def evaluation_settings(config):
+    """{name: ModelCascade} for every setting in the config's "settings" (each overrides the production cascade)"""
+    base = {key: value for key, value in config.items() if key != "settings"}
+    settings = {name: ModelCascade.from_config({**base, **overrides})
+                for name, overrides in config.get("settings", {}).items()}
+    return settings or {"production": ModelCascade.from_config(base)}
+
+
+def evaluate_settings(settings, backend=None, workers=8):
+    """Run the evaluation set once per cascade setting; returns {name: summary with accuracy, cost and latency}"""
+    from enforcement import ViolationHistory
+    from hinge_moderation_v2 import HingeAIModerator
+
+    summaries = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, cascade in settings.items():
+            with contextlib.redirect_stdout(io.StringIO()):  # per-message logging muted
+                # No fast path, cache or near-duplicates, so every case reaches the cascade
+                moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None,
+                                             backend=backend, violation_history=ViolationHistory(), cascade=cascade)
+                if backend is not None:
+                    moderator.client.limiter = None
+                results = moderator.run_evaluation(workers=workers, resume=False,
+                                                   checkpoint_path=os.path.join(directory, "checkpoint.jsonl"))
+            summaries[name] = results["summary"] | {"accuracy": results["accuracy"]}
+            print(f"  {name}: done ({summaries[name]['total_cases']} cases)")
+    return summaries
+
+
+def main():
+    """Compare accuracy against cost and latency for each cascade setting in the config"""
+    from llm_backend import OfflineBackend
+
+    parser = argparse.ArgumentParser(description="Evaluate model cascade settings on the evaluation set")
+    parser.add_argument("--config", help="cascade config file (default: MODEL_CASCADE_CONFIG or model_cascade.json)")
+    parser.add_argument("--offline", action="store_true",
+                        help="use the offline backend with OFFLINE_MODEL_PROFILES instead of the API")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    config = load_cascade_config(args.config)
+    settings = evaluation_settings(config)
+    backend = OfflineBackend(model_profiles=OFFLINE_MODEL_PROFILES) if args.offline else None
+    print(f"Evaluating {len(settings)} cascade settings{' (offline)' if args.offline else ''}...")
+    summaries = evaluate_settings(settings, backend=backend, workers=args.workers)
+
+    print(f"\n{'='*96}")
+    print("MODEL CASCADE: ACCURACY VS COST AND LATENCY (evaluation set)")
+    print(f"{'='*96}")
+    print(f"{'setting':40} {'accuracy':>9} {'FP/FN':>6} {'$/1k cases':>11} {'p50':>7} {'p95':>7} {'escalated':>10}")
+    for name, summary in summaries.items():
+        escalated = summary["model_escalations"] / summary["total_cases"] if summary["total_cases"] else 0.0
+        print(f"{name:40} {summary['accuracy']:8.1f}% {summary['fp_count']:>2}/{summary['fn_count']:<3} "
+              f"{summary['cost_per_case'] * 1000:11.2f} {summary['latency']['p50']:6.2f}s {summary['latency']['p95']:6.2f}s "
+              f"{escalated:10.0%}")
+    if args.offline:
+        print("\nOffline: per-model latency and error rates are OFFLINE_MODEL_PROFILES, not measurements.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Moderation Result - Typed parser for moderation responses
+Turns a raw chain-of-thought response into a compact ModerationResult, shared by the
+evaluator, the streaming parser and the Streamlit UI. Only the USER VIEW section is parsed
+up front; a field it doesn't have is looked up in the reasoning above it when it's first read.
+"""
+import random
+import re
+import time
+
+_KEYS = ("Score", "Category", "Analysis", "Policy Reference", "Action", "AI Confidence Level", "User Violation History")
+
+# One compiled pattern for every line we care about: the USER VIEW marker or a "Field: value" line.
+# Leading bullets/markdown are tolerated, so "- AI CONFIDENCE LEVEL: 95%" and "**Action:** ..." both match.
+# Lines are anchored on a literal "\n" (callers prepend one) rather than re.MULTILINE "^", which lets the
+# regex engine skip straight from newline to newline; keys are matched in their title and upper case forms
+# for the same reason.
+RESPONSE_LINE = re.compile(
+    r"\n[ \t>*\-•]*(?:(?P<marker>USER VIEW)"
+    r"|(?P<key>" + "|".join(f"{key}|{key.upper()}" for key in _KEYS) + r")"
+    r"\**[ \t]*:[ \t]*(?P<value>[^\n]*))"
+)
+FIELD_NAMES = {
+    "score": "score",
+    "category": "category",
+    "analysis": "analysis",
+    "policy reference": "policy_reference",
+    "action": "action",
+    "ai confidence level": "confidence",
+    "user violation history": "offense_level",
+}
+# Lookup by the key exactly as matched, so the hot loop never calls .lower()
+_FIELD_BY_KEY = {key: FIELD_NAMES[key.lower()] for key in _KEYS}
+_FIELD_BY_KEY.update({key.upper(): FIELD_NAMES[key.lower()] for key in _KEYS})
+_TEXT_FIELDS = {"analysis", "policy_reference", "action"}
+USER_VIEW_FIELDS = ("score", "category", "analysis", "policy_reference", "action")
+UNABLE_TO_EXTRACT = "Unable to extract user view from response"
+
+# One "Field: value" line per field, for the fields read from the reasoning on demand
+_FIELD_LINES = {FIELD_NAMES[key.lower()]: re.compile(r"\n[ \t>*\-•]*(?:" + f"{key}|{key.upper()}" + r")\**[ \t]*:[ \t]*([^\n]*)")
+                for key in _KEYS}
+_LEADING_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def convert_field(name, value):
+    """Clean a raw field value into its typed form (None if it can't be parsed)"""
+    value = value.strip(" \t*")
+    if name in _TEXT_FIELDS:
+        return value
+    if name == "score":
+        number = _LEADING_NUMBER.match(value)
+        return int(float(number.group())) if number else None
+    if name == "confidence":
+        number = _LEADING_NUMBER.search(value)
+        return float(number.group()) / 100 if number else None
+    if name == "category":
+        return value.lower().replace(" ", "_") or None
+    if name == "offense_level":
+        number = _LEADING_NUMBER.search(value)
+        return int(float(number.group())) if number else None
+    return value
+
+
+def _field(name):
+    """Read-only property for one ModerationResult field"""
+    return property(lambda self: self._get(name))
+
+
+class ModerationResult:
+    """Compact, typed view of one moderation response
+
+    parse_moderation_response() only parses the USER VIEW section up front; a field the USER VIEW didn't
+    have (usually confidence) is looked up in the reasoning before it the first time it's read.
+    """
+    __slots__ = ("_fields", "_reasoning", "_fallbacks")
+    FIELDS = ("score", "category", "analysis", "policy_reference", "action", "confidence", "offense_level")
+
+    def __init__(self, score=None, category=None, analysis="", policy_reference="", action="", confidence=None,
+                 offense_level=None):
+        self._fields = {"score": score, "category": category, "analysis": analysis,
+                        "policy_reference": policy_reference, "action": action, "confidence": confidence,
+                        "offense_level": offense_level}
+        self._reasoning = None  # unparsed text before the USER VIEW, if any
+        self._fallbacks = None  # fields looked up in the reasoning so far
+
+    score = _field("score")                        # 1-10, or None if the model didn't give one
+    category = _field("category")                  # enforcement.CATEGORIES, e.g. "harassment" or "none"
+    analysis = _field("analysis")
+    policy_reference = _field("policy_reference")
+    action = _field("action")
+    confidence = _field("confidence")              # 0-1, from "AI CONFIDENCE LEVEL"
+    offense_level = _field("offense_level")        # 1-4, from "USER VIOLATION HISTORY"
+
+    @classmethod
+    def _from_sections(cls, user_view, reasoning):
+        """A result with the parsed USER VIEW fields and the reasoning left to parse on demand"""
+        result = cls.__new__(cls)
+        result._fields = user_view
+        result._reasoning = reasoning
+        result._fallbacks = None
+        return result
+
+    def _get(self, name):
+        value = self._fields.get(name)
+        if value is None and self._reasoning is not None:
+            if self._fallbacks is None:
+                self._fallbacks = {}
+            if name not in self._fallbacks:  # first mention of the field in the reasoning
+                match = _FIELD_LINES[name].search(self._reasoning)
+                self._fallbacks[name] = convert_field(name, match.group(1)) if match else None
+            value = self._fallbacks[name]
+        if value is None and name in _TEXT_FIELDS:
+            return ""
+        return value
+
+    def __repr__(self):
+        return (f"ModerationResult(score={self.score!r}, category={self.category!r}, action={self.action!r}, "
+                f"confidence={self.confidence!r}, offense_level={self.offense_level!r})")
+
+    def __eq__(self, other):
+        if not isinstance(other, ModerationResult):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    @property
+    def has_user_view(self):
+        """True if any user-facing field was found"""
+        return self.score is not None or bool(self.analysis or self.policy_reference or self.action)
+
+    def to_dict(self):
+        """Plain dict for JSON checkpoints and exports"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def format_user_view(self):
+        """Markdown USER VIEW for the Streamlit UI"""
+        score = self.score if self.score is not None else "N/A"
+        formatted_output = f"**Score: {score}**\n\n"
+        if self.analysis:
+            formatted_output += f"**Analysis:**\n{self.analysis}\n\n"
+        if self.policy_reference:
+            formatted_output += f"**Policy Reference:**\n{self.policy_reference}\n\n"
+        if self.action:
+            formatted_output += f"**Action:**\n{self.action}"
+        return formatted_output.strip()
+
+
+def _find_user_view(text):
+    """Index of the line holding the USER VIEW marker in text (which starts with a newline), or -1"""
+    position = text.find("USER VIEW")
+    while position != -1:
+        line_start = text.rfind("\n", 0, position)
+        if not text[line_start + 1:position].strip(" \t>*-•"):
+            return line_start
+        position = text.find("USER VIEW", position + 1)
+    return -1
+
+
+def parse_moderation_response(response):
+    """Parse the USER VIEW section of a moderation response; the reasoning is only parsed if it's needed
+
+    Fields inside the USER VIEW section win; the same fields found earlier in the
+    reasoning are only used when the USER VIEW section is missing them.
+    """
+    text = "\n" + (response or "")
+    start = _find_user_view(text)
+    if start == -1:
+        return ModerationResult._from_sections({}, text)
+    user_view = {}
+    for marker, key, value in RESPONSE_LINE.findall(text, start + 1):
+        if marker:
+            continue
+        name = _FIELD_BY_KEY[key]
+        if name not in user_view:
+            user_view[name] = convert_field(name, value)
+    return ModerationResult._from_sections(user_view, text[:start] if start else None)
+
+
+def extract_user_view(full_response):
+    """Extract and format the USER VIEW section from the AI response (shown in the Streamlit UI)"""
+    result = parse_moderation_response(full_response)
+    if not result.has_user_view:
+        return UNABLE_TO_EXTRACT
+    return result.format_user_view()
+
+
+def _legacy_parse(full_response):
+    """The old approach: separate regex scans per field, then find/replace/split for the USER VIEW"""
+    score_match = re.search(r'Score:\s*(\d+)', full_response)
+    score = int(score_match.group(1)) if score_match else None
+    confidence = re.search(r'AI CONFIDENCE LEVEL:\s*(\d+)', full_response)
+    offense = re.search(r'USER VIOLATION HISTORY:\s*(\d+)', full_response)
+    if "USER VIEW" in full_response:
+        user_section = full_response[full_response.find("USER VIEW"):]
+        user_section = user_section.replace("USER VIEW (for display to content creator):", "")
+        user_section = user_section.replace("USER VIEW", "", 1).strip()
+    else:
+        user_section = full_response
+    fields = {}
+    for line in [line.strip() for line in user_section.split('\n') if line.strip()]:
+        line = line.strip()
+        for prefix in ("Score:", "Analysis:", "Policy Reference:", "Action:", "**Action:"):
+            if line.startswith(prefix):
+                fields[prefix] = line[len(prefix):].replace('**', '').strip()
+    return score, confidence, offense, fields
+
+
+def _synthetic_corpus(size, seed=11):
+    """Recorded-style responses with the formatting quirks we see from the model"""
+    from fake_verdicts import fake_moderation_response
+
+    rng = random.Random(seed)
+    messages = ["Coffee this week?", "Send me $500 via Venmo", "You're disgusting, go back to your own country",
+                "What's your phone number?", "I want to kill myself"]
+    corpus = []
+    for _ in range(size):
+        response = fake_moderation_response(rng.choice(messages), verdict_first=rng.random() < 0.2)
+        if rng.random() < 0.3:
+            response = re.sub(r"(Score: \d+)", r"\1/10", response.replace("Category:", "**Category:**"))
+        corpus.append(response)
+    return corpus
+
+
+def main():
+    """Benchmark the parser (score only and every field) against the legacy parsing over a large corpus"""
+    corpus = _synthetic_corpus(50_000)
+
+    # Most callers only read the score; the cascade also reads confidence, which parses the reasoning
+    start = time.perf_counter()
+    results = [parse_moderation_response(response) for response in corpus]
+    for result in results:
+        result.score
+    score_only_us = (time.perf_counter() - start) / len(corpus) * 1e6
+
+    start = time.perf_counter()
+    for response in corpus:
+        parse_moderation_response(response).to_dict()
+    all_fields_us = (time.perf_counter() - start) / len(corpus) * 1e6
+
+    start = time.perf_counter()
+    for response in corpus:
+        _legacy_parse(response)
+    legacy_us = (time.perf_counter() - start) / len(corpus) * 1e6
+
+    print("=" * 60)
+    print("RESPONSE PARSER BENCHMARK")
+    print("=" * 60)
+    print(f"Responses: {len(corpus)}")
+    print(f"Parser, score only: {score_only_us:6.2f} us/response")
+    print(f"Parser, all fields: {all_fields_us:6.2f} us/response")
+    print(f"Legacy parsing:     {legacy_us:6.2f} us/response")
+    print(f"Parsed scores: {sum(result.score is not None for result in results)}/{len(results)}")
+    print(f"Sample: {results[0]!r}")
+
+
+if __name__ == "__main__":
+    main()
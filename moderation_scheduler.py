@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Moderation Scheduler - Earliest-deadline-first dispatch of reports with priority classes
+Reports used to be moderated first-come in a caller loop, so self-harm and threats waited
+behind compliments. The scheduler gives every report a priority class from the critical
+content router and a deadline (the "<30s decisions" target for ordinary reports, less for
+crisis and safety content), and a bounded pool of workers always takes the earliest
+deadline next. When the full model cascade would finish late the report is downgraded to
+the cheapest model (never crisis reports, which always get the full cascade); ordinary
+reports that can't make it even then are shed (deferred) rather than delaying everything
+behind them. Queue depth, waits, downgrades, sheds and
+deadline misses are exported in the same Prometheus / JSON shapes as metrics.py.
+"""
+import argparse
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import MetricsRecorder
+from model_cascade import ModelCascade
+
+# Priority class -> (rank, seconds from arrival to decision); rank breaks deadline ties and decides what gets shed
+PRIORITY_CLASSES = {
+    "crisis": (0, 10.0),    # self-harm - crisis resources go out as fast as we can manage
+    "safety": (1, 15.0),    # hate speech and threats
+    "fraud": (2, 20.0),     # scams keep working on the victim while they wait
+    "standard": (3, 30.0),  # everything else - the "<30s decisions" target
+}
+CATEGORY_CLASSES = {"self_harm": "crisis", "hate_speech": "safety", "fraud": "fraud"}  # detect_critical_content categories
+NEVER_SHED = {"crisis", "safety"}  # downgraded or late, but always decided
+NEVER_DOWNGRADE = {"crisis"}  # self-harm verdicts always come from the full cascade, late if need be
+ESTIMATE_WEIGHT = 0.2  # EWMA weight of each new model-call duration in the service time estimates
+ESTIMATE_DEVIATIONS = 2  # plan for mean + 2 mean deviations (like TCP's retransmit timer) - cascade re-asks are slow
+# A mode that is never chosen is never measured, so an estimate from one slow spell would stick forever.
+# Without fresh samples the estimate halves every ESTIMATE_HALF_LIFE seconds (times deadline_scale) until the mode is tried again
+ESTIMATE_HALF_LIFE = 30.0
+
+
+def priority_class(critical_hits):
+    """The most urgent class among the router's categories ("standard" when nothing matched)"""
+    classes = [CATEGORY_CLASSES.get(category, "standard") for category in critical_hits]
+    return min(classes, key=lambda name: PRIORITY_CLASSES[name][0], default="standard")
+
+
+class ModerationScheduler:
+    """EDF queue in front of a HingeAIModerator, served by a fixed pool of worker threads
+
+    submit() returns a Future for the moderation record, which gains priority_class,
+    scheduled_mode ("full", "downgraded" or "shed"), queue_wait, time_to_decision and
+    deadline_missed. deadline_scale multiplies every class deadline (for compressed-time runs).
+    """
+
+    def __init__(self, moderator, workers=8, max_queue=1000, downgrade_cascade=None, deadline_scale=1.0):
+        self.moderator = moderator
+        # Downgraded work goes to the cheapest tier alone - no re-asks of the larger model
+        # (with a single-tier cascade that's the same model, so only the shedding helps)
+        self.downgrade_cascade = downgrade_cascade or ModelCascade([moderator.cascade.tiers[0]])
+        self.max_queue = max_queue
+        self.deadline_scale = deadline_scale
+        self.metrics = MetricsRecorder()  # queue_wait and time_to_decision histograms per class
+        self._heap = []  # (deadline, rank, sequence, job)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closing = False
+        self._estimates = {}  # (class, mode) -> [EWMA seconds, EWMA deviation, last sample] for reports that needed a model call
+        self.stats = {name: {"submitted": 0, "completed": 0, "downgraded": 0, "shed": 0, "failed": 0, "deadline_misses": 0}
+                      for name in PRIORITY_CLASSES}
+        self.max_queue_depth = 0
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, content, user_id=None, deadline_seconds=None):
+        """Queue a report; deadline_seconds overrides its class deadline. Returns a Future for the record"""
+        now = time.monotonic()
+        name = priority_class(self.moderator.detect_critical_content(content))
+        rank, class_deadline = PRIORITY_CLASSES[name]
+        deadline_seconds = class_deadline * self.deadline_scale if deadline_seconds is None else deadline_seconds
+        job = {"content": content, "user_id": user_id, "class": name, "arrived": now,
+               "deadline": now + deadline_seconds, "future": Future()}
+        victim = None
+        with self._condition:
+            if self._closing:
+                raise RuntimeError("Scheduler is closed")
+            self.stats[name]["submitted"] += 1
+            if len(self._heap) >= self.max_queue:
+                victim = self._shed_candidate(job)
+                if victim is not None and victim is not job:
+                    self._heap.remove(next(entry for entry in self._heap if entry[3] is victim))
+                    heapq.heapify(self._heap)
+                if victim is not None:
+                    self.stats[victim["class"]]["shed"] += 1
+            if victim is not job:
+                heapq.heappush(self._heap, (job["deadline"], rank, next(self._sequence), job))
+                self.max_queue_depth = max(self.max_queue_depth, len(self._heap))
+                self._condition.notify()
+        if victim is not None:  # resolved outside the lock - done-callbacks run inline and may submit() again
+            self._shed(victim, "queue_full")
+        return job["future"]
+
+    def _shed_candidate(self, incoming):
+        """With the queue full: the lowest-priority, latest-deadline sheddable job (possibly the incoming one), or None"""
+        candidates = [entry[3] for entry in self._heap if entry[3]["class"] not in NEVER_SHED]
+        if incoming["class"] not in NEVER_SHED:
+            candidates.append(incoming)
+        if not candidates:
+            return None  # nothing can make room - the new report waits beyond max_queue rather than being dropped
+        return max(candidates, key=lambda job: (PRIORITY_CLASSES[job["class"]][0], job["deadline"]))
+
+    def _shed(self, job, reason):
+        """Answer a job without moderating it: deferred for a later retry, never cached or enforced
+
+        The caller counts the shed under the lock; this must be called without it held.
+        """
+        job["future"].set_result({
+            "content": job["content"], "source": "shed", "priority_class": job["class"],
+            "scheduled_mode": "shed", "shed_reason": reason, "response": self._create_deferred_response(),
+            "queue_wait": time.monotonic() - job["arrived"], "time_to_decision": None, "deadline_missed": True,
+        })
+
+    def _create_deferred_response(self):
+        return """USER VIEW (for display to content creator):
+        Score: N/A
+        Analysis: Moderation is deferred while the queue is overloaded - this content has not been reviewed yet
+        Policy Reference: N/A
+        Action: No action taken - queued for automatic retry"""
+
+    def _estimate(self, name, mode, now):
+        """Seconds to plan for, decayed by the age of the last sample (None until a report of this class has been moderated this way)"""
+        estimate = self._estimates.get((name, mode))
+        if estimate is None:
+            return None
+        decay = 0.5 ** ((now - estimate[2]) / (ESTIMATE_HALF_LIFE * self.deadline_scale))
+        return (estimate[0] + ESTIMATE_DEVIATIONS * estimate[1]) * decay
+
+    def _plan(self, job, remaining):
+        """full if the cascade should finish in time, else downgraded if that will, else shed (or downgraded if never-shed)"""
+        if job["class"] in NEVER_DOWNGRADE:
+            return "full"
+        now = time.monotonic()
+        with self._condition:
+            full, downgraded = self._estimate(job["class"], "full", now), self._estimate(job["class"], "downgraded", now)
+        if full is None or full <= remaining:
+            return "full"
+        if downgraded is None or downgraded <= remaining or job["class"] in NEVER_SHED:
+            return "downgraded"
+        return "shed"
+
+    def _record_estimate(self, name, mode, record):
+        """Fold a model call's duration into the estimate (fast path and cache hits say nothing about model time)"""
+        if record.get("source") not in ("llm", "llm_batch"):
+            return
+        with self._condition:
+            estimate = self._estimates.get((name, mode))
+            if estimate is None:
+                self._estimates[(name, mode)] = [record["latency"], record["latency"] / 2, time.monotonic()]
+                return
+            error = record["latency"] - estimate[0]
+            estimate[0] += ESTIMATE_WEIGHT * error
+            estimate[1] += ESTIMATE_WEIGHT * (abs(error) - estimate[1])
+            estimate[2] = time.monotonic()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._closing:
+                    self._condition.wait()
+                if not self._heap:
+                    return
+                deadline, _, _, job = heapq.heappop(self._heap)
+
+            started = time.monotonic()
+            mode = self._plan(job, deadline - started)
+            if mode == "shed":
+                with self._condition:
+                    self.stats[job["class"]]["shed"] += 1
+                self._shed(job, "deadline")
+                continue
+            try:
+                cascade = self.downgrade_cascade if mode == "downgraded" else None
+                record = self.moderator.moderate_content_detailed(job["content"], job["user_id"], cascade=cascade)
+            except Exception as e:
+                with self._condition:
+                    self.stats[job["class"]]["failed"] += 1
+                job["future"].set_exception(e)
+                continue
+            finished = time.monotonic()
+            self._record_estimate(job["class"], mode, record)
+            record.update(priority_class=job["class"], scheduled_mode=mode, queue_wait=started - job["arrived"],
+                          time_to_decision=finished - job["arrived"], deadline_missed=finished > deadline)
+            self.metrics.observe("queue_wait", job["class"], record["queue_wait"])
+            self.metrics.observe("time_to_decision", job["class"], record["time_to_decision"])
+            with self._condition:
+                stats = self.stats[job["class"]]
+                stats["completed"] += 1
+                stats["downgraded"] += mode == "downgraded"
+                stats["deadline_misses"] += record["deadline_missed"]
+            job["future"].set_result(record)
+
+    def queue_depth(self):
+        """Reports waiting, per priority class"""
+        with self._condition:
+            depth = {name: 0 for name in PRIORITY_CLASSES}
+            for entry in self._heap:
+                depth[entry[3]["class"]] += 1
+        return depth
+
+    def snapshot(self):
+        """JSON-ready queue depth, per-class counters and wait / time-to-decision histograms"""
+        depth = self.queue_depth()
+        with self._condition:
+            classes = {name: {**stats, "queue_depth": depth[name]} for name, stats in self.stats.items()}
+            max_queue_depth = self.max_queue_depth
+        return {"queue_depth": sum(depth.values()), "max_queue_depth": max_queue_depth, "classes": classes,
+                **self.metrics.snapshot()}
+
+    def prometheus_text(self, prefix="moderation_scheduler"):
+        """Prometheus text exposition format (start_metrics_server(scheduler) serves it)"""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_queue_depth Reports waiting for a worker",
+                 f"# TYPE {prefix}_queue_depth gauge"]
+        lines += [f'{prefix}_queue_depth{{class="{name}"}} {stats["queue_depth"]}'
+                  for name, stats in snapshot["classes"].items()]
+        for counter, description in (("submitted", "Reports submitted"), ("completed", "Reports moderated"),
+                                     ("downgraded", "Reports moved to the cheapest model to meet their deadline"),
+                                     ("shed", "Reports deferred without moderation"),
+                                     ("failed", "Reports whose moderation raised an error"),
+                                     ("deadline_misses", "Reports decided after their deadline")):
+            lines += [f"# HELP {prefix}_{counter}_total {description}", f"# TYPE {prefix}_{counter}_total counter"]
+            lines += [f'{prefix}_{counter}_total{{class="{name}"}} {stats[counter]}'
+                      for name, stats in snapshot["classes"].items()]
+        return "\n".join(lines) + "\n" + self.metrics.prometheus_text(prefix)
+
+    def close(self):
+        """Finish everything queued, then stop the workers"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+
+def _replay(submit, reports, rate, time_scale, seed=1):
+    """Submit reports with Poisson arrivals at rate per (simulated) second; returns [(report, future)]"""
+    rng = random.Random(seed)
+    futures = []
+    for report in reports:
+        time.sleep(rng.expovariate(rate) * time_scale)
+        futures.append((report, submit(report)))
+    return futures
+
+
+def main():
+    """Replay an overload burst first-come vs. through the EDF scheduler and compare deadline misses per class"""
+    import contextlib
+    import io
+    import os
+    import tempfile
+    from enforcement import ViolationHistory
+    from hinge_moderation_v2 import HingeAIModerator
+    from llm_backend import OfflineBackend, load_test_reports
+    from model_cascade import OFFLINE_MODEL_PROFILES, CHEAP_FIRST_SETTING, cascade_from_env
+
+    parser = argparse.ArgumentParser(description="EDF scheduler vs. first-come moderation under overload")
+    parser.add_argument("--reports", type=int, default=1500)
+    parser.add_argument("--rate", type=float, default=4.0, help="arrivals per simulated second")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.02, help="fraction of simulated time actually slept")
+    args = parser.parse_args()
+
+    reports = load_test_reports(args.reports, seed=3)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["VERDICT_CACHE_PATH"] = os.path.join(directory, "verdict_cache.db")
+        for mode in ("first-come", "edf"):
+            with contextlib.redirect_stdout(io.StringIO()):  # per-message logging muted
+                backend = OfflineBackend(model_profiles=OFFLINE_MODEL_PROFILES, time_scale=args.time_scale)
+                # The gpt-4o-mini-first cascade, so downgraded reports have a cheaper model to go to
+                moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None, backend=backend,
+                                             violation_history=ViolationHistory(),
+                                             cascade=cascade_from_env(CHEAP_FIRST_SETTING))
+                moderator.client.limiter = None  # time is compressed, so the per-minute quota doesn't apply
+                moderator.client.base_delay *= args.time_scale
+                start = time.monotonic()
+                if mode == "first-come":
+                    executor = ThreadPoolExecutor(max_workers=args.workers)
+
+                    def submit(report):
+                        arrived = time.monotonic()
+                        future = executor.submit(moderator.moderate_content_detailed, report)
+                        future.arrived = arrived
+                        future.add_done_callback(lambda done: setattr(done, "finished", time.monotonic()))
+                        return future
+
+                    futures = _replay(submit, reports, args.rate, args.time_scale)
+                    executor.shutdown(wait=True)
+                    records = []
+                    for report, future in futures:
+                        name = priority_class(moderator.detect_critical_content(report))
+                        elapsed = future.finished - future.arrived
+                        deadline = PRIORITY_CLASSES[name][1] * args.time_scale
+                        records.append(future.result() | {"priority_class": name, "time_to_decision": elapsed,
+                                                          "scheduled_mode": "full", "deadline_missed": elapsed > deadline})
+                    snapshot = None
+                else:
+                    scheduler = ModerationScheduler(moderator, workers=args.workers, deadline_scale=args.time_scale)
+                    futures = _replay(scheduler.submit, reports, args.rate, args.time_scale)
+                    records = [future.result() for _, future in futures]
+                    snapshot = scheduler.snapshot()
+                    scheduler.close()
+                seconds = time.monotonic() - start
+            results[mode] = (records, seconds, snapshot)
+
+    print("=" * 92)
+    print(f"SCHEDULING UNDER OVERLOAD ({args.reports:,} reports at {args.rate}/s, {args.workers} workers, "
+          f"offline models, times in simulated seconds)")
+    print("=" * 92)
+    for mode, (records, seconds, snapshot) in results.items():
+        print(f"\n{mode} ({seconds / args.time_scale:.0f}s simulated)")
+        print(f"  {'class':9} {'reports':>8} {'deadline':>9} {'p50':>8} {'p95':>8} {'missed':>8} {'downgraded':>11} {'shed':>6}")
+        for name, (_, deadline) in PRIORITY_CLASSES.items():
+            class_records = [record for record in records if record["priority_class"] == name]
+            if not class_records:
+                continue
+            decided = sorted(record["time_to_decision"] / args.time_scale for record in class_records
+                             if record["time_to_decision"] is not None)
+            p50 = decided[len(decided) // 2] if decided else 0.0
+            p95 = decided[min(len(decided) - 1, int(len(decided) * 0.95))] if decided else 0.0
+            missed = sum(1 for record in class_records if record["deadline_missed"] and record["scheduled_mode"] != "shed")
+            downgraded = sum(1 for record in class_records if record["scheduled_mode"] == "downgraded")
+            shed = sum(1 for record in class_records if record["scheduled_mode"] == "shed")
+            print(f"  {name:9} {len(class_records):8} {deadline:8.0f}s {p50:7.1f}s {p95:7.1f}s "
+                  f"{missed / len(class_records):8.1%} {downgraded:11} {shed:6}")
+        if snapshot:
+            print(f"  max queue depth {snapshot['max_queue_depth']}")
+
+
+if __name__ == "__main__":
+    main()
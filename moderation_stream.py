@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Moderation Stream - Incremental USER VIEW parsing for streamed moderation responses
+Lets callers act on the score and category as soon as the model writes them, instead of
+waiting for the whole chain-of-thought completion.
+"""
+import json
+import os
+import time
+
+from moderation_result import RESPONSE_LINE, FIELD_NAMES, USER_VIEW_FIELDS, convert_field
+
+
+class StreamingVerdictParser:
+    """Feed response chunks in; get USER VIEW fields out as soon as each line completes"""
+
+    def __init__(self):
+        self.fields = {}
+        self._buffer = ""
+        self._in_user_view = False
+
+    def feed(self, chunk):
+        """Consume a chunk of streamed text; returns [(field, value)] completed by it"""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        return [field for field in map(self._parse_line, lines) if field]
+
+    def close(self):
+        """Flush the final unterminated line once the stream ends"""
+        line, self._buffer = self._buffer, ""
+        field = self._parse_line(line)
+        return [field] if field else []
+
+    def _parse_line(self, line):
+        if "USER VIEW" in line:
+            self._in_user_view = True
+            return None
+        if not self._in_user_view:
+            return None  # "Score" inside the reasoning steps isn't the verdict
+        match = RESPONSE_LINE.match("\n" + line)
+        if not match or not match.group("key"):
+            if line.strip().startswith("STEP "):
+                self._in_user_view = False  # verdict-first responses continue with the reasoning
+            return None
+        name = FIELD_NAMES[match.group("key").lower()]
+        if name not in USER_VIEW_FIELDS or name in self.fields:
+            return None
+        value = convert_field(name, match.group("value"))
+        if value is None:
+            return None
+        self.fields[name] = value
+        return name, value
+
+    @property
+    def verdict_ready(self):
+        """True once both the score and the category are known - enough for enforcement to decide the action"""
+        return "score" in self.fields and "category" in self.fields
+
+
+def main():
+    """Compare time-to-verdict with time-to-full-response against the fake server"""
+    from fake_openai_server import start_fake_server
+
+    server, base_url = start_fake_server(latency=0.3, token_delay=0.01)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    from hinge_moderation_v2 import HingeAIModerator
+
+    with open("evaluation_dataset.json", "r") as file:
+        contents = [case["content"] for case in json.load(file)][:8]
+
+    moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None)
+    modes = {
+        "full stream (reasoning first)": {"verdict_first": False, "stop_after_verdict": False},
+        "verdict first, read everything": {"verdict_first": True, "stop_after_verdict": False},
+        "verdict first + early exit": {"verdict_first": True, "stop_after_verdict": True},
+    }
+    report = {}
+    for name, options in modes.items():
+        verdict_times, full_times = [], []
+        for content in contents:
+            start = time.perf_counter()
+            record = moderator.stream_moderate_content(content, **options)
+            full_times.append(time.perf_counter() - start)
+            verdict_times.append(record["time_to_verdict"])
+        report[name] = (sum(verdict_times) / len(verdict_times), sum(full_times) / len(full_times))
+
+    print(f"\n{'='*60}")
+    print("STREAMING TIME-TO-VERDICT (fake server, 0.3s TTFT, 10ms/token)")
+    print(f"{'='*60}")
+    for name, (verdict_seconds, full_seconds) in report.items():
+        print(f"{name:32} verdict {verdict_seconds:.2f}s | call returns {full_seconds:.2f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Near Duplicate - MinHash/LSH clustering of templated messages
+Fraud campaigns send the same script with a different name, amount or payment app. Each
+message is reduced to a MinHash signature; locality-sensitive hashing finds earlier
+messages with a similar signature, so later members of a cluster inherit the first LLM
+verdict instead of paying for another call.
+"""
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from moderation_result import parse_moderation_response
+from verdict_cache import normalize_content
+
+SIMILARITY_THRESHOLD = 0.7   # estimated Jaccard similarity needed to join a cluster
+NUM_PERMUTATIONS = 64
+BANDS = 16                   # 16 bands x 4 rows: pairs around 0.5 Jaccard start becoming candidates
+SHINGLE_SIZE = 5
+BULK_ACTION_SCORE = 7        # clusters judged at this score or above are violating campaigns...
+BULK_ACTION_MIN_MEMBERS = 3  # ...and get flagged for bulk action once they have this many members
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_NUMBERS = re.compile(r"\d+")
+
+
+def shingles(content, size=SHINGLE_SIZE):
+    """Character shingles of the normalized text, with every number collapsed to 0"""
+    text = _NUMBERS.sub("0", normalize_content(content))  # "$500" and "$300" are the same template
+    if len(text) <= size:
+        return {text}
+    return {text[start:start + size] for start in range(len(text) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """Thread-safe LSH index of judged messages, clustered by estimated Jaccard similarity
+
+    Memory is bounded by max_entries: the least recently matched entries are evicted, and a
+    cluster disappears with its last entry.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, num_permutations=NUM_PERMUTATIONS, bands=BANDS,
+                 max_entries=50_000, seed=1):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self.max_entries = max_entries
+        rng = random.Random(seed)  # fixed seed keeps signatures comparable between runs
+        self._permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(_MERSENNE_PRIME))
+                              for _ in range(self.rows * bands)]
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # entry_id -> (route, signature, cluster_id), least recently used first
+        self._buckets = {}             # (route, band, rows) -> set of entry ids
+        self._clusters = {}            # cluster_id -> {"verdict", "score", "entries", "members", "example"}
+        self._next_id = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "clusters_created": 0}
+
+    def signature(self, content):
+        """MinHash signature: the smallest permuted shingle hash for each permutation"""
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(content)]
+        return tuple(min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in self._permutations)
+
+    def _band_keys(self, route, signature):
+        rows = self.rows
+        return [(route, band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def match(self, content, route):
+        """Find the cluster of a near-duplicate already judged on this route
+
+        Returns (signature, cluster) where cluster is a snapshot dict with cluster_id,
+        similarity, verdict, members and bulk_action, or None. A match counts the message
+        as a new member of the cluster.
+        """
+        signature = self.signature(content)
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(route, signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_entry, best_similarity = None, 0.0
+            for entry_id in candidates:
+                other = self._entries[entry_id][1]
+                similarity = sum(a == b for a, b in zip(signature, other)) / len(signature)
+                if similarity > best_similarity:
+                    best_entry, best_similarity = entry_id, similarity
+
+            if best_entry is None or best_similarity < self.threshold:
+                self.stats["misses"] += 1
+                return signature, None
+
+            self.stats["hits"] += 1
+            self._entries.move_to_end(best_entry)
+            cluster_id = self._entries[best_entry][2]
+            cluster = self._clusters[cluster_id]
+            cluster["members"] += 1
+            return signature, self._snapshot(cluster_id, best_similarity)
+
+    def add(self, content, route, verdict, signature=None):
+        """Index a message with its LLM verdict, starting a new cluster; returns the cluster id"""
+        signature = signature or self.signature(content)
+        score = parse_moderation_response(verdict).score
+        with self._lock:
+            entry_id = cluster_id = self._next_id
+            self._next_id += 1
+            self._clusters[cluster_id] = {"verdict": verdict, "score": score, "entries": 1, "members": 1,
+                                          "example": content}
+            self.stats["clusters_created"] += 1
+            self._entries[entry_id] = (route, signature, cluster_id)
+            for key in self._band_keys(route, signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+        return cluster_id
+
+    def _evict_oldest(self):
+        entry_id, (route, signature, cluster_id) = self._entries.popitem(last=False)
+        for key in self._band_keys(route, signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        cluster = self._clusters[cluster_id]
+        cluster["entries"] -= 1
+        if cluster["entries"] == 0:
+            del self._clusters[cluster_id]
+        self.stats["evictions"] += 1
+
+    def _snapshot(self, cluster_id, similarity):
+        cluster = self._clusters[cluster_id]
+        return {
+            "cluster_id": cluster_id,
+            "similarity": similarity,
+            "verdict": cluster["verdict"],
+            "members": cluster["members"],
+            "bulk_action": self._needs_bulk_action(cluster),
+        }
+
+    @staticmethod
+    def _needs_bulk_action(cluster):
+        return (cluster["score"] is not None and cluster["score"] >= BULK_ACTION_SCORE
+                and cluster["members"] >= BULK_ACTION_MIN_MEMBERS)
+
+    def bulk_action_clusters(self):
+        """Violating clusters big enough to act on as a whole campaign, largest first"""
+        with self._lock:
+            flagged = [
+                {"cluster_id": cluster_id, "members": cluster["members"], "score": cluster["score"],
+                 "example": cluster["example"]}
+                for cluster_id, cluster in self._clusters.items() if self._needs_bulk_action(cluster)
+            ]
+        return sorted(flagged, key=lambda cluster: cluster["members"], reverse=True)
+
+    def summary(self):
+        """Counters plus current index size"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "clusters": len(self._clusters),
+            }
+
+
+def campaign_messages(rng, count, ordinary_messages):
+    """Templated scam and spam variants mixed with ordinary messages"""
+    templates = [
+        "Hey {name}! I can't talk on here, send me ${amount} on {app} so I can get a ticket to see you",
+        "babe my account got frozen, can you send ${amount} via {app}? I'll pay you back tomorrow {emoji}",
+        "I'm an investor and made {amount}% last month with crypto, download {app} and use my code {code}",
+        "Follow me on {app} @{name}{code} for my private pics, link in bio",
+    ]
+    names = ["sam", "alex", "jordan", "taylor", "chris", "jamie", "morgan"]
+    apps = ["cash app", "cashapp", "venmo", "zelle", "paypal", "telegram", "snapchat"]
+    emojis = ["", ":)", "<3", "xx", "🙏"]
+    messages = []
+    for index in range(count):
+        if rng.random() < 0.6:
+            message = rng.choice(templates).format(
+                name=rng.choice(names), amount=rng.randint(20, 900), app=rng.choice(apps),
+                emoji=rng.choice(emojis), code=rng.randint(100, 999))
+        else:
+            message = rng.choice(ordinary_messages)
+        messages.append(message)
+    return messages
+
+
+def main():
+    """Replay templated campaigns through the index and count the LLM calls it saves"""
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    from fake_verdicts import fake_moderation_response
+    from keyword_router import KeywordMatcher, CRITICAL_KEYWORDS
+
+    with open("evaluation_dataset.json", "r") as file:
+        ordinary_messages = [case["content"] for case in json.load(file)]
+    rng = random.Random(3)
+    messages = campaign_messages(rng, 2000, ordinary_messages)
+    index = NearDuplicateIndex(max_entries=500)
+    matcher = KeywordMatcher(CRITICAL_KEYWORDS)
+
+    def moderate(message):
+        route = "specialized" if matcher.scan(message) else "general"  # same routing as the moderator
+        signature, cluster = index.match(message, route)
+        if cluster is not None:
+            return cluster
+        index.add(message, route, fake_moderation_response(message), signature)  # stands in for the LLM call
+        return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(moderate, messages))
+    seconds = time.perf_counter() - start
+
+    inherited = [cluster for cluster in results if cluster is not None]
+    # An inherited verdict is wrong if the message on its own would have scored differently
+    wrong = sum(
+        1 for message, cluster in zip(messages, results)
+        if cluster is not None
+        and parse_moderation_response(cluster["verdict"]).score != parse_moderation_response(fake_moderation_response(message)).score
+    )
+    summary = index.summary()
+    print("=" * 60)
+    print("NEAR-DUPLICATE INDEX (MinHash/LSH, 8 worker threads)")
+    print("=" * 60)
+    print(f"Messages: {len(messages)} | LLM calls: {len(messages) - len(inherited)} | inherited verdicts: {len(inherited)} "
+          f"({wrong} with a different score than a fresh call)")
+    print(f"Index: {summary['entries']} entries, {summary['clusters']} clusters, {summary['evictions']} evictions "
+          f"(max_entries={index.max_entries})")
+    print(f"Lookup + insert: {seconds / len(messages) * 1e3:.2f} ms per message")
+    print("\nClusters flagged for bulk action:")
+    for cluster in index.bulk_action_clusters()[:5]:
+        print(f"  - {cluster['members']} members, score {cluster['score']}: \"{cluster['example'][:60]}\"")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Policy Index - Split the Hinge policy files into sections and retrieve them per category
+Prompts used to inline every Section 2c/2d rule (and the image prompt the whole member
+principles file) for every request. The files are split into numbered sections once at
+startup, and each prompt only includes the sections for the categories the router found.
+"""
+import re
+
+from fast_path import risk_signals
+from verdict_cache import prompt_version
+
+# Sections every prompt on a route gets, whatever the router found
+ROUTE_SECTIONS = {
+    "general": ["2d.1", "2c.5"],
+    "specialized": ["2d.1", "2c.5"],
+    "image": ["2d.2", "2d.12", "2b.9", "2c.1", "principle:Be Honest", "principle:Understand Consent is Critical"],
+}
+
+# Extra sections for each critical keyword category (keyword_router) and local risk signal (fast_path)
+CATEGORY_SECTIONS = {
+    "hate_speech": ["2d.3", "2d.4"],
+    "self_harm": ["2d.5", "principle:Step in When Necessary"],
+    "fraud": ["2c.8", "2c.10", "2d.7"],
+    "sexual": ["2d.2", "principle:Understand Consent is Critical"],
+    "contact_or_location": ["2c.7", "2c.13", "principle:Respect Boundaries"],
+    "pressure": ["principle:Respect Boundaries"],
+    "insult_or_profanity": ["2d.3"],
+    "money": ["2c.8", "2d.7"],
+    "photos": ["2d.2", "2d.12"],
+    "discrimination": ["2d.3", "principle:Be Open to Others"],
+    "violence": ["2d.4", "2d.5"],
+    "links": ["2d.7", "2d.8"],
+    "digits": ["2c.7", "2d.7"],
+}
+
+# What each route inlined for every request before retrieval, for before/after reports
+FULL_POLICY_SECTIONS = {
+    "general": ["2d.1", "2d.2", "2d.3", "2d.4", "2d.5", "2d.7", "2d.10", "2d.12", "2c.1", "2c.5", "2c.8", "2c.10", "2c.13"],
+    "specialized": ["2d.1", "2d.3", "2c.5", "2c.8", "2c.10"],
+    "image": None,  # the whole member principles file
+}
+
+_SECTION_HEADER = re.compile(r"^(\d+[a-z]?)\. ([A-Z][A-Z ;,&'’()\-]+)$", re.IGNORECASE)
+_NUMBERED_ITEM = re.compile(r"^(\d+)\. (.*)$")
+_ITEM_ENDING = re.compile(r"[\s;,.]*(?:\b(?:and|or))?[\s;,.]*$")
+
+
+class PolicySection:
+    """One retrievable piece of policy text"""
+    __slots__ = ("section_id", "title", "text")
+
+    def __init__(self, section_id, title, text):
+        self.section_id = section_id
+        self.title = title
+        self.text = text
+
+    def render(self):
+        if self.section_id.startswith("principle:"):
+            return f"Member Principle - {self.title}: {self.text}"
+        return f"Section {self.section_id} ({self.title}): {self.text}"
+
+
+def split_terms(terms_text):
+    """Split the terms of use into numbered items (2c.8, 2d.3, ...) for every lettered subsection"""
+    sections = {}
+    subsection, title, item_number, item_lines = None, None, None, []
+
+    def flush():
+        if subsection and item_number:
+            section_id = f"{subsection}.{item_number}"
+            sections[section_id] = PolicySection(section_id, title, _ITEM_ENDING.sub("", " ".join(item_lines)) + ".")
+
+    for line in terms_text.splitlines():
+        line = line.strip()
+        header = _SECTION_HEADER.match(line)
+        if header and header.group(2).isupper():
+            flush()
+            number = header.group(1).lower()
+            # Only lettered subsections (2c, 2d, ...) are lists of rules; numbered ones are prose
+            subsection = number if number[-1].isalpha() else None
+            title, item_number, item_lines = header.group(2).title(), None, []
+            continue
+        item = _NUMBERED_ITEM.match(line)
+        if subsection and item:
+            flush()
+            item_number, item_lines = item.group(1), [item.group(2)]
+        elif subsection and item_number and line:
+            if item_lines[-1].endswith(";") or line.startswith(("The ", "If ")):
+                flush()  # the list is over - this is closing prose
+                item_number, item_lines = None, []
+            else:
+                item_lines.append(line)
+    flush()
+    return sections
+
+
+def split_principles(principles_text):
+    """Split the member principles into one section per heading (the summary list names the headings)"""
+    lines = [line.strip() for line in principles_text.splitlines()]
+    marker = "We believe the Hinge Team Must:"
+    summary_start = lines.index(marker)
+    body_start = lines.index(marker, summary_start + 1)
+    headings = {line for line in lines[summary_start + 1:body_start]
+                if line and not line.endswith(":")}
+
+    sections = {}
+    heading, paragraphs = None, []
+    for line in lines[body_start:] + [None]:
+        if line is None or line in headings:
+            if heading:
+                section_id = f"principle:{heading}"
+                sections[section_id] = PolicySection(section_id, heading, " ".join(paragraphs))
+            heading, paragraphs = line, []
+        elif heading and line and not line.endswith(":"):
+            paragraphs.append(line)
+    return sections
+
+
+class PolicyIndex:
+    """Indexed policy sections with memoized per-route, per-category-set policy blocks"""
+
+    def __init__(self, principles_text, terms_text):
+        self.sections = {**split_terms(terms_text), **split_principles(principles_text)}
+        missing = {section_id for ids in [*ROUTE_SECTIONS.values(), *CATEGORY_SECTIONS.values()]
+                   for section_id in ids} - self.sections.keys()
+        if missing:
+            raise ValueError(f"Policy files are missing sections: {sorted(missing)}")
+        # Any change to the policy text or the category mapping invalidates cached verdicts
+        self.version = prompt_version(repr(sorted((key, section.render()) for key, section in self.sections.items()))
+                                      + repr(sorted(CATEGORY_SECTIONS.items())) + repr(sorted(ROUTE_SECTIONS.items())))
+        self._blocks = {}
+
+    def detect_categories(self, content, critical_hits=None):
+        """Policy categories for a message: critical keyword categories plus local risk signals"""
+        return frozenset(critical_hits or ()) | frozenset(risk_signals(content))
+
+    def section_ids(self, route, categories=()):
+        """Ordered, de-duplicated section ids for a route and category set"""
+        ids = list(ROUTE_SECTIONS[route])
+        for category in sorted(categories):
+            ids.extend(CATEGORY_SECTIONS.get(category, ()))
+        return list(dict.fromkeys(ids))
+
+    def render(self, route, categories=()):
+        """Policy block for a route and category set, built once per distinct set"""
+        key = (route, frozenset(categories))
+        block = self._blocks.get(key)
+        if block is None:
+            block = "\n".join(self.sections[section_id].render() for section_id in self.section_ids(route, categories))
+            self._blocks[key] = block
+        return block
+
+    def render_full(self, route):
+        """Every section the route used to inline, for before/after comparisons"""
+        section_ids = FULL_POLICY_SECTIONS[route]
+        if section_ids is None:
+            section_ids = [section_id for section_id in self.sections if section_id.startswith("principle:")]
+        return "\n".join(self.sections[section_id].render() for section_id in section_ids)
+
+
+def main():
+    """Report average prompt tokens per route with all policies vs. retrieved sections"""
+    import json
+    import os
+
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")  # prompts are built locally, no API calls
+    from hinge_moderation_v2 import HingeAIModerator
+
+    with open("evaluation_dataset.json", "r") as file:
+        contents = [case["content"] for case in json.load(file)]
+    # The dataset has no critical-route messages, so add a few to cover the specialized prompt
+    contents += ["Send me $500 on cash app and I'll visit you", "I want to kill myself",
+                 "You people are disgusting, go back to your own country"]
+
+    moderator = HingeAIModerator(use_cache=False)
+    index = moderator.policy_index
+    print("=" * 60)
+    print("POLICY RETRIEVAL")
+    print("=" * 60)
+    print(f"Indexed {len(index.sections)} sections (version {index.version})")
+    for route, report in moderator.policy_token_report(contents).items():
+        print(f"{route:12} {report['messages']:3} prompts | all policies {report['full_tokens']:6.0f} tokens | "
+              f"retrieved {report['retrieved_tokens']:6.0f} tokens ({report['change']:+.0%})")
+    print("\nPrompt size only: accuracy with retrieved sections hasn't been measured on the live model "
+          "(python hinge_moderation_v2.py against the API).")
+
+
+if __name__ == "__main__":
+    main()
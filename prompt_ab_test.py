@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Prompt A/B Test - Run prompt variants side by side over labelled cases and compare them
+Each variant (production routing, one template for everything, or text edits on top)
+moderates every case concurrently. Responses are cached per (variant prompt, content),
+so a rerun only pays for what changed. The report compares accuracy, FP/FN, tokens, cost
+and latency percentiles against the baseline variant, with McNemar's exact test on
+accuracy and paired permutation tests on cost and latency.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hinge_moderation_v2 import TEXT_MODEL
+from metrics import percentile
+from model_cascade import request_cost
+from moderation_result import parse_moderation_response
+from verdict_cache import VerdictCache, prompt_version
+
+CACHE_TTL_SECONDS = 90 * 24 * 3600  # labelled cases don't change, so keep answers for a whole prompt iteration cycle
+PERMUTATIONS = 5000
+SIGNIFICANCE = 0.05
+
+# Ground truth for exported Langfuse traces (langfuse_evaluation_dataset.json), from the reviewers' tags
+EXPORT_EXPECTED_RANGES = {
+    "false_positives": [1, 4],    # reviewer said the verdict was too harsh
+    "true_positives": [7, 10],
+    "accurate_cases": [1, 3],
+    "borderline_cases": [4, 6],
+}
+_CONTENT_PATTERN = re.compile(r"Content to analyze:\s*(.+)", re.DOTALL)
+SEVERITY_CALIBRATION = (
+    "STEP 3: Policy Application\nIdentify",
+    "SEVERITY CALIBRATION: Score 7+ only for clear violations, not borderline cases.\n\nSTEP 3: Policy Application\nIdentify",
+)
+
+
+class PromptVariant:
+    """One way of building the system prompt: which template(s), and which text edits on top"""
+
+    def __init__(self, name, route=None, edits=(), builders=None, model=TEXT_MODEL):
+        self.name = name
+        self.route = route                # None routes like production (specialized for critical content)
+        self.edits = tuple(edits)         # (old, new) replacements applied to the built prompt
+        self.builders = builders or {}    # route -> template builder overrides, e.g. a rewritten general prompt
+        self.model = model
+        self._prompts = {}                # (route, categories) -> rendered system prompt
+
+    def _build(self, moderator, route, policies):
+        prompt = self.builders.get(route, moderator.prompt_builders[route])(policies)
+        for old, new in self.edits:
+            prompt = prompt.replace(old, new)
+        return prompt
+
+    def version(self, moderator):
+        """Hash of everything that shapes this variant's prompts - the cache key changes when any of it does"""
+        routes = [self.route] if self.route else ["general", "specialized"]
+        templates = [self._build(moderator, route, "{policies}") for route in routes]
+        for old, _ in self.edits:
+            if not any(old in self.builders.get(route, moderator.prompt_builders[route])("{policies}") for route in routes):
+                raise ValueError(f"Variant {self.name}: edit target not found in any template: {old[:40]!r}")
+        return prompt_version("\n".join(templates) + moderator.create_user_message("{content}")
+                              + moderator.policy_index.version + self.model)
+
+    def messages(self, moderator, content):
+        """(route, chat messages) for one case - the same routing and policy retrieval as production"""
+        critical_hits = moderator.detect_critical_content(content)
+        route = self.route or ("specialized" if critical_hits else "general")
+        categories = frozenset(moderator.policy_index.detect_categories(content, critical_hits))
+        prompt = self._prompts.get((route, categories))
+        if prompt is None:
+            prompt = self._prompts[(route, categories)] = self._build(
+                moderator, route, moderator.policy_index.render(route, categories))
+        return route, [{"role": "system", "content": prompt},
+                       {"role": "user", "content": moderator.create_user_message(content)}]
+
+
+def default_variants():
+    """Production routing as the baseline, each template on its own, and the severity calibration edit"""
+    return [
+        PromptVariant("baseline"),
+        PromptVariant("general_only", route="general"),
+        PromptVariant("specialized_only", route="specialized"),
+        PromptVariant("severity_calibrated", edits=[SEVERITY_CALIBRATION]),
+    ]
+
+
+def _trace_content(trace_input):
+    """The moderated message from a trace input (message list, or the old single quoted prompt)"""
+    if isinstance(trace_input, list):
+        user_messages = [message.get("content") for message in trace_input
+                         if isinstance(message, dict) and message.get("role") == "user"]
+        trace_input = user_messages[-1] if user_messages else None
+    match = _CONTENT_PATTERN.search(str(trace_input or ""))
+    return match.group(1).strip().strip('"') if match else None
+
+
+def load_cases(path="evaluation_dataset.json"):
+    """Labelled cases from evaluation_dataset.json, or from an export_evaluation_dataset() file"""
+    with open(path, "r") as file:
+        data = json.load(file)
+    if isinstance(data, list):
+        return [{"content": case["content"], "expected_score_range": case["expected_score_range"]} for case in data]
+
+    cases = []
+    for category, traces in data.items():
+        expected_range = EXPORT_EXPECTED_RANGES.get(category)
+        if expected_range is None:
+            continue
+        for trace in traces:
+            content = _trace_content(trace.get("input"))
+            if content:
+                cases.append({"content": content, "expected_score_range": expected_range, "trace_id": trace.get("trace_id")})
+    return cases
+
+
+def open_cache(path="ab_test_cache.db"):
+    """Response cache for A/B runs - separate from the production verdict cache, and kept much longer"""
+    return VerdictCache(path, max_entries=100_000, ttl_seconds=CACHE_TTL_SECONDS)
+
+
+def _run_case(moderator, variant, version, index, case, cache):
+    """Moderate one case with one variant (or replay its cached answer) and score it"""
+    content = case["content"]
+    route, messages = variant.messages(moderator, content)
+    cache_key = VerdictCache.make_key(content, route, version, variant.model)
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        answer = json.loads(cached)
+    else:
+        start = time.perf_counter()
+        response = moderator.client.chat.completions.create(model=variant.model, messages=messages)
+        usage = getattr(response, "usage", None)
+        answer = {
+            "response": response.choices[0].message.content,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "latency": time.perf_counter() - start,  # the original call's latency is kept, so reruns report the same
+        }
+        if cache is not None:
+            cache.set(cache_key, json.dumps(answer))
+
+    score = parse_moderation_response(answer["response"]).score
+    expected_min, expected_max = case["expected_score_range"]
+    return {
+        "index": index,
+        "route": route,
+        "score": score,
+        "correct": score is not None and expected_min <= score <= expected_max,
+        "false_positive": score is not None and score > expected_max,
+        "false_negative": score is not None and score < expected_min,
+        "prompt_tokens": answer["prompt_tokens"],
+        "completion_tokens": answer["completion_tokens"],
+        "cost": request_cost(variant.model, answer["prompt_tokens"], answer["completion_tokens"]),
+        "latency": answer["latency"],
+        "cached": cached is not None,
+    }
+
+
+def run_ab_test(moderator, variants, cases, cache=None, workers=8):
+    """Run every variant over every case concurrently; returns {variant name: {case index: result}}"""
+    versions = {variant.name: variant.version(moderator) for variant in variants}
+    results = {variant.name: {} for variant in variants}
+    errors = {variant.name: 0 for variant in variants}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [(variant, executor.submit(_run_case, moderator, variant, versions[variant.name], index, case, cache))
+                   for variant in variants for index, case in enumerate(cases)]
+        for variant, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                # Failures aren't cached, so a rerun retries just these
+                print(f"{variant.name}: case failed ({type(e).__name__}: {e})")
+                errors[variant.name] += 1
+                continue
+            results[variant.name][result["index"]] = result
+    for name, count in errors.items():
+        if count:
+            print(f"{name}: {count} cases failed (rerun to retry them)")
+    return results
+
+
+def mcnemar_test(baseline_correct, variant_correct):
+    """Exact two-sided McNemar test on paired right/wrong outcomes; returns (baseline-only, variant-only, p)"""
+    baseline_only = sum(1 for a, b in zip(baseline_correct, variant_correct) if a and not b)
+    variant_only = sum(1 for a, b in zip(baseline_correct, variant_correct) if b and not a)
+    discordant = baseline_only + variant_only
+    if not discordant:
+        return baseline_only, variant_only, 1.0
+    tail = sum(math.comb(discordant, k) for k in range(min(baseline_only, variant_only) + 1)) / 2 ** discordant
+    return baseline_only, variant_only, min(1.0, 2 * tail)
+
+
+def paired_permutation_test(baseline_values, variant_values, permutations=PERMUTATIONS, seed=0):
+    """Two-sided sign-flip permutation test on the mean paired difference; returns (mean difference, p)"""
+    differences = [b - a for a, b in zip(baseline_values, variant_values)]
+    if not differences:
+        return 0.0, 1.0
+    observed = abs(sum(differences))
+    rng = random.Random(seed)
+    extreme = 0
+    for _ in range(permutations):
+        if abs(sum(d if rng.random() < 0.5 else -d for d in differences)) >= observed - 1e-12:
+            extreme += 1
+    return sum(differences) / len(differences), (extreme + 1) / (permutations + 1)
+
+
+def summarize(results):
+    """Per-variant accuracy, FP/FN, tokens, cost and latency percentiles"""
+    summary = {}
+    for name, by_case in results.items():
+        rows = list(by_case.values())
+        count = len(rows)
+        latencies = [row["latency"] for row in rows]
+        summary[name] = {
+            "cases": count,
+            "accuracy": sum(row["correct"] for row in rows) / count if count else 0.0,
+            "false_positives": sum(row["false_positive"] for row in rows),
+            "false_negatives": sum(row["false_negative"] for row in rows),
+            "unparsed": sum(row["score"] is None for row in rows),
+            "tokens_per_case": sum(row["prompt_tokens"] + row["completion_tokens"] for row in rows) / count if count else 0.0,
+            "cost": sum(row["cost"] for row in rows),
+            "latency": {f"p{pct}": percentile(latencies, pct) for pct in (50, 95, 99)},
+            "api_calls": sum(not row["cached"] for row in rows),
+        }
+    return summary
+
+
+def compare(results, baseline="baseline", permutations=PERMUTATIONS):
+    """Each variant against the baseline, over the cases both answered"""
+    comparisons = {}
+    for name, by_case in results.items():
+        if name == baseline:
+            continue
+        shared = sorted(set(by_case) & set(results[baseline]))
+        base_rows = [results[baseline][index] for index in shared]
+        rows = [by_case[index] for index in shared]
+        baseline_only, variant_only, accuracy_p = mcnemar_test([row["correct"] for row in base_rows],
+                                                               [row["correct"] for row in rows])
+        cost_change, cost_p = paired_permutation_test([row["cost"] for row in base_rows], [row["cost"] for row in rows],
+                                                      permutations)
+        latency_change, latency_p = paired_permutation_test([row["latency"] for row in base_rows],
+                                                            [row["latency"] for row in rows], permutations)
+        comparisons[name] = {
+            "cases": len(shared),
+            "baseline_only_correct": baseline_only,
+            "variant_only_correct": variant_only,
+            "accuracy_change": (variant_only - baseline_only) / len(shared) if shared else 0.0,
+            "accuracy_p": accuracy_p,
+            "cost_change_per_case": cost_change,
+            "cost_p": cost_p,
+            "latency_change": latency_change,
+            "latency_p": latency_p,
+        }
+    return comparisons
+
+
+def print_report(summary, comparisons, baseline="baseline"):
+    print(f"\n{'variant':20} {'cases':>6} {'acc':>6} {'FP':>4} {'FN':>4} {'tok/case':>9} {'cost $':>9} "
+          f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'calls':>6}")
+    for name, entry in summary.items():
+        latency = entry["latency"]
+        print(f"{name:20} {entry['cases']:>6} {entry['accuracy']:>6.1%} {entry['false_positives']:>4} "
+              f"{entry['false_negatives']:>4} {entry['tokens_per_case']:>9.0f} {entry['cost']:>9.4f} "
+              f"{latency['p50']:>7.2f} {latency['p95']:>7.2f} {latency['p99']:>7.2f} {entry['api_calls']:>6}")
+
+    print(f"\nAgainst {baseline} (McNemar exact on accuracy, paired permutation on cost and latency):")
+    for name, entry in comparisons.items():
+        marks = {key: "*" if entry[f"{key}_p"] < SIGNIFICANCE else "" for key in ("accuracy", "cost", "latency")}
+        print(f"  {name:20} accuracy {entry['accuracy_change']:+6.1%} (p={entry['accuracy_p']:.3f}{marks['accuracy']}, "
+              f"{entry['variant_only_correct']} won / {entry['baseline_only_correct']} lost) | "
+              f"cost {entry['cost_change_per_case'] * 1000:+.2f} $/1k cases (p={entry['cost_p']:.3f}{marks['cost']}) | "
+              f"latency {entry['latency_change'] * 1000:+.0f} ms (p={entry['latency_p']:.3f}{marks['latency']})")
+    print(f"  * significant at p < {SIGNIFICANCE}")
+
+
+def ab_test_moderator(offline=False):
+    """An uncached moderator for the A/B test: OfflineBackend (no API key, no cost) when offline, otherwise MODERATION_BACKEND"""
+    import contextlib
+    import io
+    from hinge_moderation_v2 import HingeAIModerator
+    from llm_backend import OfflineBackend
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend = OfflineBackend(latency=0.8, time_scale=0.02, score_noise=0.15) if offline else None
+        moderator = HingeAIModerator(use_cache=False, backend=backend)
+    if offline:
+        moderator.client.limiter = None  # nothing is sent anywhere, so there's no quota to respect
+    return moderator
+
+
+def main():
+    """A/B test the default prompt variants (OfflineBackend with --offline, otherwise MODERATION_BACKEND)"""
+    parser = argparse.ArgumentParser(description="Prompt variant A/B test")
+    parser.add_argument("--cases", default="evaluation_dataset.json",
+                        help="evaluation_dataset.json or an exported langfuse_evaluation_dataset.json")
+    parser.add_argument("--cache", help="response cache ('' to disable; default ab_test_cache.db, or "
+                                        "ab_test_cache_offline.db with --offline so offline answers never replay as real ones)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--offline", action="store_true", help="use the offline backend (no API key, no cost)")
+    parser.add_argument("--repeat", type=int, default=1, help="replicate the cases (offline sizing runs)")
+    args = parser.parse_args()
+
+    cases = load_cases(args.cases) * args.repeat
+    if args.repeat > 1:
+        cases = [dict(case, content=f"{case['content']} ({index})") for index, case in enumerate(cases)]
+    moderator = ab_test_moderator(offline=args.offline)
+    if args.cache is None:
+        args.cache = "ab_test_cache_offline.db" if args.offline else "ab_test_cache.db"
+    cache = open_cache(args.cache) if args.cache else None
+
+    variants = default_variants()
+    print("=" * 60)
+    print(f"PROMPT A/B TEST ({len(cases)} cases x {len(variants)} variants from {args.cases})")
+    print("=" * 60)
+    start = time.perf_counter()
+    results = run_ab_test(moderator, variants, cases, cache=cache, workers=args.workers)
+    seconds = time.perf_counter() - start
+    summary = summarize(results)
+    print_report(summary, compare(results))
+    fresh = [row for by_case in results.values() for row in by_case.values() if not row["cached"]]
+    answered = sum(entry["cases"] for entry in summary.values())
+    print(f"\n{len(fresh)} API calls (${sum(row['cost'] for row in fresh):.4f} spent), "
+          f"{answered - len(fresh)} answers from the cache, {seconds:.1f}s")
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Resilient Client - Rate limiting, retries and a circuit breaker around the OpenAI client
+A token bucket keeps us inside the account's RPM/TPM quota, retryable errors (429, 5xx,
+timeouts, dropped connections) are retried with jittered exponential backoff, and a
+circuit breaker fails fast during an outage. Callers see ProviderUnavailableError as its
+own outcome instead of a fallback verdict.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import openai
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+THROTTLED_STATUS_CODE = 429  # retried, but never counted against the breaker - quota isn't an outage
+DEFAULT_COMPLETION_TOKENS = 600  # reserved per request until the real usage is known
+
+
+class ProviderUnavailableError(Exception):
+    """The model provider is down, overloaded or rate limiting us beyond our retry budget"""
+
+
+def is_retryable(error):
+    """True for errors that are worth retrying: timeouts, dropped connections, 408/409/429 and 5xx"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES or (status_code is not None and status_code >= 500)
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, if it sent a Retry-After header"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate_per_minute, holding at most capacity tokens"""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, amount):
+        """Take amount tokens if available; otherwise return the seconds to wait before retrying"""
+        amount = min(amount, self.capacity)  # a request bigger than the bucket still has to go through
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def adjust(self, delta):
+        """Charge (positive) or refund (negative) tokens once the real cost is known"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets sized to the account quota"""
+
+    def __init__(self, rpm, tpm, burst_seconds=10):
+        # A full minute of burst would let a cold start blow through the provider's own limiter
+        self.requests = TokenBucket(rpm, max(1, rpm * burst_seconds / 60)) if rpm else None
+        self.tokens = TokenBucket(tpm, max(1, tpm * burst_seconds / 60)) if tpm else None
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()  # guards waited_seconds, which every caller adds to
+
+    @staticmethod
+    def estimate_tokens(request):
+        """Rough prompt size (4 characters per token) plus the expected completion"""
+        prompt_characters = len(json.dumps(request.get("messages", []), ensure_ascii=False))
+        return prompt_characters // 4 + request.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+    def _wait_time(self, estimate):
+        if self.requests is not None:
+            wait = self.requests.try_take(1)
+            if wait:
+                return wait
+        if self.tokens is not None:
+            wait = self.tokens.try_take(estimate)
+            if wait:
+                if self.requests is not None:
+                    self.requests.adjust(-1)  # give the request slot back while we wait
+                return wait
+        return 0.0
+
+    def _record_wait(self, wait):
+        with self._lock:
+            self.waited_seconds += wait
+
+    def acquire(self, request):
+        """Block until the request fits in the quota; returns the token estimate that was charged"""
+        estimate = self.estimate_tokens(request)
+        while True:
+            wait = self._wait_time(estimate)
+            if not wait:
+                return estimate
+            self._record_wait(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, request):
+        """Async version of acquire"""
+        estimate = self.estimate_tokens(request)
+        while True:
+            wait = self._wait_time(estimate)
+            if not wait:
+                return estimate
+            self._record_wait(wait)
+            await asyncio.sleep(wait)
+
+    def settle(self, estimate, response):
+        """Correct the token bucket with the real usage once the response arrives"""
+        usage = getattr(response, "usage", None)
+        if self.tokens is not None and usage is not None and getattr(usage, "total_tokens", None):
+            self.tokens.adjust(usage.total_tokens - estimate)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failed requests; lets one trial call through after reset_timeout
+
+    A request counts once, when it gives up (or when it is the trial and its call fails). Calls that
+    started before the breaker opened can't close it by succeeding late - only a half-open success can.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trials = itertools.count(1)
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise ProviderUnavailableError instead of calling a provider that is known to be down
+
+        Returns a trial id when this caller is the half-open probe (hand it to release_trial), otherwise None.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return None
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True  # this caller probes the provider; everyone else fails fast
+                self._trial = next(self._trials)
+                return self._trial
+            raise ProviderUnavailableError("circuit breaker is open - the model provider is failing")
+
+    def release_trial(self, trial):
+        """Free the probe slot if this trial never reported back (cancelled, or an error that says nothing about the provider)"""
+        if trial is None:
+            return
+        with self._lock:
+            if self._trial_in_flight and self._trial == trial:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "open":
+                return  # a call from before the trip - says nothing about the provider now
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == "open":
+                return  # already open; late failures mustn't push the reset further out
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit breaker opened after {self._failures} consecutive failed requests")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class ResilientClient:
+    """Wraps an OpenAI client; exposes the same chat.completions.create with limits, retries and the breaker
+
+    Construct the wrapped client with max_retries=0 so retries only happen here.
+    Sync and async wrappers can share one limiter and breaker, since the quota is per account.
+    """
+
+    def __init__(self, client, limiter=None, breaker=None, max_retries=4, base_delay=0.5, max_delay=20.0):
+        self._client = client
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "fast_failures": 0}
+        self._stats_lock = threading.Lock()  # one wrapper is shared by every worker thread
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _backoff(self, attempt, error):
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        return min(self.max_delay, max(delay, retry_after)) if retry_after else delay
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _before_attempt(self):
+        """The breaker's trial id when this attempt is the half-open probe, otherwise None"""
+        try:
+            return self.breaker.before_call()
+        except ProviderUnavailableError:
+            self._count("fast_failures")
+            raise
+
+    def _after_failure(self, attempt, error, trial):
+        """Record a failed attempt; returns the delay before the next one or raises if we're out of retries"""
+        if not is_retryable(error):
+            raise error  # bad requests, auth errors etc. aren't outages - the breaker only gets its trial slot back
+        self._count("failures")
+        throttled = getattr(error, "status_code", None) == THROTTLED_STATUS_CODE
+        # One breaker failure per request: when it gives up, or at once if it was the half-open probe
+        if not throttled and (trial is not None or attempt == self.max_retries):
+            self.breaker.record_failure()
+        if attempt == self.max_retries:
+            raise ProviderUnavailableError(f"gave up after {attempt + 1} attempts: {type(error).__name__}: {error}") from error
+        self._count("retries")
+        return self._backoff(attempt, error)
+
+    def _create(self, **request):
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            trial = self._before_attempt()
+            try:
+                estimate = self.limiter.acquire(request) if self.limiter else 0
+                try:
+                    response = self._client.chat.completions.create(**request)
+                except Exception as e:
+                    delay = self._after_failure(attempt, e, trial)
+                else:
+                    self.breaker.record_success()
+                    if self.limiter:
+                        self.limiter.settle(estimate, response)
+                    return response
+            finally:
+                self.breaker.release_trial(trial)  # no-op once the attempt recorded a success or failure
+            time.sleep(delay)
+
+
+class AsyncResilientClient(ResilientClient):
+    """Async counterpart of ResilientClient for openai.AsyncOpenAI"""
+
+    async def _create(self, **request):
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            trial = self._before_attempt()
+            try:
+                estimate = await self.limiter.acquire_async(request) if self.limiter else 0
+                try:
+                    response = await self._client.chat.completions.create(**request)
+                except Exception as e:
+                    delay = self._after_failure(attempt, e, trial)
+                else:
+                    self.breaker.record_success()
+                    if self.limiter:
+                        self.limiter.settle(estimate, response)
+                    return response
+            finally:
+                self.breaker.release_trial(trial)  # also when the task is cancelled mid-call
+            await asyncio.sleep(delay)
+
+
+def limiter_from_env():
+    """RateLimiter sized from OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT (0 disables a limit)"""
+    return RateLimiter(rpm=int(os.getenv("OPENAI_RPM_LIMIT", "500")), tpm=int(os.getenv("OPENAI_TPM_LIMIT", "300000")))
+
+
+def main():
+    """Exercise retries, the rate limiter and the circuit breaker against the fake server"""
+    from fake_openai_server import start_fake_server
+
+    server, base_url = start_fake_server(latency=0.1, error_rate=0.3)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    from hinge_moderation_v2 import HingeAIModerator
+
+    moderator = HingeAIModerator(use_cache=False, near_duplicate_threshold=None)
+    moderator.client.base_delay = 0.05
+    contents = ["Want to grab coffee this weekend?"] * 30
+
+    print("=" * 60)
+    print("RESILIENT CLIENT (fake server)")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    records = moderator.moderate_batch(contents, max_concurrency=6)
+    outcomes = [record["source"] for record in records]
+    print(f"30% injected 429s: {outcomes.count('llm')}/{len(contents)} succeeded, "
+          f"{outcomes.count('provider_unavailable')} provider unavailable, "
+          f"{moderator.async_client.stats['retries']} retries, {time.perf_counter() - start:.1f}s")
+
+    server.error_rate = 0.0
+    limited = ResilientClient(moderator.client._client, limiter=RateLimiter(rpm=600, tpm=0, burst_seconds=1))
+    start = time.perf_counter()
+    for content in contents:
+        limited.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": f"Content to analyze: {content}"}])
+    print(f"600 RPM limiter, 10-request burst: {len(contents)} sequential calls in {time.perf_counter() - start:.1f}s "
+          f"({limited.limiter.waited_seconds:.1f}s spent waiting for quota)")
+
+    # Full outage: the breaker opens and later calls fail fast instead of waiting out every retry
+    server.error_rate, server.error_status = 1.0, 503
+    moderator.client.breaker.reset_timeout = 1.0
+    latencies = []
+    for content in contents[:10]:
+        record = moderator.moderate_content_detailed(content)
+        latencies.append((record["source"], record["latency"]))
+    print(f"Outage (all 503s): breaker {moderator.client.breaker.state}; first call {latencies[0][1]:.2f}s, "
+          f"later calls {max(latency for _, latency in latencies[-5:]) * 1000:.1f} ms; outcomes: "
+          f"{sorted({source for source, _ in latencies})}")
+
+    server.error_rate = 0.0
+    time.sleep(1.1)
+    record = moderator.moderate_content_detailed(contents[0])
+    print(f"After recovery: {record['source']}, breaker {moderator.client.breaker.state}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Trace Analytics - Tag, score, cost and latency aggregates as SQL over the local trace store
+The analyzers used to load every trace into Python and group them with loops. These run
+against the indexed tables in TraceStore instead (tags, scores, timestamp), so the same
+questions stay interactive at millions of traces. Every function takes optional
+since/until timestamps (ISO 8601, like Langfuse returns) to look at a window.
+"""
+import argparse
+import json
+import os
+import time
+
+# Tag prefixes the reviewers use; GLOB keeps the prefix match on the (tag, trace_id) index
+FALSE_POSITIVE_TAGS = "fp_*"
+FALSE_NEGATIVE_TAGS = "fn_*"
+EVALUATION_CATEGORIES = [  # first match wins, in this order - same as the old per-trace loop
+    ("false_positives", "fp_*"),
+    ("true_positives", "accurate_violation*"),
+    ("accurate_cases", "accurate_appropriate*"),
+    ("borderline_cases", "accurate_borderline*"),
+]
+
+
+def _window(since=None, until=None, column="timestamp"):
+    """SQL condition and parameters for an optional [since, until) timestamp window"""
+    conditions, params = [], []
+    if since:
+        conditions.append(f"{column} >= ?")
+        params.append(since)
+    if until:
+        conditions.append(f"{column} < ?")
+        params.append(until)
+    return " AND ".join(conditions) or "1", params
+
+
+def trace_count(store, since=None, until=None):
+    where, params = _window(since, until)
+    return store.query(f"SELECT COUNT(*) FROM traces WHERE {where}", params).fetchone()[0]
+
+
+def tag_distribution(store, since=None, until=None):
+    """[(tag, traces)] most common first"""
+    where, params = _window(since, until)
+    return store.query(f"SELECT tag, COUNT(*) AS n FROM trace_tags WHERE {where} GROUP BY tag ORDER BY n DESC, tag",
+                       params).fetchall()
+
+
+def _tagged_count(store, pattern, since=None, until=None):
+    """Distinct traces with at least one tag matching the GLOB pattern"""
+    where, params = _window(since, until)
+    return store.query(f"SELECT COUNT(DISTINCT trace_id) FROM trace_tags WHERE tag GLOB ? AND {where}",
+                       [pattern] + params).fetchone()[0]
+
+
+def error_rates(store, since=None, until=None):
+    """False positive / false negative trace counts and their share of all traces in the window"""
+    total = trace_count(store, since, until)
+    false_positives = _tagged_count(store, FALSE_POSITIVE_TAGS, since, until)
+    false_negatives = _tagged_count(store, FALSE_NEGATIVE_TAGS, since, until)
+    return {
+        "total": total,
+        "false_positives": false_positives,
+        "false_negatives": false_negatives,
+        "fp_rate": false_positives / total if total else 0.0,
+        "fn_rate": false_negatives / total if total else 0.0,
+    }
+
+
+def cost_latency_by_tag(store, pattern="*", since=None, until=None):
+    """Per tag matching the GLOB pattern: trace count, total/average cost and average/max latency (seconds)"""
+    where, params = _window(since, until)
+    rows = store.query(f"SELECT tag, COUNT(*) AS n, SUM(total_cost), AVG(total_cost), AVG(latency), MAX(latency) "
+                       f"FROM trace_tags WHERE tag GLOB ? AND {where} GROUP BY tag ORDER BY n DESC, tag",
+                       [pattern] + params)
+    return [{"tag": tag, "count": count, "total_cost": total_cost or 0.0, "avg_cost": avg_cost or 0.0,
+             "avg_latency": avg_latency or 0.0, "max_latency": max_latency or 0.0}
+            for tag, count, total_cost, avg_cost, avg_latency, max_latency in rows]
+
+
+def score_summary(store, since=None, until=None):
+    """Per score name: how many, and the average / min / max value"""
+    where, params = _window(since, until)
+    rows = store.query(f"SELECT name, COUNT(value), AVG(value), MIN(value), MAX(value) FROM trace_scores "
+                       f"WHERE {where} GROUP BY name ORDER BY name", params)
+    return [{"name": name, "count": count, "avg": avg, "min": low, "max": high}
+            for name, count, avg, low, high in rows]
+
+
+def scored_trace_count(store, since=None, until=None):
+    where, params = _window(since, until)
+    return store.query(f"SELECT COUNT(DISTINCT trace_id) FROM trace_scores WHERE {where}", params).fetchone()[0]
+
+
+def tag_examples(store, tag, limit=2, since=None, until=None):
+    """The newest traces with a tag, as dicts in Langfuse's JSON shape"""
+    where, params = _window(since, until, column="g.timestamp")
+    rows = store.query(f"SELECT t.data FROM trace_tags g JOIN traces t ON t.id = g.trace_id "
+                       f"WHERE g.tag = ? AND {where} ORDER BY g.timestamp DESC LIMIT ?", [tag] + params + [limit])
+    return [json.loads(data) for (data,) in rows]
+
+
+def export_evaluation_dataset(store, path="langfuse_evaluation_dataset.json", since=None, until=None):
+    """Write tagged traces grouped by evaluation category, streaming rows to disk; returns counts per category"""
+    where, params = _window(since, until, column="g.timestamp")
+    category_case = " ".join(f"WHEN g.tag GLOB '{pattern}' THEN {index}"
+                             for index, (_, pattern) in enumerate(EVALUATION_CATEGORIES))
+    rows = store.query(
+        f"SELECT MIN(CASE {category_case} END) AS category, t.data FROM trace_tags g JOIN traces t ON t.id = g.trace_id "
+        f"WHERE {where} GROUP BY g.trace_id HAVING category IS NOT NULL ORDER BY category, g.timestamp", params)
+
+    counts = {name: 0 for name, _ in EVALUATION_CATEGORIES}
+    rows = iter(rows)
+    pending = next(rows, None)
+    with open(path, "w") as file:
+        file.write("{")
+        for index, (name, _) in enumerate(EVALUATION_CATEGORIES):
+            file.write(f'\n  "{name}": [')
+            separator = "\n    "
+            while pending is not None and pending[0] == index:
+                trace = json.loads(pending[1])
+                trace_data = {"trace_id": trace["id"], "input": trace.get("input"), "output": trace.get("output"),
+                              "tags": trace.get("tags") or [], "timestamp": trace["timestamp"],
+                              "cost": trace.get("totalCost", 0)}
+                file.write(separator + json.dumps(trace_data))
+                separator = ",\n    "
+                counts[name] += 1
+                pending = next(rows, None)
+            file.write("\n  ]" + ("," if index < len(EVALUATION_CATEGORIES) - 1 else ""))
+        file.write("\n}\n")
+    return counts
+
+
+def _python_aggregates(store):
+    """What the analyzers did before: load every trace and loop over it"""
+    from collections import Counter, defaultdict
+
+    traces = store.load_traces()
+    tag_counts = Counter(tag for trace in traces for tag in trace.tags or [])
+    false_positives = sum(1 for trace in traces if any(tag.startswith("fp_") for tag in trace.tags or []))
+    costs = defaultdict(float)
+    for trace in traces:
+        for tag in trace.tags or []:
+            costs[tag] += trace.total_cost or 0
+    return tag_counts, false_positives, costs
+
+
+def build_benchmark_store(store, count, pool_size=20_000, chunk_size=10_000):
+    """Fill a store with count synthetic traces (a pool of distinct ones, re-stamped with new ids and times)"""
+    from datetime import datetime, timedelta, timezone
+    from fake_langfuse_server import synthetic_traces
+    from langfuse_sync import format_timestamp
+
+    pool = synthetic_traces(min(count, pool_size))
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    existing = store.count()
+    for offset in range(existing, count, chunk_size):
+        chunk = []
+        for index in range(offset, min(offset + chunk_size, count)):
+            trace = dict(pool[index % len(pool)])
+            trace["id"] = f"trace-{index:016x}"
+            trace["timestamp"] = format_timestamp(start + timedelta(seconds=3 * index))
+            chunk.append(trace)
+        store.upsert(chunk)
+
+
+def main():
+    """Time the analytics queries against the old load-and-loop approach as the store grows"""
+    import tempfile
+    from langfuse_sync import TraceStore
+
+    parser = argparse.ArgumentParser(description="Trace analytics query benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="store sizes to time")
+    parser.add_argument("--python-limit", type=int, default=200_000,
+                        help="largest size to also time the load-everything Python loop at")
+    args = parser.parse_args()
+
+    def timed(function, *function_args, **kwargs):
+        start = time.perf_counter()
+        result = function(*function_args, **kwargs)
+        return result, (time.perf_counter() - start) * 1e3
+
+    print("=" * 60)
+    print("TRACE ANALYTICS (SQLite store, synthetic traces)")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as directory:
+        store = TraceStore(os.path.join(directory, "traces.db"))
+        for size in sorted(args.sizes):
+            _, build_ms = timed(build_benchmark_store, store, size)
+            print(f"\n{size:,} traces (loaded in {build_ms / 1e3:.1f}s, "
+                  f"{os.path.getsize(os.path.join(directory, 'traces.db')) / 2**20:.0f} MiB)")
+            # Window: the most recent tenth of the store
+            newest = store.query("SELECT MAX(timestamp) FROM traces").fetchone()[0]
+            since = store.query("SELECT timestamp FROM traces ORDER BY timestamp DESC LIMIT 1 OFFSET ?",
+                                (size // 10,)).fetchone()[0]
+            queries = [
+                ("tag_distribution", tag_distribution, {}),
+                ("tag_distribution (last 10%)", tag_distribution, {"since": since}),
+                ("error_rates", error_rates, {}),
+                ("error_rates (last 10%)", error_rates, {"since": since}),
+                ("cost_latency_by_tag", cost_latency_by_tag, {}),
+                ("cost_latency_by_tag fp_*", cost_latency_by_tag, {"pattern": FALSE_POSITIVE_TAGS}),
+                ("score_summary", score_summary, {}),
+                ("tag_examples", tag_examples, {"tag": "fp_severity_inflation"}),
+            ]
+            for name, function, kwargs in queries:
+                _, query_ms = timed(function, store, **kwargs)
+                print(f"  {name:30} {query_ms:9.1f} ms")
+            rates = error_rates(store)
+            print(f"  -> FP rate {rates['fp_rate']:.1%}, FN rate {rates['fn_rate']:.1%}, newest {newest}")
+            counts, export_ms = timed(export_evaluation_dataset, store, os.path.join(directory, "export.json"))
+            print(f"  {'export_evaluation_dataset':30} {export_ms:9.1f} ms ({sum(counts.values()):,} traces)")
+            if size <= args.python_limit:
+                _, python_ms = timed(_python_aggregates, store)
+                print(f"  {'load + Python loops (before)':30} {python_ms:9.1f} ms")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
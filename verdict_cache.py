@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Verdict Cache - Two-tier cache for moderation verdicts
+In-process LRU (with TTL) in front of a persistent SQLite tier, so identical messages
+("hey", copy-pasted scam templates, re-uploaded photos) don't trigger a fresh API call.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_content(content):
+    """Normalize text so trivially different copies share a cache entry"""
+    content = unicodedata.normalize("NFKC", content).casefold()
+    return " ".join(content.split())
+
+
+def prompt_version(prompt_template):
+    """Short hash of a prompt template - any prompt edit produces a new version"""
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:12]
+
+
+class VerdictCache:
+    """LRU + TTL memory tier backed by SQLite, with hit/miss/eviction counters"""
+
+    def __init__(self, db_path="verdict_cache.db", max_entries=10_000, ttl_seconds=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (expires_at, verdict), oldest first
+        self._lock = threading.Lock()  # shared by concurrent workers / Streamlit sessions
+        self.stats = {
+            "memory_hits": 0,
+            "sqlite_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "writes": 0,
+        }
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "key TEXT PRIMARY KEY, verdict TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(content, route, prompt_version, model):
+        """Cache key: normalized content hash + route + prompt template version + model"""
+        if isinstance(content, bytes):
+            content_hash = hashlib.sha256(content).hexdigest()  # images are hashed byte-for-byte
+        else:
+            content_hash = hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+        return f"{route}:{prompt_version}:{model}:{content_hash}"
+
+    def get(self, key):
+        """Return the cached verdict for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+                self.stats["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute("SELECT verdict, expires_at FROM verdicts WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    verdict, expires_at = row
+                    if expires_at > now:
+                        self._remember(key, expires_at, verdict)
+                        self.stats["sqlite_hits"] += 1
+                        return verdict
+                    self._db.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.stats["expirations"] += 1
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, verdict):
+        """Store a verdict in both tiers"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, verdict)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verdicts (key, verdict, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, verdict, now, expires_at),
+                )
+                self._db.commit()
+            self.stats["writes"] += 1
+
+    def _remember(self, key, expires_at, verdict):
+        """Insert into the memory tier, evicting the least recently used entries (lock held)"""
+        self._memory[key] = (expires_at, verdict)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def summary(self):
+        """Counters plus hit rate - every hit is one API call we didn't pay for"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["sqlite_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["api_calls_saved"] = hits
+        return stats
+
+    def close(self):
+        """Close the SQLite connection"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
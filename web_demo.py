@@ -1,86 +1,30 @@
+import atexit
+import time
 import streamlit as st
 from hinge_moderation_v2 import HingeAIModerator
-
-def extract_user_view(full_response):
-    """Extract and format the USER VIEW section from the AI response"""
-    try:
-        if "USER VIEW" in full_response:
-            # Find the USER VIEW section
-            user_start = full_response.find("USER VIEW")
-            user_section = full_response[user_start:]
-
-            # Remove the header and any parenthetical text
-            user_section = user_section.replace("USER VIEW (for display to content creator):", "")
-            user_section = user_section.replace("USER VIEW", "", 1)
-            user_section = user_section.strip()
-
-            # Remove leading colon if present
-            if user_section.startswith(":"):
-                user_section = user_section[1:].strip()
-        else:
-            # Fallback: look for the standard format at the end
-            lines = full_response.strip().split('\n')
-            user_lines = []
-            collecting = False
-
-            for line in lines:
-                line = line.strip()
-                if line.startswith('Score:'):
-                    collecting = True
-                if collecting and line:
-                    user_lines.append(line)
-
-            if user_lines:
-                user_section = '\n'.join(user_lines)
-            else:
-                return "Unable to extract user view from response"
-
-        # Parse the components
-        lines = [line.strip() for line in user_section.split('\n') if line.strip()]
-
-        score = ""
-        analysis = ""
-        policy_ref = ""
-        action = ""
-
-        # Extract each component
-        for line in lines:
-            line = line.strip()  # Extra strip to be sure
-            if line.startswith('Score:'):
-                score = line[6:].strip()
-                # Remove /10 suffix if present (but not individual digits)
-                if score.endswith('/10'):
-                    score = score[:-3].strip()
-            elif line.startswith('Analysis:'):
-                analysis = line[9:].strip()
-            elif line.startswith('Policy Reference:'):
-                policy_ref = line[17:].strip()
-            elif line.startswith('Action:') or line.startswith('**Action:'):
-                if line.startswith('**Action:'):
-                    action = line[9:].replace('**', '').strip()
-                else:
-                    action = line[7:].strip()
-
-        # Format the output consistently
-        formatted_output = f"**Score: {score}**\n\n"
-
-        if analysis:
-            formatted_output += f"**Analysis:**\n{analysis}\n\n"
-
-        if policy_ref:
-            formatted_output += f"**Policy Reference:**\n{policy_ref}\n\n"
-
-        if action:
-            formatted_output += f"**Action:**\n{action}"
-
-        return formatted_output.strip()
-
-    except Exception:
-        # If parsing fails completely, return raw USER VIEW section
-        if "USER VIEW" in full_response:
-            user_start = full_response.find("USER VIEW")
-            return full_response[user_start:].strip()
-        return "Unable to extract user view from response"
+from moderation_result import extract_user_view, UNABLE_TO_EXTRACT
+
+@st.cache_resource
+def get_moderator():
+    """One moderator per server process, shared by every session and rerun.
+
+    Building it loads .env, reads both policy files and opens the OpenAI connection pool,
+    so doing that once keeps connections warm instead of reconnecting on every click.
+    MODERATION_BACKEND=offline runs the demo without an API key. The violation history
+    gets its final snapshot when the server process exits.
+    """
+    moderator = HingeAIModerator()
+    atexit.register(moderator.close)
+    return moderator
+
+def run_analysis(moderator, content, uploaded_image):
+    """Moderate the text or image and time the request"""
+    start = time.perf_counter()
+    if uploaded_image:
+        result = moderator.moderate_image(uploaded_image)
+    else:
+        result = moderator.moderate_content(content)
+    return result, time.perf_counter() - start
 
 st.title("🔍 AI Content Moderator")
 st.markdown("**Dating app moderation that understands context**")
@@ -127,15 +71,15 @@ analyze_button = st.button("🔍 Analyze Content", type="primary", use_container
 if analyze_button:
     if content or uploaded_image:
         with st.spinner("🤖 Analyzing content..."):
-            moderator = HingeAIModerator()
-
-            if uploaded_image:
-                result = moderator.moderate_image(uploaded_image)
-            else:
-                result = moderator.moderate_content(content)
+            try:
+                result, latency = run_analysis(get_moderator(), content, uploaded_image)
+            except Exception as e:
+                st.error(f"❌ Analysis failed: {type(e).__name__}: {e}")
+                st.stop()
 
         # Success message
         st.success("✅ Analysis complete!")
+        st.caption(f"⏱️ Analyzed in {latency:.2f}s")
 
         if demo_mode:
             # Demo mode with expandable sections (only show for detailed responses)
@@ -175,7 +119,7 @@ if analyze_button:
         user_view = extract_user_view(result)
 
         # Fallback if extraction fails - show raw response for debugging
-        if user_view == "Unable to extract user view from response":
+        if user_view == UNABLE_TO_EXTRACT:
             st.error("Unable to parse results properly")
             with st.expander("🔧 Debug Info"):
                 st.text(result[:500])  # Show first 500 chars for debugging